@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger("MemberCheckBot")
+
+
+class TokenBucket:
+    """Simple token bucket shared by every lane to stay under the global request rate"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Lane:
+    """One class of Discord action (DMs, channel posts, kicks) with its own concurrency and pause state"""
+
+    def __init__(self, name, concurrency):
+        self.name = name
+        self.concurrency = concurrency
+        self.paused_until = 0.0
+        self.completed = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.waiting = 0
+        self.in_flight = 0
+        self.first_started = None
+        self._semaphore = None
+
+    def throughput(self):
+        """Completed actions per second since the lane first ran"""
+        if not self.first_started or not self.completed:
+            return 0.0
+        return self.completed / max(time.monotonic() - self.first_started, 1e-6)
+
+
+class ActionExecutor:
+    """Runs Discord actions in separate lanes with bounded concurrency and central 429 handling"""
+
+    def __init__(self, lanes, global_rate=40, max_retries=3):
+        # lanes maps lane name -> maximum concurrent actions in that lane
+        self.lanes = {name: Lane(name, concurrency) for name, concurrency in lanes.items()}
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(global_rate)
+
+    async def run(self, lane_name, action):
+        """Run action() (a coroutine factory) in a lane, retrying after rate limits"""
+        lane = self.lanes[lane_name]
+        if lane._semaphore is None:
+            lane._semaphore = asyncio.Semaphore(lane.concurrency)
+
+        lane.waiting += 1
+        try:
+            await lane._semaphore.acquire()
+        finally:
+            lane.waiting -= 1
+
+        lane.in_flight += 1
+        try:
+            return await self._attempt(lane, action)
+        finally:
+            lane.in_flight -= 1
+            lane._semaphore.release()
+
+    async def _attempt(self, lane, action):
+        if lane.first_started is None:
+            lane.first_started = time.monotonic()
+
+        attempt = 0
+        while True:
+            # Honour a pause set by any earlier 429 in this lane
+            delay = lane.paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._bucket.acquire()
+
+            try:
+                result = await action()
+            except Exception as e:
+                retry_after = _retry_after(e)
+                if retry_after is None or attempt >= self.max_retries:
+                    lane.failed += 1
+                    raise
+                attempt += 1
+                lane.rate_limited += 1
+                lane.paused_until = max(lane.paused_until, time.monotonic() + retry_after)
+                logger.warning(f"Rate limited in {lane.name} lane, pausing for {retry_after:.1f}s (attempt {attempt})")
+                continue
+
+            lane.completed += 1
+            return result
+
+    async def run_all(self, items, func, limit=100):
+        """Await func(item) for every item with at most limit running at once"""
+        iterator = iter(items)
+
+        async def worker():
+            for item in iterator:
+                try:
+                    await func(item)
+                except Exception as e:
+                    logger.error(f"Action for {item} failed: {e}")
+
+        await asyncio.gather(*(worker() for _ in range(limit)))
+
+    def summary(self):
+        """Return a one-line throughput report for every lane"""
+        return ", ".join(
+            f"{lane.name}: {lane.completed} done ({lane.throughput():.1f}/s), {lane.failed} failed, "
+            f"{lane.rate_limited} rate limited, {lane.in_flight} in flight, {lane.waiting} waiting"
+            for lane in self.lanes.values()
+        )
+
+
+def _retry_after(error):
+    # discord.RateLimited carries retry_after; an HTTPException with status 429 may not
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        return float(retry_after)
+    if getattr(error, "status", None) == 429:
+        return 1.0
+    return None
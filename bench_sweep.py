@@ -0,0 +1,292 @@
+"""
+Offline benchmark for the member sweep, run against fake guilds instead of a live Discord connection
+
+Usage: python bench_sweep.py [--scenario NAME ...] [--latency SECONDS] [--rate-limit-every N]
+                             [--no-tracemalloc] [--output bench_output.txt]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+
+SERVER_A_ID = 1000
+SERVER_B_ID = 2000
+ROLE_X_ID = 3000
+EXEMPT_ROLE_ID = 4000
+WARNING_CHANNEL_ID = 5000
+LOG_CHANNEL_ID = 6000
+
+# member_check reads its configuration from the environment at import time
+os.environ.update({
+    "SERVER_A_ID": str(SERVER_A_ID),
+    "SERVER_B_ID": str(SERVER_B_ID),
+    "ROLE_X_ID": str(ROLE_X_ID),
+    "EXEMPT_ROLES": str(EXEMPT_ROLE_ID),
+    "WARNING_CHANNEL_ID": str(WARNING_CHANNEL_ID),
+    "LOG_CHANNEL_ID": str(LOG_CHANNEL_ID),
+    "MOD_ROLE_IDS": "",
+    "ENABLE_SHEET_LOGGING": "false",
+})
+
+# Configure logging before member_check does, so the benchmark does not write bot.log
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+import member_check
+from deadline_scheduler import DeadlineScheduler
+from action_executor import ActionExecutor
+from compact_index import CompactMemberIndex
+from dm_outbox import DMOutbox
+from fake_discord import FakeChannel, FakeClient, FakeGuild, FakeHTTP
+from guild_config import ReferenceGuild, TargetConfig
+from incremental_sweep import SweepCursor
+from metrics import LoopLagMonitor
+from policy import Requirement, Rule
+from reference_index import ReferenceIndex
+from warning_store import WarningStore
+
+
+class Scenario:
+    """One benchmark configuration"""
+
+    def __init__(self, name, members, criteria, warn_rate=0.01, mode="sweep", targets=1, slim=False, rules=False):
+        self.name = name
+        # Members per target server
+        self.members = members
+        # Number of target servers sharing the one reference server
+        self.targets = targets
+        self.criteria = criteria
+        # Fraction of server B members failing the criteria
+        self.warn_rate = warn_rate
+        # "sweep" runs check_members_task, "cold-checks" runs check_single_member per member with a cold index,
+        # "incremental" runs one lap of SWEEP_MODE=incremental slices back to back (without the pacing delays)
+        self.mode = mode
+        # Run with SLIM_CACHE: compact indexes and no discord.py member cache
+        self.slim = slim
+        # Enforce several compiled rules (see bench_rules) instead of the criteria alone
+        self.rules = rules
+
+
+SCENARIOS = [
+    Scenario("sweep-1k-c1", 1_000, 1),
+    Scenario("sweep-1k-c2", 1_000, 2),
+    Scenario("sweep-50k-c1", 50_000, 1),
+    Scenario("sweep-50k-c2", 50_000, 2),
+    Scenario("sweep-500k-c1", 500_000, 1),
+    Scenario("sweep-500k-c2", 500_000, 2),
+    Scenario("high-warn-50k-c2", 50_000, 2, warn_rate=0.2),
+    Scenario("cold-checks-1k-c2", 1_000, 2, mode="cold-checks"),
+    Scenario("multi-12x50k-c2", 50_000, 2, targets=12),
+    Scenario("incremental-500k-c2", 500_000, 2, mode="incremental"),
+    Scenario("slim-500k-c2", 500_000, 2, slim=True),
+    Scenario("slim-multi-12x50k-c2", 50_000, 2, targets=12, slim=True),
+    Scenario("rules-500k", 500_000, 2, rules=True),
+    Scenario("rules-incr-500k", 500_000, 2, mode="incremental", rules=True),
+]
+
+
+def bench_rules():
+    """Rules exercising any-of roles, account age and a per-rule exemption; as strict as criteria 2 for bench members"""
+    return [
+        Rule("Verified", [Requirement(SERVER_A_ID, [ROLE_X_ID, ROLE_X_ID + 1], [])], warning_seconds=3600),
+        Rule("Account age", [], min_account_age=7 * 86400, warning_seconds=600),
+        Rule("Member", [Requirement(SERVER_A_ID, [], [])], exempt_roles=[EXEMPT_ROLE_ID + 1]),
+    ]
+
+
+def build_guilds(scenario, http, rng):
+    """Create the reference server and the scenario's target servers with their membership"""
+    server_a = FakeGuild(SERVER_A_ID, http, name="Reference", role_ids=[ROLE_X_ID])
+    target_guilds = [
+        FakeGuild(SERVER_B_ID + index, http, name=f"Target {index}", role_ids=[EXEMPT_ROLE_ID],
+                  member_cache=not scenario.slim)
+        for index in range(scenario.targets)
+    ]
+
+    # Target servers draw overlapping slices of one user population
+    first_id = 10 ** 17
+    population = scenario.members + scenario.members * (scenario.targets - 1) // 2
+    for user_id in range(first_id, first_id + population):
+        if rng.random() >= scenario.warn_rate:
+            server_a.add_member(user_id, roles=[ROLE_X_ID])
+        elif scenario.criteria == 2 and rng.random() < 0.5:
+            # Fails criteria 2 by missing the role rather than the membership
+            server_a.add_member(user_id)
+
+    for index, server_b in enumerate(target_guilds):
+        start = first_id + index * (population - scenario.members) // max(scenario.targets - 1, 1)
+        for user_id in range(start, start + scenario.members):
+            exempt = rng.random() < 0.01
+            server_b.add_member(user_id, roles=[EXEMPT_ROLE_ID] if exempt else [])
+
+        # A few bots, which are never acted on
+        for user_id in range(10):
+            server_b.add_member(user_id + 100, bot=True)
+
+    return server_a, target_guilds
+
+
+async def run_scenario(scenario, args, db_dir):
+    """Run one scenario and return its measurements"""
+    rng = random.Random(scenario.name)
+    http = FakeHTTP(latency=args.latency, rate_limit_every=args.rate_limit_every)
+    server_a, target_guilds = build_guilds(scenario, http, rng)
+    FakeClient(
+        [server_a] + target_guilds,
+        [FakeChannel(target_guilds[0], WARNING_CHANNEL_ID, http), FakeChannel(server_a, LOG_CHANNEL_ID, http)]
+    ).install(member_check.bot)
+    # Channels resolved in an earlier scenario belong to that scenario's fakes
+    member_check.channel_access.invalidate()
+
+    # Fresh enforcement state for every scenario
+    member_check.targets = {
+        server_b.id: TargetConfig(
+            server_b.id,
+            [ReferenceGuild(SERVER_A_ID, ROLE_X_ID)],
+            scenario.criteria,
+            [EXEMPT_ROLE_ID],
+            WARNING_CHANNEL_ID,
+            name=server_b.name,
+            rules=bench_rules() if scenario.rules else None
+        )
+        for server_b in target_guilds
+    }
+    member_check.SLIM_CACHE = scenario.slim
+    index_class = CompactMemberIndex if scenario.slim else ReferenceIndex
+    member_check.reference_indexes = {SERVER_A_ID: index_class(SERVER_A_ID)}
+    member_check.target_indexes = {
+        server_b.id: CompactMemberIndex(server_b.id) for server_b in target_guilds
+    } if scenario.slim else {}
+    member_check.warning_store = WarningStore(os.path.join(db_dir, f"{scenario.name}.db"))
+    member_check.warning_store.load()
+    member_check.warning_scheduler = DeadlineScheduler(member_check.expire_warning)
+    member_check.action_executor = ActionExecutor(
+        {
+            "dm": member_check.ACTION_DM_CONCURRENCY,
+            "channel": member_check.ACTION_CHANNEL_CONCURRENCY,
+            "kick": member_check.ACTION_KICK_CONCURRENCY
+        },
+        global_rate=args.global_rate
+    )
+    # The module's outbox callbacks look up the bot and executor when they run, so they reach the fakes
+    member_check.dm_outbox = DMOutbox(
+        os.path.join(db_dir, f"{scenario.name}.db"),
+        member_check.dm_outbox.open_dm,
+        member_check.dm_outbox.run,
+        workers=member_check.ACTION_DM_CONCURRENCY
+    )
+    member_check.dm_outbox.load()
+
+    if scenario.mode in ("sweep", "incremental"):
+        # Steady state: the reference index was seeded at startup and kept current by events
+        await member_check.warm_reference_index(SERVER_A_ID)
+        for server_b in target_guilds:
+            if scenario.slim:
+                await member_check.warm_target_index(server_b.id)
+    http.reset()
+
+    monitor = LoopLagMonitor(interval=0.01)
+    if args.tracemalloc:
+        tracemalloc.start()
+    monitor.start()
+    member_check.dm_outbox.start()
+    started = time.perf_counter()
+
+    if scenario.mode == "sweep":
+        await member_check.check_members_task()
+    elif scenario.mode == "incremental":
+        for target in member_check.targets.values():
+            cursor = SweepCursor(target.guild_id, member_check.warning_store)
+            await member_check.sweep_next_slice(target, cursor)
+            while cursor.in_lap:
+                await member_check.sweep_next_slice(target, cursor)
+    else:
+        for server_b in target_guilds:
+            for member in server_b.members:
+                if not member.bot:
+                    await member_check.check_single_member(member)
+    await member_check.dm_outbox.drain()
+    await member_check.log_sink.flush()
+
+    elapsed = time.perf_counter() - started
+    await monitor.stop()
+    peak = 0
+    if args.tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    member_check.dm_outbox.stop()
+    member_check.dm_outbox.close()
+    member_check.warning_store.close()
+    indexes = list(member_check.reference_indexes.values()) + list(member_check.target_indexes.values())
+    rest_calls = {route: count for route, count in http.calls.items() if not route.startswith("GATEWAY")}
+    return {
+        "scenario": scenario.name,
+        "members": scenario.members * scenario.targets,
+        "wall_s": elapsed,
+        "rest_calls": sum(rest_calls.values()),
+        "rest_by_route": rest_calls,
+        "rate_limited": sum(http.rate_limited.values()),
+        "warned": member_check.warning_store.count(),
+        "peak_mem_mb": peak / 2 ** 20,
+        "index_mem_mb": sum(index.memory_bytes() for index in indexes if scenario.slim) / 2 ** 20,
+        "loop_lag_max_ms": monitor.max() * 1000,
+        "loop_lag_mean_ms": monitor.mean() * 1000,
+        "actions": member_check.action_executor.summary(),
+    }
+
+
+def format_result(result):
+    routes = ", ".join(f"{route}={count}" for route, count in sorted(result["rest_by_route"].items())) or "none"
+    return (
+        f"{result['scenario']:<20} members={result['members']:<8} wall={result['wall_s']:.3f}s "
+        f"rest={result['rest_calls']:<6} 429s={result['rate_limited']:<4} warned={result['warned']:<6} "
+        f"peak_mem={result['peak_mem_mb']:.1f}MB index_mem={result['index_mem_mb']:.1f}MB loop_lag_max={result['loop_lag_max_ms']:.1f}ms "
+        f"loop_lag_mean={result['loop_lag_mean_ms']:.2f}ms\n"
+        f"    routes: {routes}\n"
+        f"    actions: {result['actions']}"
+    )
+
+
+async def main(args):
+    scenarios = [scenario for scenario in SCENARIOS if not args.scenario or scenario.name in args.scenario]
+    if not scenarios:
+        raise SystemExit(f"Unknown scenario. Choose from: {', '.join(scenario.name for scenario in SCENARIOS)}")
+
+    # The bot logs every warning and kick; keep the report readable unless asked
+    if not args.verbose:
+        logging.getLogger("MemberCheckBot").setLevel(logging.CRITICAL)
+    
+    member_check.log_sink.start()
+    lines = []
+    with tempfile.TemporaryDirectory() as db_dir:
+        for scenario in scenarios:
+            result = await run_scenario(scenario, args, db_dir)
+            line = format_result(result)
+            print(line, flush=True)
+            lines.append(line)
+    member_check.log_sink.stop()
+
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    lines.append(f"process max RSS: {max_rss_mb:.0f}MB")
+    print(lines[-1])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the member sweep against fake guilds")
+    parser.add_argument("--scenario", action="append", help="Scenario name to run (repeatable, default: all)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated REST latency in seconds")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth REST call with a 429")
+    parser.add_argument("--global-rate", type=float, default=10_000, help="Action executor global rate limit")
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false", help="Skip peak memory tracking")
+    parser.add_argument("--verbose", action="store_true", help="Show the bot's own log output")
+    parser.add_argument("--output", help="Also write the results to this file (e.g. bench_output.txt)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+import collections
+import logging
+
+logger = logging.getLogger("MemberCheckBot")
+
+# What the bot can do in a channel: the channel (None if it cannot be found) and the required permissions it lacks
+Access = collections.namedtuple("Access", ["channel", "missing"])
+
+# Permission attribute -> name shown in logs, for every channel the bot posts to
+REQUIRED_PERMISSIONS = {
+    "view_channel": "View Channel",
+    "send_messages": "Send Messages",
+    "embed_links": "Embed Links",
+}
+
+
+class ChannelAccess:
+    """
+    Channels the bot posts to and its permissions in them, resolved once and cached
+    Entries are dropped when a role, channel or the bot's own member changes in their server, and rechecked straight away
+    """
+
+    def __init__(self, get_channel, required=REQUIRED_PERMISSIONS):
+        # get_channel(channel_id) returns the cached discord.py channel or None
+        self.get_channel = get_channel
+        self.required = required
+        self.resolutions = 0
+        # Channel ID -> Access, and guild ID -> channel IDs resolved in that guild
+        self._cache = {}
+        self._by_guild = collections.defaultdict(set)
+
+    def resolve(self, channel_id):
+        """Return the Access for a channel, computing the bot's permissions only on a cache miss"""
+        access = self._cache.get(channel_id)
+        if access is None:
+            access = self._cache[channel_id] = self._resolve(channel_id)
+        return access
+
+    def channel(self, channel_id):
+        """Return the channel if the bot has every required permission in it, otherwise None"""
+        access = self.resolve(channel_id)
+        return access.channel if not access.missing else None
+
+    def invalidate(self, guild_id=None):
+        """
+        Drop the cached entries of one guild (or all of them) and resolve them again
+        Returns [(channel ID, old Access, new Access)] for every channel whose access changed
+        """
+        if guild_id is None:
+            channel_ids = set(self._cache)
+            self._by_guild.clear()
+        else:
+            # Channels that were not found are retried too, they may be in this guild
+            channel_ids = self._by_guild.pop(guild_id, set())
+            channel_ids |= {channel_id for channel_id, access in self._cache.items() if access.channel is None}
+
+        changes = []
+        for channel_id in channel_ids:
+            old = self._cache.pop(channel_id, None)
+            new = self.resolve(channel_id)
+            if old is not None and (old.channel is None, old.missing) != (new.channel is None, new.missing):
+                changes.append((channel_id, old, new))
+        return changes
+
+    def forget(self, channel_id):
+        """Drop one channel's entry, e.g. after Discord refused a post the cache allowed"""
+        access = self._cache.pop(channel_id, None)
+        if access is not None and access.channel is not None:
+            self._by_guild[access.channel.guild.id].discard(channel_id)
+
+    def describe(self, channel_id, access=None):
+        """Return a sentence describing what is wrong with a channel, or None if the bot can post there"""
+        access = self.resolve(channel_id) if access is None else access
+        if access.channel is None:
+            return f"Channel not found (ID: {channel_id})"
+        if access.missing:
+            return f"Bot is missing {', '.join(access.missing)} in channel <#{channel_id}>"
+        return None
+
+    def _resolve(self, channel_id):
+        self.resolutions += 1
+        channel = self.get_channel(channel_id)
+        if channel is None:
+            return Access(None, ())
+
+        self._by_guild[channel.guild.id].add(channel_id)
+        permissions = channel.permissions_for(channel.guild.me)
+        missing = tuple(name for attr, name in self.required.items() if not getattr(permissions, attr))
+        return Access(channel, missing)
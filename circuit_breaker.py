@@ -0,0 +1,101 @@
+import collections
+import logging
+import time
+
+logger = logging.getLogger("MemberCheckBot")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Watches Discord REST calls and opens when too many fail or are slow within a sliding window
+    While open, enforcement actions are paused; after cooldown seconds it is half-open and closes again once
+    probe_calls calls (or another cooldown without REST traffic) pass without a failure, calling on_close
+    """
+
+    def __init__(self, window=60.0, min_calls=20, error_rate=0.5, slow_call=10.0, cooldown=120.0, probe_calls=5,
+                 on_close=None):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self.probe_calls = probe_calls
+        # Called (synchronously) when the breaker closes after being open, e.g. to start a reconciliation pass
+        self.on_close = on_close
+        self.trips = 0
+        self._state = CLOSED
+        self._changed_at = time.monotonic()
+        # (time, failed) per call in the window, and the failures among them
+        self._calls = collections.deque()
+        self._failures = 0
+        self._probes = 0
+
+    @property
+    def state(self):
+        """closed, open or half-open (an open breaker turns half-open once its cooldown has passed)"""
+        now = time.monotonic()
+        if self._state == OPEN and now - self._changed_at >= self.cooldown:
+            self._set_state(HALF_OPEN, now)
+        elif self._state == HALF_OPEN and now - self._changed_at >= self.cooldown:
+            # Nothing failed for a whole cooldown, though there may not have been any calls to judge by
+            self._close(now)
+        return self._state
+
+    @property
+    def is_closed(self):
+        return self.state == CLOSED
+
+    def record(self, failed, latency=0.0):
+        """Record the outcome of one REST call; slower than slow_call seconds counts as a failure"""
+        failed = failed or latency >= self.slow_call
+        now = time.monotonic()
+        state = self.state
+
+        if state == HALF_OPEN:
+            if failed:
+                logger.warning("Discord API still failing, enforcement stays paused")
+                self._set_state(OPEN, now)
+            else:
+                self._probes += 1
+                if self._probes >= self.probe_calls:
+                    self._close(now)
+            return
+
+        self._calls.append((now, failed))
+        self._failures += failed
+        while self._calls and now - self._calls[0][0] > self.window:
+            _, old_failed = self._calls.popleft()
+            self._failures -= old_failed
+
+        if (state == CLOSED and len(self._calls) >= self.min_calls
+                and self._failures >= self.error_rate * len(self._calls)):
+            self.trips += 1
+            logger.critical(
+                f"Discord API unhealthy ({self._failures} of the last {len(self._calls)} calls failed or were slow), "
+                f"pausing warnings and kicks for at least {self.cooldown:.0f}s"
+            )
+            self._set_state(OPEN, now)
+
+    def describe(self):
+        """One line for !status"""
+        state = self.state
+        if state == CLOSED:
+            return f"closed ({self._failures}/{len(self._calls)} calls failed in the last {self.window:.0f}s, {self.trips} trips)"
+        return f"{state} for {time.monotonic() - self._changed_at:.0f}s, warnings and kicks paused ({self.trips} trips)"
+
+    def _set_state(self, state, now):
+        self._state = state
+        self._changed_at = now
+        self._calls.clear()
+        self._failures = 0
+        self._probes = 0
+
+    def _close(self, now):
+        self._set_state(CLOSED, now)
+        logger.warning("Discord API healthy again, resuming warnings and kicks")
+        if self.on_close is not None:
+            self.on_close()
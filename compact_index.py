@@ -0,0 +1,265 @@
+import array
+import bisect
+import datetime
+import itertools
+import logging
+import time
+
+from member_snapshot import MemberSnapshot
+
+logger = logging.getLogger("MemberCheckBot")
+
+# Pseudo role ID marking bot accounts in the role bitmasks (real role IDs are never 0)
+BOT_FLAG = 0
+
+# Pending inserts and removals are merged into the sorted arrays once there are this many
+COMPACT_THRESHOLD = 4096
+
+
+class CompactMemberIndex:
+    """
+    Member IDs and role sets of one guild held in flat arrays instead of discord.py Member objects
+    IDs are a sorted array of uint64; each member's roles are an index into a table of interned role bitmasks
+    Drop-in replacement for ReferenceIndex, also used for target servers in slim cache mode
+    """
+
+    def __init__(self, guild_id, join_window=0):
+        self.guild_id = guild_id
+        # Join times are only kept for members who joined less than this many seconds ago (a rule's min_join_age)
+        self.join_window = join_window
+        self.warm = False
+        # Time of the snapshot the index was restored from, until it is reseeded from the live member list
+        self.restored_at = None
+        # Sorted member IDs and, at the same positions, indexes into _mask_values
+        self._ids = array.array("Q")
+        self._masks = array.array("I")
+        # Role ID -> bit position, and the distinct role bitmasks seen so far
+        self._role_bits = {}
+        self._mask_values = [0]
+        self._mask_lookup = {0: 0}
+        # Mask index -> frozenset of its role IDs, decoded on first use
+        self._role_sets = {}
+        # Members added since the last compaction (not in _ids) and base members removed since then
+        self._added = {}
+        self._removed = set()
+        # Member ID -> unix time they joined, for recent joins only
+        self._joined = {}
+
+    def seed(self, members):
+        """Rebuild the index from a full member list (e.g. after a gateway chunk)"""
+        self._joined = {}
+        entries = []
+        for member in members:
+            entries.append((member.id, self._intern(self._role_ids(member), member.bot)))
+            self._note_join(member.id, member.joined_at)
+        entries.sort()
+        self._ids = array.array("Q", (user_id for user_id, _ in entries))
+        self._masks = array.array("I", (mask for _, mask in entries))
+        self._added = {}
+        self._removed = set()
+        self.warm = True
+        self.restored_at = None
+        logger.info(f"Compact index for guild {self.guild_id} seeded with {len(self._ids)} members "
+                    f"({self.memory_bytes() / 2 ** 20:.1f}MB, {len(self._mask_values)} distinct role sets)")
+
+    def restore(self, snapshot):
+        """Load the index from an on-disk snapshot (see member_snapshot)"""
+        self._ids = snapshot.ids
+        self._masks = snapshot.masks
+        self._role_bits = {role_id: bit for bit, role_id in enumerate(snapshot.role_ids)}
+        self._mask_values = list(snapshot.mask_values)
+        self._mask_lookup = {value: index for index, value in enumerate(self._mask_values)}
+        self._role_sets = {}
+        self._added = {}
+        self._removed = set()
+        # Snapshots do not carry join times; until the next seed every member counts as having joined long ago
+        self._joined = {}
+        self.warm = True
+        self.restored_at = snapshot.taken_at
+
+    def snapshot_builder(self):
+        """Copy the current state and return a function building a MemberSnapshot from it (safe to run in a thread)"""
+        self._compact()
+        ids = array.array("Q", self._ids)
+        masks = array.array("I", self._masks)
+        role_ids = sorted(self._role_bits, key=self._role_bits.get)
+        mask_values = list(self._mask_values)
+        return lambda: MemberSnapshot(self.guild_id, ids, masks, role_ids, mask_values)
+
+    def add(self, member):
+        """Record a member joining the guild"""
+        self.update(member)
+
+    def update(self, member):
+        """Record a member's current roles, replacing whatever was indexed before"""
+        self.set_member(member.id, self._role_ids(member), member.bot, member.joined_at)
+
+    def set_member(self, user_id, role_ids, bot=False, joined_at=None):
+        """Record a member by ID with the given role IDs and join datetime (for raw gateway payloads)"""
+        self._note_join(user_id, joined_at)
+        mask = self._intern(role_ids, bot)
+        position = self._position(user_id)
+        if position is not None:
+            self._masks[position] = mask
+            self._removed.discard(user_id)
+        else:
+            self._added[user_id] = mask
+            self._maybe_compact()
+
+    def remove(self, user_id):
+        """Record a member leaving the guild"""
+        self._joined.pop(user_id, None)
+        if self._added.pop(user_id, None) is not None:
+            return
+        if self._position(user_id) is not None:
+            self._removed.add(user_id)
+            self._maybe_compact()
+
+    def contains(self, user_id):
+        """Return True if the user is a member of the guild"""
+        return self._mask_of(user_id) is not None
+
+    def has_role(self, user_id, role_id):
+        """Return True if the user holds the given role"""
+        mask = self._mask_of(user_id)
+        bit = self._role_bits.get(role_id)
+        return mask is not None and bit is not None and bool(self._mask_values[mask] >> bit & 1)
+
+    def is_bot(self, user_id):
+        return self.has_role(user_id, BOT_FLAG)
+
+    def roles_of(self, user_id):
+        """Return the frozenset of role IDs a user holds, or None if they are not a member (shared per role set)"""
+        mask = self._mask_of(user_id)
+        if mask is None:
+            return None
+        role_ids = self._role_sets.get(mask)
+        if role_ids is None:
+            value = self._mask_values[mask]
+            role_ids = self._role_sets[mask] = frozenset(
+                role_id for role_id, bit in self._role_bits.items() if value >> bit & 1 and role_id != BOT_FLAG
+            )
+        return role_ids
+
+    @property
+    def member_ids(self):
+        """Return a new set of every member ID (built on demand for a sweep's set algebra)"""
+        self._compact()
+        return set(self._ids)
+
+    def role_holders(self, role_id):
+        """Return a new set of the member IDs holding the given role"""
+        return self.holders_of_any([role_id])
+
+    def holders_of_any(self, role_ids):
+        """Return a new set of the member IDs holding at least one of the given roles (BOT_FLAG selects bots)"""
+        self._compact()
+        wanted = 0
+        for role_id in role_ids:
+            bit = self._role_bits.get(role_id)
+            if bit is not None:
+                wanted |= 1 << bit
+        if not wanted:
+            return set()
+
+        matching = {index for index, value in enumerate(self._mask_values) if value & wanted}
+        return set(itertools.compress(self._ids, map(matching.__contains__, self._masks)))
+
+    def joined_at(self, user_id):
+        """Return the datetime a member joined, or None if it was longer than join_window ago or is unknown"""
+        joined = self._joined.get(user_id)
+        if joined is None:
+            return None
+        return datetime.datetime.fromtimestamp(joined, datetime.timezone.utc)
+
+    def recent_joiners(self, age, now=None):
+        """Return a new set of the member IDs who joined less than age seconds ago (at most join_window)"""
+        now = time.time() if now is None else now
+        # Forget joins that have aged out of the window while we are at it
+        for user_id in [user_id for user_id, joined in self._joined.items() if now - joined >= self.join_window]:
+            del self._joined[user_id]
+        return {user_id for user_id, joined in self._joined.items() if now - joined < age}
+
+    def memory_bytes(self):
+        """Approximate memory held by the arrays, pending changes and recent join times"""
+        return (self._ids.itemsize * len(self._ids) + self._masks.itemsize * len(self._masks)
+                + 100 * (len(self._added) + len(self._removed) + len(self._joined)))
+
+    def __len__(self):
+        return len(self._ids) + len(self._added) - len(self._removed)
+
+    def _role_ids(self, member):
+        return [role.id for role in member.roles if role.id != self.guild_id]
+
+    def _note_join(self, user_id, joined_at):
+        # An update without a join time leaves what is known alone
+        if joined_at is None:
+            return
+        if self.join_window and time.time() - joined_at.timestamp() < self.join_window:
+            self._joined[user_id] = joined_at.timestamp()
+        else:
+            self._joined.pop(user_id, None)
+
+    def _intern(self, role_ids, bot=False):
+        mask = 0
+        for role_id in role_ids:
+            bit = self._role_bits.get(role_id)
+            if bit is None:
+                bit = self._role_bits[role_id] = len(self._role_bits)
+            mask |= 1 << bit
+        if bot:
+            mask |= 1 << self._role_bits.setdefault(BOT_FLAG, len(self._role_bits))
+
+        index = self._mask_lookup.get(mask)
+        if index is None:
+            index = self._mask_lookup[mask] = len(self._mask_values)
+            self._mask_values.append(mask)
+        return index
+
+    def _position(self, user_id):
+        position = bisect.bisect_left(self._ids, user_id)
+        if position < len(self._ids) and self._ids[position] == user_id:
+            return position
+        return None
+
+    def _mask_of(self, user_id):
+        mask = self._added.get(user_id)
+        if mask is not None:
+            return mask
+        if user_id in self._removed:
+            return None
+        position = self._position(user_id)
+        return None if position is None else self._masks[position]
+
+    def _maybe_compact(self):
+        if len(self._added) + len(self._removed) >= COMPACT_THRESHOLD:
+            self._compact()
+
+    def _compact(self):
+        """Merge pending inserts and removals into the sorted arrays, copying unchanged runs in bulk"""
+        if not self._added and not self._removed:
+            return
+
+        changes = sorted([(user_id, mask) for user_id, mask in self._added.items()] +
+                         [(user_id, None) for user_id in self._removed])
+        ids = array.array("Q")
+        masks = array.array("I")
+        start = 0
+        for user_id, mask in changes:
+            position = bisect.bisect_left(self._ids, user_id, start)
+            ids.extend(self._ids[start:position])
+            masks.extend(self._masks[start:position])
+            if mask is None:
+                # Removed: skip the base entry
+                start = position + 1
+            else:
+                ids.append(user_id)
+                masks.append(mask)
+                start = position
+        ids.extend(self._ids[start:])
+        masks.extend(self._masks[start:])
+
+        self._ids = ids
+        self._masks = masks
+        self._added = {}
+        self._removed = set()
@@ -0,0 +1,110 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger("MemberCheckBot")
+
+
+class DeadlineScheduler:
+    """Runs an async callback for each key as soon as its deadline passes, backed by a min-heap"""
+
+    def __init__(self, callback, max_concurrency=4):
+        self.callback = callback
+        self.max_concurrency = max_concurrency
+        # Heap of (deadline, sequence, key); cancelled entries are skipped lazily
+        self._heap = []
+        # key -> (deadline, sequence) of the live entry
+        self._entries = {}
+        self._sequence = itertools.count()
+        self._wakeup = None
+        self._semaphore = None
+        self._task = None
+
+    def schedule(self, key, deadline):
+        """Fire the callback for key at deadline (a unix timestamp), replacing any earlier schedule"""
+        sequence = next(self._sequence)
+        self._entries[key] = (deadline, sequence)
+        heapq.heappush(self._heap, (deadline, sequence, key))
+
+        # Wake the runner if this is now the earliest deadline
+        if self._wakeup is not None and self._heap[0][1] == sequence:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        """Cancel the deadline for key; returns True if one was scheduled"""
+        if self._entries.pop(key, None) is None:
+            return False
+
+        # Rebuild once cancelled entries dominate so the heap stays proportional to live deadlines
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._entries):
+            self._heap = [(deadline, sequence, key) for key, (deadline, sequence) in self._entries.items()]
+            heapq.heapify(self._heap)
+        return True
+
+    def deadline(self, key):
+        """Return the scheduled deadline for key, or None"""
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def start(self):
+        """Start firing deadlines on the running event loop"""
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        """Stop firing deadlines (scheduled entries are kept)"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            self._discard_stale()
+
+            if not self._heap:
+                await self._wait(None)
+                continue
+
+            deadline, _, key = self._heap[0]
+            delay = deadline - time.time()
+            if delay > 0:
+                await self._wait(delay)
+                continue
+
+            heapq.heappop(self._heap)
+            del self._entries[key]
+            await self._semaphore.acquire()
+            asyncio.get_running_loop().create_task(self._fire(key))
+
+    async def _wait(self, timeout):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _fire(self, key):
+        try:
+            await self.callback(key)
+        except Exception as e:
+            logger.error(f"Error handling deadline for {key}: {e}")
+        finally:
+            self._semaphore.release()
+
+    def _discard_stale(self):
+        while self._heap:
+            deadline, sequence, key = self._heap[0]
+            if self._entries.get(key) == (deadline, sequence):
+                return
+            heapq.heappop(self._heap)
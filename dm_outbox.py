@@ -0,0 +1,305 @@
+import asyncio
+import collections
+import itertools
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import discord
+
+logger = logging.getLogger("MemberCheckBot")
+
+# Delivery order: kick notices first (the kick waits for them), then warnings, then everything else
+PRIORITY_KICK = 0
+PRIORITY_WARNING = 1
+PRIORITY_NOTICE = 2
+
+# Discord error code for "Cannot send messages to this user" (DMs closed or no mutual server)
+CANNOT_MESSAGE_USER = 50007
+
+# A DM waiting to be sent; embed is the dict form of a discord.Embed so it can be stored
+OutboxItem = collections.namedtuple("OutboxItem", ["id", "user_id", "priority", "kind", "embed", "created_at"])
+
+# The last known delivery state of a user's DMs: queued, sent, failed, cancelled or closed (the user does not accept DMs)
+Delivery = collections.namedtuple("Delivery", ["status", "kind", "at", "error"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dm_outbox (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    priority INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    embed TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class DMOutbox:
+    """
+    Direct messages to members, sent in priority order by background workers instead of inline
+    Pending DMs are persisted to SQLite so they survive a restart; opened DM channels are kept in an LRU cache
+    """
+
+    def __init__(self, path, open_dm, run, workers=5, max_attempts=5, channel_cache_size=10000, state_cache_size=100000,
+                 fence=None, base_delay=2.0):
+        self.path = path
+        # fence(conn) runs inside every write transaction and raises to refuse it (see LeaderLease.check)
+        self.fence = fence
+        # open_dm(user_id) returns a DM channel; run(action) sends through the executor's dm lane
+        self.open_dm = open_dm
+        self.run = run
+        self.workers = workers
+        self.max_attempts = max_attempts
+        # Seconds before the first retry of a failed DM, doubling with each attempt
+        self.base_delay = base_delay
+        self.channel_cache_size = channel_cache_size
+        self.state_cache_size = state_cache_size
+        self.sent = 0
+        self.failed = 0
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        self._flush_lock = None
+        self._ids = itertools.count(1)
+        # Item ID -> item for every DM not yet delivered or given up on
+        self._pending = {}
+        # Item ID -> item to write, or None to delete
+        self._dirty = {}
+        self._attempts = collections.Counter()
+        self._waiters = {}
+        self._channels = collections.OrderedDict()
+        self._states = collections.OrderedDict()
+        self._queue = None
+        self._idle = None
+        self._tasks = []
+
+    def load(self):
+        """Open the database (once) and queue the DMs stored there, e.g. left over from the last run, dropping unwritten ones"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        with self._conn_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            rows = self._conn.execute(
+                "SELECT id, user_id, priority, kind, embed, created_at FROM dm_outbox ORDER BY id"
+            ).fetchall()
+
+        self._pending = {}
+        self._dirty = {}
+        for item_id, user_id, priority, kind, embed, created_at in rows:
+            self._pending[item_id] = OutboxItem(item_id, user_id, priority, kind, json.loads(embed), created_at)
+        self._ids = itertools.count(max(self._pending, default=0) + 1)
+        if rows:
+            logger.info(f"Loaded {len(rows)} undelivered DMs from {self.path}")
+
+    def put(self, user_id, embed, priority=PRIORITY_NOTICE, kind="notice"):
+        """Queue a DM without waiting for it; returns the outbox item"""
+        item = OutboxItem(next(self._ids), user_id, priority, kind, embed.to_dict(), time.time())
+        self._pending[item.id] = item
+        self._dirty[item.id] = item
+        self._set_state(user_id, "queued", kind)
+        if self._queue is not None:
+            self._idle.clear()
+            self._queue.put_nowait((item.priority, item.id))
+        return item
+
+    async def deliver(self, user_id, embed, priority=PRIORITY_NOTICE, kind="notice", timeout=None):
+        """
+        Queue a DM and wait until it is sent or given up on; returns True if it was sent
+        On timeout the DM is cancelled and False returned: the caller goes ahead without it (e.g. with the kick)
+        """
+        item = self.put(user_id, embed, priority, kind)
+        waiter = self._waiters[item.id] = asyncio.get_running_loop().create_future()
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            self.cancel(item.id)
+            return False
+        finally:
+            self._waiters.pop(item.id, None)
+
+    def cancel(self, item_id):
+        """Drop a DM that is queued or waiting to be retried; returns False if it was already sent or given up on"""
+        item = self._pending.pop(item_id, None)
+        if item is None:
+            return False
+        # Workers and retry timers skip items no longer pending; the row is deleted at the next flush
+        self._attempts.pop(item_id, None)
+        self._dirty[item_id] = None
+        self._set_state(item.user_id, "cancelled", item.kind)
+        if not self._pending and self._idle is not None:
+            self._idle.set()
+        return True
+
+    def state(self, user_id):
+        """Return the last known Delivery for a user's DMs, or None"""
+        return self._states.get(user_id)
+
+    def qsize(self):
+        """Return the number of DMs waiting to be sent"""
+        return len(self._pending)
+
+    def start(self):
+        """Start the send workers on the running event loop"""
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._idle = asyncio.Event()
+        for item in self._pending.values():
+            self._queue.put_nowait((item.priority, item.id))
+        if not self._pending:
+            self._idle.set()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def stop(self):
+        """Stop sending; undelivered DMs stay in the outbox"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._queue = None
+
+    async def drain(self):
+        """Wait until every queued DM has been sent or given up on"""
+        if self._idle is not None:
+            await self._idle.wait()
+
+    async def flush(self):
+        """Write queued outbox changes in a single transaction off the event loop"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not self._dirty or self._conn is None:
+                return 0
+            dirty, self._dirty = self._dirty, {}
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, dirty)
+            except Exception:
+                dirty.update(self._dirty)
+                self._dirty = dirty
+                raise
+            return len(dirty)
+
+    def close(self):
+        """Flush synchronously and close the database"""
+        if self._conn is None:
+            return
+        if self._dirty:
+            dirty, self._dirty = self._dirty, {}
+            self._write(dirty)
+        with self._conn_lock:
+            self._conn.close()
+        self._conn = None
+
+    async def _worker(self):
+        while True:
+            _, item_id = await self._queue.get()
+            try:
+                item = self._pending.get(item_id)
+                if item is not None:
+                    await self._send(item)
+            except Exception as e:
+                logger.error(f"Error sending DM {item_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _send(self, item):
+        try:
+            channel = await self._channel(item.user_id)
+            embed = discord.Embed.from_dict(item.embed)
+            await self.run(lambda: channel.send(embed=embed))
+        except discord.Forbidden as e:
+            # The user does not accept DMs from the bot; retrying will not help
+            status = "closed" if e.code == CANNOT_MESSAGE_USER else "failed"
+            logger.warning(f"Failed to send {item.kind} DM to user {item.user_id}: {e}", extra={"user_id": item.user_id, "action": "dm"})
+            self._finish(item, False, status, e)
+        except discord.HTTPException as e:
+            # Server errors and 429s may pass; any other 4xx answer will not change
+            self._retry_or_fail(item, e, retry=e.status >= 500 or e.status == 429)
+        except Exception as e:
+            # Connection errors, timeouts, a paused executor: try again later
+            self._retry_or_fail(item, e, retry=True)
+        else:
+            logger.info(f"Sent {item.kind} DM to user {item.user_id}", extra={"user_id": item.user_id, "action": "dm"})
+            self._finish(item, True, "sent")
+
+    def _retry_or_fail(self, item, error, retry):
+        """Requeue a failed DM after a backoff, or give up on it once it has failed max_attempts times"""
+        self._channels.pop(item.user_id, None)
+        if item.id not in self._pending:
+            # Cancelled while it was being sent
+            return
+        self._attempts[item.id] += 1
+        if not retry or self._attempts[item.id] >= self.max_attempts:
+            logger.warning(f"Failed to send {item.kind} DM to user {item.user_id}: {error}", extra={"user_id": item.user_id, "action": "dm"})
+            self._finish(item, False, "failed", error)
+            return
+
+        # Retry after a backoff without holding a worker
+        delay = self.base_delay * 2 ** (self._attempts[item.id] - 1)
+        asyncio.get_running_loop().call_later(delay, self._requeue, item)
+
+    async def _channel(self, user_id):
+        channel = self._channels.get(user_id)
+        if channel is not None:
+            self._channels.move_to_end(user_id)
+            return channel
+
+        channel = self._channels[user_id] = await self.open_dm(user_id)
+        if len(self._channels) > self.channel_cache_size:
+            self._channels.popitem(last=False)
+        return channel
+
+    def _requeue(self, item):
+        if self._queue is not None and item.id in self._pending:
+            self._queue.put_nowait((item.priority, item.id))
+
+    def _finish(self, item, sent, status, error=None):
+        self._pending.pop(item.id, None)
+        self._attempts.pop(item.id, None)
+        self._dirty[item.id] = None
+        if sent:
+            self.sent += 1
+        else:
+            self.failed += 1
+        self._set_state(item.user_id, status, item.kind, error)
+
+        waiter = self._waiters.get(item.id)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(sent)
+        if not self._pending and self._idle is not None:
+            self._idle.set()
+
+    def _set_state(self, user_id, status, kind, error=None):
+        self._states[user_id] = Delivery(status, kind, time.time(), str(error) if error else None)
+        self._states.move_to_end(user_id)
+        if len(self._states) > self.state_cache_size:
+            self._states.popitem(last=False)
+
+    def _write(self, dirty):
+        upserts = [
+            (item.id, item.user_id, item.priority, item.kind, json.dumps(item.embed), item.created_at)
+            for item in dirty.values() if item is not None
+        ]
+        deletes = [(item_id,) for item_id, item in dirty.items() if item is None]
+
+        with self._conn_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.fence is not None:
+                    self.fence(self._conn)
+                if upserts:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO dm_outbox (id, user_id, priority, kind, embed, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        upserts
+                    )
+                if deletes:
+                    self._conn.executemany("DELETE FROM dm_outbox WHERE id = ?", deletes)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
@@ -0,0 +1,56 @@
+class EnforcementPlan:
+    """The complete set of actions a sweep should take, computed without side effects"""
+
+    def __init__(self):
+        # User ID -> violation (rule and reason code) for members to warn now
+        self.warn = {}
+        # User ID -> violation for warned members whose grace period is over
+        self.kick = {}
+        # Warned members who are still inside their grace period
+        self.pending = set()
+        # Warned target members who no longer need a warning (complied or became exempt)
+        self.clear = set()
+        # Target members skipped because of an exempt role or a bot account
+        self.exempt = set()
+        # Number of target members considered
+        self.total = 0
+
+    def summary(self):
+        """Return a one-line description of the plan"""
+        return (f"{self.total} members: {len(self.warn)} to warn, {len(self.kick)} to kick, "
+                f"{len(self.pending)} pending, {len(self.clear)} to clear, {len(self.exempt)} exempt")
+
+
+def plan_enforcement(target_ids, exempt_ids, find_violations, deadlines, now):
+    """
+    Compute the full enforcement plan from ID snapshots using set algebra
+    find_violations(candidate IDs) returns {user ID: violation} for the candidates failing the target's policy
+    deadlines maps each currently warned user ID to the time their grace period ends
+    """
+    plan = EnforcementPlan()
+
+    target = _as_set(target_ids)
+    plan.total = len(target)
+    plan.exempt = target & _as_set(exempt_ids)
+    candidates = target - plan.exempt
+
+    # Work out who fails the policy
+    plan.warn = find_violations(candidates)
+    noncompliant = set(plan.warn)
+
+    # Split the failing members by where they are in the warning lifecycle
+    already_warned = noncompliant & deadlines.keys()
+    for user_id in already_warned:
+        violation = plan.warn.pop(user_id)
+        if deadlines[user_id] <= now:
+            plan.kick[user_id] = violation
+        else:
+            plan.pending.add(user_id)
+
+    # Warnings of users who left are kept so they are kicked straight away if they rejoin
+    plan.clear = (deadlines.keys() & target) - noncompliant
+    return plan
+
+
+def _as_set(ids):
+    return ids if isinstance(ids, (set, frozenset)) else set(ids)
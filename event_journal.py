@@ -0,0 +1,98 @@
+import asyncio
+import collections
+import os
+import struct
+import time
+
+MAGIC = b"MCJRNL01"
+
+# Event kinds; SEED marks a member present when an index was seeded from a full member list
+SEED = 0
+JOIN = 1
+REMOVE = 2
+UPDATE = 3
+KIND_NAMES = {SEED: "seed", JOIN: "join", REMOVE: "remove", UPDATE: "update"}
+
+# kind, unix time, guild ID, user ID, bot flag, role count; followed by the role IDs
+RECORD = struct.Struct("<BdQQBH")
+ROLE_ID = struct.Struct("<Q")
+
+JournalEvent = collections.namedtuple("JournalEvent", ["kind", "timestamp", "guild_id", "user_id", "role_ids", "bot"])
+
+
+class EventJournal:
+    """
+    Append-only binary journal of the member events the bot consumes, for replay_journal.py
+    Records are buffered in memory and appended to the file off the event loop on flush()
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.recorded = 0
+        self._buffer = bytearray()
+        self._flush_lock = None
+
+    def record(self, kind, guild_id, user_id, role_ids=(), bot=False, timestamp=None):
+        role_ids = list(role_ids)
+        self._buffer += RECORD.pack(
+            kind, time.time() if timestamp is None else timestamp, guild_id, user_id, bool(bot), len(role_ids)
+        )
+        for role_id in role_ids:
+            self._buffer += ROLE_ID.pack(role_id)
+        self.recorded += 1
+
+    def record_member(self, kind, member):
+        """Record an event carrying a member's current roles"""
+        guild_id = member.guild.id
+        role_ids = [role.id for role in member.roles if role.id != guild_id]
+        self.record(kind, guild_id, member.id, role_ids, member.bot)
+
+    def record_seed(self, guild_id, members):
+        """Record the full member list an index was seeded from"""
+        now = time.time()
+        for member in members:
+            role_ids = [role.id for role in member.roles if role.id != guild_id]
+            self.record(SEED, guild_id, member.id, role_ids, member.bot, now)
+
+    async def flush(self):
+        """Append buffered records to the file in a worker thread"""
+        if not self._buffer:
+            return 0
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        data, self._buffer = bytes(self._buffer), bytearray()
+        async with self._flush_lock:
+            await asyncio.get_running_loop().run_in_executor(None, self._append, data)
+        return len(data)
+
+    def close(self):
+        """Write whatever is still buffered"""
+        if self._buffer:
+            data, self._buffer = bytes(self._buffer), bytearray()
+            self._append(data)
+
+    def _append(self, data):
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "ab") as f:
+            if new:
+                f.write(MAGIC)
+            f.write(data)
+
+
+def read_journal(path):
+    """Yield the JournalEvents of a journal file in order"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an event journal")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                # A partly written last record is ignored
+                return
+            kind, timestamp, guild_id, user_id, bot, role_count = RECORD.unpack(header)
+            roles = f.read(ROLE_ID.size * role_count)
+            if len(roles) < ROLE_ID.size * role_count:
+                return
+            role_ids = [role_id for (role_id,) in ROLE_ID.iter_unpack(roles)]
+            yield JournalEvent(kind, timestamp, guild_id, user_id, role_ids, bool(bot))
@@ -0,0 +1,199 @@
+import asyncio
+import collections
+
+import discord
+
+
+class FakeResponse:
+    """Minimal stand-in for the aiohttp response discord.py exceptions expect"""
+
+    def __init__(self, status, reason):
+        self.status = status
+        self.reason = reason
+
+
+class FakeHTTP:
+    """Counts REST calls by route and simulates latency and 429 responses"""
+
+    def __init__(self, latency=0.0, rate_limit_every=0, retry_after=0.05):
+        self.latency = latency
+        # Every Nth call is answered with a 429 (0 disables)
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.calls = collections.Counter()
+        self.rate_limited = collections.Counter()
+        self._total = 0
+
+    async def request(self, route):
+        """Simulate one REST call on a route"""
+        self._total += 1
+        self.calls[route] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.rate_limit_every and self._total % self.rate_limit_every == 0:
+            self.rate_limited[route] += 1
+            raise discord.RateLimited(self.retry_after)
+
+    def total(self):
+        """Total REST calls made so far"""
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
+        self.rate_limited.clear()
+        self._total = 0
+
+
+class FakeRole:
+    def __init__(self, guild, role_id, name=None):
+        self.guild = guild
+        self.id = role_id
+        self.name = name or f"role-{role_id}"
+
+    @property
+    def members(self):
+        return [self.guild._members[user_id] for user_id in self.guild._role_members.get(self.id, ())]
+
+
+class FakeMember:
+    def __init__(self, guild, user_id, roles=(), bot=False, name=None):
+        self.guild = guild
+        self.id = user_id
+        self.bot = bot
+        self.name = name or f"user-{user_id}"
+        self.mention = f"<@{user_id}>"
+        self._role_ids = list(roles)
+        self.joined_at = None
+
+    @property
+    def roles(self):
+        return [self.guild._roles[role_id] for role_id in self._role_ids if role_id in self.guild._roles]
+
+    async def send(self, *args, **kwargs):
+        await self.guild.http.request("POST /channels/{dm}/messages")
+
+    async def kick(self, reason=None):
+        await self.guild.http.request("DELETE /guilds/{guild}/members/{user}")
+        self.guild.remove_member(self.id)
+
+
+class FakeChannel:
+    def __init__(self, guild, channel_id, http):
+        self.guild = guild
+        self.id = channel_id
+        self.http = http
+        self.sent = 0
+
+    def permissions_for(self, member):
+        return discord.Permissions.all()
+
+    async def send(self, *args, **kwargs):
+        await self.http.request("POST /channels/{channel}/messages")
+        self.sent += 1
+
+
+class FakeDMChannel:
+    def __init__(self, user_id, http):
+        self.recipient_id = user_id
+        self.http = http
+
+    async def send(self, *args, **kwargs):
+        await self.http.request("POST /channels/{dm}/messages")
+
+
+class FakeGuild:
+    """In-process guild with indexed members and roles"""
+
+    def __init__(self, guild_id, http, name=None, role_ids=(), member_cache=True):
+        self.id = guild_id
+        self.http = http
+        self.name = name or f"guild-{guild_id}"
+        self.chunked = True
+        # False behaves like MemberCacheFlags.none(): get_member misses and members must be fetched
+        self.member_cache = member_cache
+        self._members = {}
+        self._roles = {role_id: FakeRole(self, role_id) for role_id in role_ids}
+        self._role_members = {}
+        self.me = FakeMember(self, 1, bot=True, name="bot")
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    @property
+    def roles(self):
+        return list(self._roles.values())
+
+    @property
+    def member_count(self):
+        return len(self._members)
+
+    def add_role(self, role_id):
+        self._roles.setdefault(role_id, FakeRole(self, role_id))
+
+    def add_member(self, user_id, roles=(), bot=False):
+        member = FakeMember(self, user_id, roles, bot)
+        self._members[user_id] = member
+        for role_id in member._role_ids:
+            self._role_members.setdefault(role_id, set()).add(user_id)
+        return member
+
+    def remove_member(self, user_id):
+        member = self._members.pop(user_id, None)
+        if member is not None:
+            for role_id in member._role_ids:
+                self._role_members.get(role_id, set()).discard(user_id)
+        return member
+
+    def set_roles(self, user_id, roles):
+        member = self._members[user_id]
+        for role_id in member._role_ids:
+            self._role_members.get(role_id, set()).discard(user_id)
+        member._role_ids = list(roles)
+        for role_id in member._role_ids:
+            self._role_members.setdefault(role_id, set()).add(user_id)
+        return member
+
+    def get_member(self, user_id):
+        if not self.member_cache:
+            return None
+        return self._members.get(user_id)
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    async def chunk(self, *, cache=True):
+        await self.http.request("GATEWAY REQUEST_GUILD_MEMBERS")
+        return self.members
+
+    async def fetch_member(self, user_id):
+        await self.http.request("GET /guilds/{guild}/members/{user}")
+        member = self._members.get(user_id)
+        if member is None:
+            raise discord.NotFound(FakeResponse(404, "Not Found"), "Unknown Member")
+        return member
+
+
+class FakeClient:
+    """Answers the bot lookups the enforcement code makes, from fake guilds and channels"""
+
+    def __init__(self, guilds, channels):
+        self.guilds = {guild.id: guild for guild in guilds}
+        self.channels = {channel.id: channel for channel in channels}
+
+    def get_guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def create_dm(self, user):
+        http = next(iter(self.guilds.values())).http
+        await http.request("POST /users/@me/channels")
+        return FakeDMChannel(user.id, http)
+
+    def install(self, bot):
+        """Point a commands.Bot instance's lookups at the fakes"""
+        bot.get_guild = self.get_guild
+        bot.get_channel = self.get_channel
+        bot.create_dm = self.create_dm
@@ -0,0 +1,136 @@
+import collections
+import json
+import logging
+import os
+
+from policy import CompiledPolicy, Requirement, Rule, legacy_rules
+
+logger = logging.getLogger("MemberCheckBot")
+
+# A reference server a target checks against, and the role required there under criteria 2
+ReferenceGuild = collections.namedtuple("ReferenceGuild", ["guild_id", "role_id"])
+
+
+class TargetConfig:
+    """Enforcement settings for one target server"""
+
+    def __init__(self, guild_id, references, criteria=1, exempt_roles=(), warning_channel_id=0,
+                 warning_seconds=16800, invite_link="", name=None, rules=None):
+        self.guild_id = guild_id
+        # Members comply by satisfying the criteria in any one of these reference servers
+        self.references = list(references)
+        self.criteria = criteria
+        self.exempt_roles = set(exempt_roles)
+        self.warning_channel_id = warning_channel_id
+        self.warning_seconds = warning_seconds
+        self.invite_link = invite_link
+        # Display name, replaced by the guild's real name once the bot is connected
+        self.name = name or f"Server {guild_id}"
+        # Explicit rules replace the criteria; either way they are compiled once into bitmask tests
+        self.rules = list(rules) if rules is not None else legacy_rules(self.references, criteria, warning_seconds)
+        self.policy = CompiledPolicy(self.rules, self.exempt_roles)
+        # Servers that only rules mention are reference servers too
+        for guild_id in self.policy.reference_ids:
+            if guild_id not in self.reference_ids:
+                self.references.append(ReferenceGuild(guild_id, 0))
+
+    @property
+    def reference_ids(self):
+        return [reference.guild_id for reference in self.references]
+
+    def __repr__(self):
+        return f"<TargetConfig guild_id={self.guild_id} references={self.reference_ids} criteria={self.criteria}>"
+
+
+def load_targets(path=None):
+    """
+    Load the target servers, keyed by guild ID
+    Reads the JSON file named by GUILDS_CONFIG if set, otherwise builds a single target from SERVER_A_ID/SERVER_B_ID
+    """
+    path = path or os.getenv("GUILDS_CONFIG", "")
+    defaults = {
+        "criteria": int(os.getenv("ACTIVE_CRITERIA", "1")),
+        "role_id": int(os.getenv("ROLE_X_ID", "0")),
+        "exempt_roles": [int(role_id) for role_id in os.getenv("EXEMPT_ROLES", "").split(",") if role_id],
+        "warning_channel_id": int(os.getenv("WARNING_CHANNEL_ID", "0")),
+        "warning_seconds": float(os.getenv("WARNING_SECONDS", "16800")),
+        "invite_link": os.getenv("INVITE_LINK", ""),
+    }
+
+    if not path:
+        target_id = int(os.getenv("SERVER_B_ID", "0"))
+        reference_id = int(os.getenv("SERVER_A_ID", "0"))
+        if not target_id or not reference_id:
+            return {}
+        target = TargetConfig(
+            target_id,
+            [ReferenceGuild(reference_id, defaults["role_id"])],
+            defaults["criteria"],
+            defaults["exempt_roles"],
+            defaults["warning_channel_id"],
+            defaults["warning_seconds"],
+            defaults["invite_link"],
+            os.getenv("TARGET_SERVER_NAME")
+        )
+        return {target.guild_id: target}
+
+    with open(path) as f:
+        data = json.load(f)
+
+    targets = {}
+    for entry in data.get("targets", []):
+        target = _parse_target(entry, defaults)
+        if target.guild_id in targets:
+            raise ValueError(f"Target server {target.guild_id} is configured twice in {path}")
+        targets[target.guild_id] = target
+
+    logger.info(f"Loaded {len(targets)} target servers from {path}")
+    return targets
+
+
+def _parse_target(entry, defaults):
+    references = []
+    for reference in entry.get("references", []):
+        if isinstance(reference, dict):
+            references.append(ReferenceGuild(int(reference["guild_id"]), int(reference.get("role_id", defaults["role_id"]))))
+        else:
+            references.append(ReferenceGuild(int(reference), defaults["role_id"]))
+
+    rules = None
+    if "rules" in entry:
+        warning_seconds = float(entry.get("warning_seconds", defaults["warning_seconds"]))
+        rules = [_parse_rule(rule, warning_seconds) for rule in entry["rules"]]
+    elif not references:
+        raise ValueError(f"Target server {entry.get('guild_id')} has no reference servers")
+
+    return TargetConfig(
+        int(entry["guild_id"]),
+        references,
+        int(entry.get("criteria", defaults["criteria"])),
+        [int(role_id) for role_id in entry.get("exempt_roles", defaults["exempt_roles"])],
+        int(entry.get("warning_channel_id", defaults["warning_channel_id"])),
+        float(entry.get("warning_seconds", defaults["warning_seconds"])),
+        entry.get("invite_link", defaults["invite_link"]),
+        entry.get("name"),
+        rules
+    )
+
+
+def _parse_rule(entry, warning_seconds):
+    requirements = [
+        Requirement(
+            int(requirement["guild_id"]),
+            [int(role_id) for role_id in requirement.get("any_roles", [])],
+            [int(role_id) for role_id in requirement.get("all_roles", [])]
+        )
+        for requirement in entry.get("require", [])
+    ]
+    return Rule(
+        entry.get("name", "Rule"),
+        requirements,
+        entry.get("match", "any"),
+        [int(role_id) for role_id in entry.get("exempt_roles", [])],
+        float(entry.get("min_account_age", 0)),
+        float(entry.get("min_join_age", 0)),
+        float(entry.get("warning_seconds", warning_seconds))
+    )
@@ -0,0 +1,96 @@
+import array
+import asyncio
+import bisect
+import logging
+import time
+
+logger = logging.getLogger("MemberCheckBot")
+
+
+class SweepCursor:
+    """
+    Position of an incremental sweep in one target server's sorted member IDs
+    The last checked user ID is kept in the warning store's meta table, so a restart resumes mid-lap
+    """
+
+    def __init__(self, guild_id, store):
+        self.guild_id = guild_id
+        self.store = store
+        self.key = f"sweep_cursor:{guild_id}"
+        # Member IDs of the current lap, sorted, and the position of the next slice in them
+        self.lap_ids = array.array("Q")
+        self.position = 0
+        self.lap_started = None
+        # Sweep ID for the log lines of the current lap
+        self.lap_id = None
+        self.laps = 0
+
+    @property
+    def in_lap(self):
+        return self.position < len(self.lap_ids)
+
+    def start_lap(self, member_ids):
+        """Begin a lap over the given member IDs, skipping the ones checked before the last restart"""
+        self.lap_ids = array.array("Q", sorted(member_ids))
+        resume_after = int(self.store.get_meta(self.key, "0"))
+        self.position = bisect.bisect_right(self.lap_ids, resume_after) if resume_after else 0
+        if self.position >= len(self.lap_ids):
+            self.position = 0
+        self.lap_started = time.monotonic()
+        self.lap_id = f"{self.guild_id}-{int(time.time())}"
+        if self.position:
+            logger.info(f"Resuming sweep of server {self.guild_id} at member {self.position} of {len(self.lap_ids)}")
+
+    def next_slice(self, size):
+        """Return the next up to size member IDs without moving the cursor"""
+        return list(self.lap_ids[self.position:self.position + size])
+
+    def advance(self, user_ids):
+        """Mark a slice as checked"""
+        if not user_ids:
+            return
+        self.position += len(user_ids)
+        self.store.set_meta(self.key, user_ids[-1])
+
+    def finish_lap(self):
+        """Reset the cursor so the next lap starts from the lowest member ID"""
+        self.store.set_meta(self.key, 0)
+        self.lap_ids = array.array("Q")
+        self.position = 0
+        self.laps += 1
+
+    def progress(self):
+        """Return the fraction of the current lap that has been checked"""
+        return self.position / len(self.lap_ids) if self.lap_ids else 0.0
+
+    def slice_delay(self, interval, slice_size):
+        """Seconds to wait between slices so one lap takes about interval seconds"""
+        if not self.lap_ids:
+            return interval
+        slices = -(-len(self.lap_ids) // slice_size)
+        return interval / slices
+
+
+class ActionBudget:
+    """Token bucket capping sweep actions (warnings and kicks) per minute, shared by every target's sweep"""
+
+    def __init__(self, per_minute):
+        # 0 disables the cap
+        self.per_minute = per_minute
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    async def acquire(self, count):
+        """Wait until count actions fit in the budget, then spend them (a larger batch waits for a full bucket)"""
+        if not self.per_minute or not count:
+            return
+        rate = self.per_minute / 60
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.per_minute, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            needed = min(count, self.per_minute)
+            if self.tokens >= needed:
+                self.tokens -= count
+                return
+            await asyncio.sleep((needed - self.tokens) / rate)
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger("MemberCheckBot")
+
+
+class JoinAdmission:
+    """
+    Collects target server joins into short time-boxed batches and hands each batch to one evaluation call
+    Batches close after window seconds or max_batch joins; at most max_pending joins wait, the rest are left to the sweep
+    """
+
+    def __init__(self, evaluate, window=2.0, max_batch=500, max_pending=10000):
+        # evaluate(guild_id, members) checks one server's batch; batches are evaluated one at a time
+        self.evaluate = evaluate
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.admitted = 0
+        self.batches = 0
+        self.dropped = 0
+        # guild ID -> {user ID: member}, so a member joining twice in a window is checked once
+        self._pending = {}
+        self._count = 0
+        self._opened = None
+        self._ready = None
+        self._full = None
+        self._task = None
+        self._flush_lock = None
+
+    def put(self, member):
+        """Queue a joined member for the next batch; returns False if the queue is full"""
+        if self._count >= self.max_pending:
+            self.dropped += 1
+            return False
+
+        members = self._pending.setdefault(member.guild.id, {})
+        if member.id not in members:
+            self._count += 1
+        members[member.id] = member
+        self.admitted += 1
+
+        if self._opened is None:
+            self._opened = time.monotonic()
+        if self._ready is not None:
+            self._ready.set()
+            if self._count >= self.max_batch:
+                self._full.set()
+        return True
+
+    def qsize(self):
+        """Return the number of joins waiting for a batch"""
+        return self._count
+
+    def start(self):
+        """Start batching on the running event loop"""
+        if self._task is not None and not self._task.done():
+            return
+        self._ready = asyncio.Event()
+        self._full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        if self._count:
+            self._ready.set()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        """Stop batching; joins still queued are left to the next sweep"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def flush(self):
+        """Evaluate everything queued so far, one batch per server"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            self._count = 0
+            self._opened = None
+            if self._full is not None:
+                self._full.clear()
+
+            if self.dropped:
+                logger.warning(f"Join queue full: {self.dropped} joins left for the next sweep")
+                self.dropped = 0
+
+            for guild_id, members in pending.items():
+                batch = list(members.values())
+                for start in range(0, len(batch), self.max_batch):
+                    self.batches += 1
+                    try:
+                        await self.evaluate(guild_id, batch[start:start + self.max_batch])
+                    except Exception as e:
+                        logger.error(f"Error checking a batch of joins in server {guild_id}: {e}")
+
+    async def _run(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            if not self._count:
+                continue
+
+            # Keep the window open from the first join, closing early once a batch is full
+            remaining = self.window - (time.monotonic() - self._opened)
+            if remaining > 0 and self._count < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            await self.flush()
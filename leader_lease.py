@@ -0,0 +1,161 @@
+import argparse
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("MemberCheckBot")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    token INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class LeaseLost(Exception):
+    """Raised when a write is fenced off because another instance has taken the lease since"""
+
+
+class LeaderLease:
+    """
+    Leadership among bot instances sharing one SQLite database: the holder renews a lease every few seconds,
+    and when it stops another instance takes over once the lease has expired
+    Every change of holder increments the fencing token; check() refuses writes made under an older one
+    """
+
+    def __init__(self, path, holder, name="leader", ttl=15.0):
+        self.path = path
+        self.holder = holder
+        self.name = name
+        self.ttl = ttl
+        # The fencing token while this instance holds the lease, otherwise None
+        self.token = None
+        # (holder, token, expires_at) as last read from the database, whoever holds it
+        self.current = None
+        self.acquired = 0
+        self._valid_until = 0.0
+        self._conn = None
+        self._conn_lock = threading.Lock()
+
+    @property
+    def is_leader(self):
+        """True while this instance holds the lease and its last renewal has not run out"""
+        return self.token is not None and time.monotonic() < self._valid_until
+
+    def open(self):
+        """Open the database and create the lease table"""
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        with self._conn_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def renew(self):
+        """
+        Extend the lease if this instance holds it, or take it if it is free or expired; returns is_leader
+        Blocks on the database, so run it in an executor
+        """
+        # Counted from before the write, so this instance never believes in the lease for longer than the database does
+        started = time.monotonic()
+        now = time.time()
+        with self._conn_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT holder, token, expires_at FROM leases WHERE name = ?", (self.name,)
+                ).fetchone()
+                if row is not None and row[:2] == (self.holder, self.token):
+                    token = self.token
+                elif row is None or row[2] <= now:
+                    token = (row[1] if row else 0) + 1
+                else:
+                    token = None
+                if token is not None:
+                    row = (self.holder, token, now + self.ttl)
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO leases (name, holder, token, expires_at) VALUES (?, ?, ?, ?)",
+                        (self.name,) + row
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        self.current = row
+        if token is not None and token != self.token:
+            self.acquired += 1
+            logger.info(f"Took the {self.name} lease as {self.holder} (fencing token {token})")
+        self.token = token
+        self._valid_until = started + self.ttl if token is not None else 0.0
+        return self.is_leader
+
+    def check(self, conn):
+        """Raise LeaseLost unless this instance still holds the lease; call it inside the transaction it fences"""
+        row = conn.execute("SELECT holder, token FROM leases WHERE name = ?", (self.name,)).fetchone()
+        if self.token is None or row != (self.holder, self.token):
+            raise LeaseLost(f"{self.holder} no longer holds the {self.name} lease (now {row[0] if row else 'nobody'})")
+
+    def release(self):
+        """Expire the lease straight away if this instance holds it, so a standby takes over at its next renewal"""
+        if self._conn is None or self.token is None:
+            return
+        with self._conn_lock:
+            self._conn.execute(
+                "UPDATE leases SET expires_at = 0 WHERE name = ? AND holder = ? AND token = ?",
+                (self.name, self.holder, self.token)
+            )
+        self.token = None
+        self._valid_until = 0.0
+
+    def describe(self):
+        """One line for !status"""
+        if self.current is None:
+            return f"{self.holder}: lease not read yet"
+        holder, token, expires_at = self.current
+        role = "leader" if self.is_leader else f"standby, {holder} leads"
+        return f"{self.holder}: {role} (fencing token {token}, lease expires in {max(0, expires_at - time.time()):.0f}s)"
+
+    def close(self):
+        self.release()
+        if self._conn is not None:
+            with self._conn_lock:
+                self._conn.close()
+            self._conn = None
+
+
+def main():
+    """Contend for a lease from the command line, e.g. in two terminals, printing every change of leader"""
+    parser = argparse.ArgumentParser(description="Contend for the bot's leader lease and print who holds it")
+    parser.add_argument("db", help="SQLite database shared by the instances (the bot's WARNINGS_DB)")
+    parser.add_argument("--holder", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--name", default="leader")
+    parser.add_argument("--ttl", type=float, default=15.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    lease = LeaderLease(args.db, args.holder, args.name, args.ttl)
+    lease.open()
+    leading = None
+    try:
+        while True:
+            try:
+                lease.renew()
+            except sqlite3.Error as e:
+                logger.error(f"Could not renew the lease: {e}")
+            if lease.is_leader != leading:
+                leading = lease.is_leader
+                logger.info(lease.describe())
+            time.sleep(args.ttl / 3)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        lease.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import atexit
+import contextvars
+import copy
+import datetime
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Fields copied into JSON lines when a log call passes them in extra= (or sweep_id from the running sweep)
+STRUCTURED_FIELDS = ("user_id", "guild_id", "action", "sweep_id")
+
+# ID of the sweep the current task is running, attached to every record it logs
+current_sweep = contextvars.ContextVar("current_sweep", default=None)
+
+
+class SweepContextFilter(logging.Filter):
+    """Stamp records with the current sweep ID; runs in the logging task, before the queue handoff"""
+
+    def filter(self, record):
+        if getattr(record, "sweep_id", None) is None:
+            record.sweep_id = current_sweep.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the structured fields when they are set"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the traceback separate from the message, so JSON lines can store it as a field"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotate when the file passes max_bytes or has been written to for rotate_seconds, gzipping rotated files"""
+
+    def __init__(self, filename, max_bytes=0, backup_count=0, rotate_seconds=0, compress=True):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.rotate_seconds = rotate_seconds
+        self.opened_at = time.time()
+        if compress:
+            self.namer = lambda name: f"{name}.gz"
+            self.rotator = _gzip_rotator
+
+    def shouldRollover(self, record):
+        if self.rotate_seconds and time.time() - self.opened_at >= self.rotate_seconds:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self.opened_at = time.time()
+
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def setup_logging(path="bot.log", level=logging.INFO, fmt="text", max_bytes=0, backup_count=0,
+                  rotate_seconds=0, compress=True):
+    """
+    Send all logging through a queue to a writer thread with console and rotating file output
+    Does nothing if logging is already configured (like logging.basicConfig); returns the started QueueListener
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT)
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers = [console]
+    if path:
+        file_handler = CompressingRotatingFileHandler(path, max_bytes, backup_count, rotate_seconds, compress)
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+
+    # Callers only pay for a queue put; formatting and disk writes happen on the listener thread
+    log_queue = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(log_queue)
+    queue_handler.addFilter(SweepContextFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
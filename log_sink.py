@@ -0,0 +1,138 @@
+import asyncio
+import collections
+import datetime
+import logging
+import time
+
+logger = logging.getLogger("MemberCheckBot")
+
+# A single log line waiting to be posted to the log channel
+LogEntry = collections.namedtuple("LogEntry", ["level", "message", "error", "timestamp"])
+
+# Discord limits for a single message
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_CHARS_PER_MESSAGE = 6000
+MAX_DIGEST_CHARS = 3500
+
+
+class LogSink:
+    """Bounded queue of log entries, posted to Discord in batches by a background task"""
+
+    def __init__(self, send, build_embed, build_digest, max_queue=1000, flush_interval=5.0, overflow="summarize"):
+        # send(embeds) posts up to ten embeds as one message
+        self.send = send
+        # build_embed(entry) turns a WARNING/ERROR/CRITICAL entry into an embed
+        self.build_embed = build_embed
+        # build_digest(lines, timestamp) turns all INFO/DEBUG lines of a batch into one embed
+        self.build_digest = build_digest
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        # "drop" silently discards entries when the queue is full, "summarize" reports how many were lost
+        self.overflow = overflow
+        self.dropped = collections.Counter()
+        self.sent_messages = 0
+        # Time spent turning entries into embeds, for profiling
+        self.build_seconds = 0.0
+        self._queue = None
+        self._task = None
+        self._flush_lock = None
+
+    def put(self, level, message, error=None):
+        """Enqueue a log entry without waiting on the network"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+
+        try:
+            self._queue.put_nowait(LogEntry(level, message, error, datetime.datetime.now()))
+        except asyncio.QueueFull:
+            self.dropped[level] += 1
+
+    def qsize(self):
+        """Return the number of entries waiting to be posted"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        """Start the background flusher on the running event loop"""
+        if self._task is not None and not self._task.done():
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        """Stop the background flusher"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def flush(self):
+        """Post everything queued so far, e.g. at the end of a sweep"""
+        if self._queue is None or self._flush_lock is None:
+            return
+
+        async with self._flush_lock:
+            entries = []
+            while not self._queue.empty():
+                entries.append(self._queue.get_nowait())
+
+            started = time.perf_counter()
+            embeds = self._build_batch(entries)
+            self.build_seconds += time.perf_counter() - started
+            for message in self._pack(embeds):
+                try:
+                    await self.send(message)
+                    self.sent_messages += 1
+                except Exception as e:
+                    logger.error(f"Failed to send log to channel: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Log sink flush failed: {e}")
+
+    def _build_batch(self, entries):
+        embeds = []
+        digest_lines = []
+        for entry in entries:
+            if entry.level in ("INFO", "DEBUG") and not entry.error:
+                digest_lines.append(f"`{entry.timestamp:%H:%M:%S}` {entry.message}")
+            else:
+                embeds.append(self.build_embed(entry))
+
+        if self.dropped and self.overflow == "summarize":
+            counts = ", ".join(f"{count} {level}" for level, count in self.dropped.items())
+            digest_lines.append(f"Log queue full: dropped {sum(self.dropped.values())} entries ({counts})")
+        if self.dropped:
+            self.dropped.clear()
+
+        if digest_lines:
+            embeds.insert(0, self.build_digest(_truncate_lines(digest_lines), datetime.datetime.now()))
+        return embeds
+
+    def _pack(self, embeds):
+        # Group embeds into messages within Discord's per-message count and size limits
+        message = []
+        size = 0
+        for embed in embeds:
+            embed_size = len(embed)
+            if message and (len(message) >= MAX_EMBEDS_PER_MESSAGE or size + embed_size > MAX_CHARS_PER_MESSAGE):
+                yield message
+                message = []
+                size = 0
+            message.append(embed)
+            size += embed_size
+        if message:
+            yield message
+
+
+def _truncate_lines(lines):
+    text = ""
+    for index, line in enumerate(lines):
+        if len(text) + len(line) + 1 > MAX_DIGEST_CHARS:
+            return text + f"... and {len(lines) - index} more"
+        text += line + "\n"
+    return text
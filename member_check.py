@@ -2,143 +2,1092 @@ import discord
 from discord.ext import commands, tasks
 import os
 import asyncio
+import io
 from dotenv import load_dotenv
-import datetime
 import logging
 import traceback
 import re
+import socket
+import sqlite3
+import time
 
-# from sheet_logger import log_to_sheet
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler(), logging.FileHandler("bot.log")]
-)
-logger = logging.getLogger("MemberCheckBot")
+from action_executor import ActionExecutor
+from channel_access import ChannelAccess
+from circuit_breaker import CircuitBreaker
+from compact_index import BOT_FLAG, CompactMemberIndex
+from member_snapshot import read_snapshot, write_snapshot
+from incremental_sweep import ActionBudget, SweepCursor
+from join_admission import JoinAdmission
+from leader_lease import LeaderLease
+from sweep_jobs import SweepJobs
+from deadline_scheduler import DeadlineScheduler
+from dm_outbox import PRIORITY_KICK, PRIORITY_WARNING, DMOutbox
+from event_journal import JOIN, REMOVE, UPDATE, EventJournal
+from enforcement_planner import plan_enforcement
+from guild_config import load_targets
+from profiler import SlowCallbackMonitor, capture_profile
+from policy import REASON_ACCOUNT_AGE, REASON_MISSING_ROLE, in_join_grace
+from log_setup import current_sweep, setup_logging
+from log_sink import LogSink
+from metrics import LoopLagMonitor, MetricsRegistry, start_http_server
+from reference_index import ReferenceIndex
+from retry_queue import RetryQueue
+from sharding import RemoteReferences, ShardConfig
+from sheet_logger import log_to_sheet, sheet_logger
+from warning_store import WarningStore
 
 # Load environment variables
 load_dotenv()
 
+# Configure logging: records are queued and written to the console and bot.log by a background thread
+setup_logging(
+    path=os.getenv("LOG_FILE", "bot.log"),
+    fmt=os.getenv("LOG_FORMAT", "text").lower(),
+    max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 2 ** 20))),
+    backup_count=int(os.getenv("LOG_BACKUP_COUNT", "10")),
+    rotate_seconds=float(os.getenv("LOG_ROTATE_HOURS", "24")) * 3600,
+    compress=os.getenv("LOG_COMPRESS", "true").lower() == "true"
+)
+logger = logging.getLogger("MemberCheckBot")
+
 # Bot configuration from environment variables
 TOKEN = os.getenv("TOKEN")
-SERVER_A_ID = int(os.getenv("SERVER_A_ID", "0"))
-SERVER_B_ID = int(os.getenv("SERVER_B_ID", "0"))
-ROLE_X_ID = int(os.getenv("ROLE_X_ID", "0"))
-EXEMPT_ROLES = [int(role_id) for role_id in os.getenv("EXEMPT_ROLES", "").split(",") if role_id]
-ACTIVE_CRITERIA = int(os.getenv("ACTIVE_CRITERIA", "1"))
-INVITE_LINK = os.getenv("INVITE_LINK", "")
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", "3600"))
-WARNING_CHANNEL_ID = int(os.getenv("WARNING_CHANNEL_ID", "0"))
-WARNING_SECONDS = float(os.getenv("WARNING_SECONDS", "16800"))
 LOG_CHANNEL_ID = int(os.getenv("LOG_CHANNEL_ID", "0"))
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "1000"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "5"))
+LOG_OVERFLOW_POLICY = os.getenv("LOG_OVERFLOW_POLICY", "summarize").lower()
+ACTION_DM_CONCURRENCY = int(os.getenv("ACTION_DM_CONCURRENCY", "5"))
+ACTION_CHANNEL_CONCURRENCY = int(os.getenv("ACTION_CHANNEL_CONCURRENCY", "2"))
+ACTION_KICK_CONCURRENCY = int(os.getenv("ACTION_KICK_CONCURRENCY", "5"))
+ACTION_GLOBAL_RATE = float(os.getenv("ACTION_GLOBAL_RATE", "40"))
+ACTION_BATCH_SIZE = int(os.getenv("ACTION_BATCH_SIZE", "50"))
+ACTION_RATELIMIT_TIMEOUT = float(os.getenv("ACTION_RATELIMIT_TIMEOUT", "10"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+WARNINGS_DB = os.getenv("WARNINGS_DB", "warnings.db")
+WARNING_FLUSH_INTERVAL = float(os.getenv("WARNING_FLUSH_INTERVAL", "5"))
+REMOTE_INDEX_TTL = float(os.getenv("REMOTE_INDEX_TTL", "900"))
+REMOTE_MEMBER_TTL = float(os.getenv("REMOTE_MEMBER_TTL", "60"))
+SLIM_CACHE = os.getenv("SLIM_CACHE", "false").lower() == "true"
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "600"))
+SNAPSHOT_MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "86400"))
+SWEEP_MODE = os.getenv("SWEEP_MODE", "full").lower()
+SWEEP_SLICE_SIZE = int(os.getenv("SWEEP_SLICE_SIZE", "500"))
+SWEEP_ACTIONS_PER_MINUTE = int(os.getenv("SWEEP_ACTIONS_PER_MINUTE", "0"))
+JOURNAL_FILE = os.getenv("JOURNAL_FILE", "")
+JOIN_BATCH_WINDOW = float(os.getenv("JOIN_BATCH_WINDOW", "2"))
+JOIN_BATCH_MAX = int(os.getenv("JOIN_BATCH_MAX", "500"))
+JOIN_QUEUE_MAX = int(os.getenv("JOIN_QUEUE_MAX", "10000"))
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "60"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "20"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_SLOW_CALL = float(os.getenv("BREAKER_SLOW_CALL", "10"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "120"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "900"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "8"))
+DM_CHANNEL_CACHE = int(os.getenv("DM_CHANNEL_CACHE", "10000"))
+DM_MAX_ATTEMPTS = int(os.getenv("DM_MAX_ATTEMPTS", "5"))
+KICK_DM_TIMEOUT = float(os.getenv("KICK_DM_TIMEOUT", "10"))
+HA_MODE = os.getenv("HA_MODE", "false").lower() == "true"
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+LEASE_TTL = float(os.getenv("LEASE_TTL", "15"))
+SLOW_CALLBACK_MS = float(os.getenv("SLOW_CALLBACK_MS", "0"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+# Members mentioned in a join batch's warning channel post before it says "and N more"
+JOIN_MENTION_LIMIT = 40
 MOD_ROLE_IDS = os.getenv("MOD_ROLE_IDS",[817330791176470548, 817333718870917130]).upper()
 
 REFERENCE_SERVER_NAME = os.getenv("REFERENCE_SERVER_NAME", "Reference Server Name Not Set")
-TARGET_SERVER_NAME = os.getenv("TARGET_SERVER_NAME", "Target Server Name Not Set")
+
+# Target servers and the reference servers each one is checked against (GUILDS_CONFIG, or SERVER_A_ID/SERVER_B_ID)
+targets = load_targets()
+
+# Gateway sharding (SHARD_MODE, SHARD_COUNT, SHARD_IDS); in cluster mode this process only enforces targets on its shards
+shard_config = ShardConfig.from_env()
 
 # Set up intents
 intents = discord.Intents.default()
 intents.members = True
-intents.message_content = True
+# Prefix commands need message content; slim mode drops it and answers commands that mention the bot instead
+intents.message_content = not SLIM_CACHE
+
+# In slim mode discord.py caches no members; the bot keeps its own compact indexes instead
+cache_options = {}
+if SLIM_CACHE:
+    cache_options["member_cache_flags"] = discord.MemberCacheFlags.none()
+if SLIM_CACHE or SNAPSHOT_DIR:
+    # The indexes (restored from snapshots) answer checks right away and member lists are downloaded after on_ready
+    cache_options["chunk_guilds_at_startup"] = False
+
+# Rate limits longer than ACTION_RATELIMIT_TIMEOUT are raised so action_executor can pause the whole lane
+bot_class = commands.Bot if shard_config.mode == "none" else commands.AutoShardedBot
+bot = bot_class(
+    command_prefix=commands.when_mentioned_or('!') if SLIM_CACHE else '!',
+    intents=intents,
+    max_ratelimit_timeout=ACTION_RATELIMIT_TIMEOUT,
+    **cache_options,
+    **shard_config.bot_options()
+)
+
+# Metrics for the sweep and action paths, served in Prometheus format on METRICS_PORT and via !metrics
+metrics = MetricsRegistry()
+sweep_duration = metrics.histogram("sweep_duration_seconds", "Duration of a full member sweep")
+plan_duration = metrics.histogram("plan_duration_seconds", "Time spent computing a sweep's enforcement plan")
+member_check_duration = metrics.histogram("member_check_seconds", "Latency of a single member check")
+rest_calls = metrics.counter("rest_calls", "Discord REST calls by route", ["route"])
+rate_limited = metrics.counter("rate_limited", "Discord 429 responses seen")
+actions_taken = metrics.counter("actions", "Enforcement actions by kind and outcome", ["action", "outcome"])
+logs_sent = metrics.counter("logs", "send_log calls by level", ["level"])
+event_loop_lag = metrics.gauge("event_loop_lag_seconds", "Most recent event loop lag sample")
+loop_lag_monitor = LoopLagMonitor(interval=0.5, observe=event_loop_lag.set)
+
+# Where time goes, for diagnosing slow sweeps: sweep stages, REST waits, logging and event loop stalls
+sweep_stage_seconds = metrics.counter("sweep_stage_seconds", "Time full sweeps spent in each stage", ["stage"])
+rest_seconds = metrics.counter("rest_seconds", "Time spent waiting on Discord REST calls by route (summed over concurrent calls)", ["route"])
+send_log_seconds = metrics.counter("send_log_seconds", "Time spent in send_log calls")
+slow_callbacks = metrics.counter("slow_callbacks", "Event loop callbacks that ran longer than the slow callback threshold")
+# Installed at startup with SLOW_CALLBACK_MS set, otherwise only while !profile runs
+slow_callback_monitor = SlowCallbackMonitor(
+    threshold=(SLOW_CALLBACK_MS or 50) / 1000,
+    observe=lambda seconds, description: slow_callbacks.inc()
+)
+profile_lock = asyncio.Lock()
+metrics_runner = None
+
+# Log channel pipeline; send_log only enqueues and this posts in batches
+log_sink = LogSink(
+    lambda embeds: send_log_embeds(embeds),
+    lambda entry: build_log_embed(entry),
+    lambda lines, timestamp: build_log_digest(lines, timestamp),
+    max_queue=LOG_QUEUE_SIZE,
+    flush_interval=LOG_FLUSH_INTERVAL,
+    overflow=LOG_OVERFLOW_POLICY
+)
+
+# The log and warning channels and the bot's permissions in them, refreshed on role, channel and bot member updates
+channel_access = ChannelAccess(lambda channel_id: bot.get_channel(channel_id))
+
+# Warnings, DMs and kicks run in separate lanes with bounded concurrency and shared 429 handling
+action_executor = ActionExecutor(
+    {"dm": ACTION_DM_CONCURRENCY, "channel": ACTION_CHANNEL_CONCURRENCY, "kick": ACTION_KICK_CONCURRENCY},
+    global_rate=ACTION_GLOBAL_RATE
+)
+
+# HA_MODE: instances sharing WARNINGS_DB elect a leader through a lease stored there, and only the leader enforces
+# Cluster processes each elect their own leader for their block of shards
+leader_lease = LeaderLease(
+    WARNINGS_DB,
+    INSTANCE_ID,
+    name="leader" if shard_config.mode != "cluster" else f"leader-shards-{','.join(map(str, shard_config.shard_ids))}",
+    ttl=LEASE_TTL
+) if HA_MODE else None
+# Whether warning timers, retries, DMs and sweeps are running (they only run on the leader in HA mode)
+enforcing = False
+
+# Pending warnings, persisted to disk so they survive restarts; in HA mode writes are fenced by the lease
+warning_store = WarningStore(WARNINGS_DB, fence=leader_lease.check if leader_lease else None)
+
+# Warning and kick DMs, sent in the background in priority order and kept in WARNINGS_DB until delivered
+dm_outbox = DMOutbox(
+    WARNINGS_DB,
+    lambda user_id: bot.create_dm(discord.Object(id=user_id)),
+    lambda action: action_executor.run("dm", action),
+    workers=ACTION_DM_CONCURRENCY,
+    max_attempts=DM_MAX_ATTEMPTS,
+    channel_cache_size=DM_CHANNEL_CACHE,
+    fence=leader_lease.check if leader_lease else None
+)
+
+# Joins to target servers are checked in short batches (JOIN_BATCH_WINDOW=0 checks each join on its own)
+join_admission = JoinAdmission(
+    lambda guild_id, members: admit_join_batch(guild_id, members),
+    window=JOIN_BATCH_WINDOW,
+    max_batch=JOIN_BATCH_MAX,
+    max_pending=JOIN_QUEUE_MAX
+) if JOIN_BATCH_WINDOW > 0 else None
+
+# Optional record of the member events the bot consumes, replayable with replay_journal.py
+event_journal = EventJournal(JOURNAL_FILE) if JOURNAL_FILE else None
+
+# SWEEP_MODE=incremental: per-target cursors (persisted in warning_store) and the shared cap on sweep actions
+sweep_cursors = {}
+sweep_workers = {}
+sweep_budget = ActionBudget(SWEEP_ACTIONS_PER_MINUTE)
+
+# Full sweeps (scheduled or !checkall) run as jobs, one at a time per target server
+sweep_jobs = SweepJobs(on_stage=lambda stage, seconds: sweep_stage_seconds.inc(seconds, stage=stage))
+
+metrics.gauge("log_queue_depth", "Log entries waiting to be posted", function=lambda: log_sink.qsize())
+metrics.gauge("log_embed_seconds", "Time spent building log channel embeds", function=lambda: log_sink.build_seconds)
+metrics.gauge(
+    "action_queue_depth", "Actions waiting or running per executor lane", ["lane"],
+    function=lambda: {(lane.name,): lane.waiting + lane.in_flight for lane in action_executor.lanes.values()}
+)
+metrics.gauge("warnings_outstanding", "Pending warnings", function=lambda: warning_store.count())
+metrics.gauge("dm_outbox_depth", "DMs waiting to be sent", function=lambda: dm_outbox.qsize())
+metrics.gauge("join_queue_depth", "Joins waiting for a batch check", function=lambda: join_admission.qsize() if join_admission else 0)
+metrics.gauge(
+    "sweep_lap_progress", "Fraction of the current incremental sweep lap checked", ["guild"],
+    function=lambda: {(str(guild_id),): cursor.progress() for guild_id, cursor in sweep_cursors.items()}
+)
+
+
+async def counted_request(route, **kwargs):
+    """Wrap discord.py's HTTP client to count REST calls by route and feed their outcome to the circuit breaker"""
+    route_name = f"{route.method} {route.path}"
+    rest_calls.inc(route=route_name)
+    started = time.perf_counter()
+    failed = False
+    try:
+        return await http_request(route, **kwargs)
+    except discord.HTTPException as e:
+        # 429s are counted by RateLimitCounter, which also sees the ones discord.py retried
+        # 4xx answers (not found, forbidden, rate limited) mean the API is up
+        failed = e.status >= 500
+        raise
+    except Exception:
+        # Connection errors and timeouts
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        rest_seconds.inc(elapsed, route=route_name)
+        circuit_breaker.record(failed, elapsed)
+
+http_request = bot.http.request
+bot.http.request = counted_request
+
+
+class RateLimitCounter(logging.Handler):
+    """
+    Count 429 responses from Discord; discord.py logs each one it receives, then retries it or raises RateLimited
+    A RateLimited raised before sending (the local bucket would be exceeded) is not logged, so it is not counted
+    """
+    
+    def emit(self, record):
+        # Match the message template, not the formatted text: the URL's snowflakes can contain "429"
+        if isinstance(record.msg, str) and "responded with 429" in record.msg:
+            rate_limited.inc()
+
+logging.getLogger("discord.http").addHandler(RateLimitCounter(logging.WARNING))
+
+# Membership and roles of every reference server, kept current from gateway events and shared by all targets using it
+index_class = CompactMemberIndex if SLIM_CACHE else ReferenceIndex
+reference_indexes = {
+    reference.guild_id: index_class(reference.guild_id)
+    for target in targets.values()
+    for reference in target.references
+}
+
+# Membership of the target servers in slim and snapshot mode (otherwise discord.py's member cache is used)
+target_indexes = {
+    guild_id: CompactMemberIndex(guild_id, join_window=target.policy.max_join_age) for guild_id, target in targets.items()
+} if SLIM_CACHE or SNAPSHOT_DIR else {}
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Index -> gateway changes seen while it is being reseeded, replayed on top of the downloaded member list
+reseeding = {}
 
-# Store users who have received warnings with timestamps
-warned_users = {}
+# Seeding of this process's indexes after connecting; sweeps wait for it
+index_warmup = None
+
+metrics.gauge(
+    "reference_index_members", "Members held in each reference server index", ["guild"],
+    function=lambda: {(str(guild_id),): len(index) for guild_id, index in reference_indexes.items()}
+)
+metrics.gauge(
+    "compact_index_bytes", "Approximate memory of each slim-mode member index", ["guild"],
+    function=lambda: {
+        (str(index.guild_id),): index.memory_bytes()
+        for index in list(reference_indexes.values()) + list(target_indexes.values())
+        if isinstance(index, CompactMemberIndex)
+    }
+)
+
+# Reference servers on another process's shards are read through REST
+remote_references = RemoteReferences(bot, index_ttl=REMOTE_INDEX_TTL, member_ttl=REMOTE_MEMBER_TTL)
+
+# Kick timers for pending warnings, keyed by (target guild ID, user ID)
+warning_scheduler = DeadlineScheduler(lambda key: expire_warning(*key))
+
+# Member checks that could not reach Discord, keyed by (target guild ID, user ID, immediate)
+retry_queue = RetryQueue(
+    lambda key: retry_check(*key),
+    base_delay=RETRY_BASE_DELAY,
+    max_delay=RETRY_MAX_DELAY,
+    max_attempts=RETRY_MAX_ATTEMPTS
+)
+
+# Pauses warnings and kicks while Discord's API is failing, so errors are never read as "not a member"
+circuit_breaker = CircuitBreaker(
+    window=BREAKER_WINDOW,
+    min_calls=BREAKER_MIN_CALLS,
+    error_rate=BREAKER_ERROR_RATE,
+    slow_call=BREAKER_SLOW_CALL,
+    cooldown=BREAKER_COOLDOWN,
+    on_close=lambda: reconcile_after_outage()
+)
+metrics.gauge("retry_queue_depth", "Member checks waiting for a retry", function=lambda: len(retry_queue))
+metrics.gauge("circuit_open", "1 while enforcement is paused by the circuit breaker", function=lambda: int(not circuit_breaker.is_closed))
+metrics.gauge("is_leader", "1 while this instance enforces (always without HA_MODE)", function=lambda: int(is_leader()))
+
+# (target guild ID, user ID) pairs queued for an event-driven recheck
+recheck_queue = None
+recheck_pending = set()
 
 @bot.event
 async def on_ready():
-    logger.info(f"Bot logged in as {bot.user.name} ({bot.user.id})")
-    logger.info(f"Active criteria: {ACTIVE_CRITERIA}")
+    logger.info(f"Bot logged in as {bot.user.name} ({bot.user.id}), {shard_config.describe()}")
     
-    # Check if both servers are accessible
-    server_a = bot.get_guild(SERVER_A_ID)
-    server_b = bot.get_guild(SERVER_B_ID)
+    # Check that every configured server is accessible
+    for guild_id in reference_indexes:
+        server = bot.get_guild(guild_id)
+        if not shard_config.owns(guild_id):
+            logger.info(f"Reference server {guild_id} is on another shard process and will be read through the API")
+        elif not server:
+            logger.critical(f"Cannot access reference server (ID: {guild_id})")
+        else:
+            logger.info(f"Connected to reference server: {server.name}")
     
-    REFERENCE_SERVER_NAME = server_a.name if server_a else REFERENCE_SERVER_NAME
-    TARGET_SERVER_NAME = server_b.name if server_b else TARGET_SERVER_NAME
+    for target in owned_targets():
+        server = bot.get_guild(target.guild_id)
+        if not server:
+            logger.critical(f"Cannot access target server (ID: {target.guild_id})")
+        else:
+            target.name = server.name
+            logger.info(f"Connected to target server: {server.name} ({len(target.rules)} rules, "
+                        f"references: {', '.join(reference_name(guild_id) for guild_id in target.reference_ids)})")
     
-    if not server_a:
-        logger.critical(f"Cannot access reference server A (ID: {SERVER_A_ID})")
-    else:
-        logger.info(f"Connected to reference server: {server_a.name}")
+    # Start metrics collection and the local metrics endpoint
+    global metrics_runner
+    loop_lag_monitor.start()
+    if SLOW_CALLBACK_MS:
+        slow_callback_monitor.install()
+    if METRICS_PORT and metrics_runner is None:
+        try:
+            metrics_runner = await start_http_server(metrics, METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            logger.error(f"Could not start metrics endpoint on {METRICS_HOST}:{METRICS_PORT}: {e}")
     
-    if not server_b:
-        logger.critical(f"Cannot access target server B (ID: {SERVER_B_ID})")
-    else:
-        logger.info(f"Connected to target server: {server_b.name}")
+    # Start posting queued logs to the log channel and the Google Sheet
+    log_sink.start()
+    # Only once: on_ready fires again after a reconnect
+    if not sheet_logger.configured:
+        sheet_logger.configure()
+        await sheet_logger.start()
+    
+    # Seed this process's indexes from the member lists, all at once
+    # Indexes restored from a snapshot already answer checks, so they are reconciled in the background
+    global index_warmup
+    index_warmup = asyncio.ensure_future(warm_indexes())
+    if not any(index.restored_at for _, index in snapshot_indexes()):
+        await index_warmup
+    if SNAPSHOT_DIR and not snapshot_task.is_running():
+        snapshot_task.start()
     
     # New permission check
-    await send_log(f"Bot {bot.user.name} is starting up", "INFO")
+    send_log(f"Bot {bot.user.name} is starting up", "INFO")
     permissions_ok = await check_bot_permissions()
     if not permissions_ok:
-        await send_log("Bot is missing required permissions. Some features may not work.", "WARNING")
+        send_log("Bot is missing required permissions. Some features may not work.", "WARNING")
+    
+    # Start the event-driven recheck worker
+    global recheck_queue
+    if recheck_queue is None:
+        recheck_queue = asyncio.Queue()
+        bot.loop.create_task(recheck_worker())
+    
+    # Start checking joins in batches
+    if join_admission is not None:
+        join_admission.start()
+    
+    # Start writing warning changes to disk
+    if not flush_warnings_task.is_running():
+        flush_warnings_task.start()
+    
+    # Start enforcing, or in HA mode contend for the leader lease and enforce while holding it
+    if leader_lease is None:
+        start_enforcement()
+    elif not lease_task.is_running():
+        lease_task.start()
+
+def is_leader():
+    """Return True if this instance enforces: always without HA_MODE, otherwise while it holds the leader lease"""
+    return leader_lease is None or leader_lease.is_leader
+
+def start_enforcement():
+    """Start sending DMs, the kick timers of pending warnings, check retries and sweeps"""
+    global enforcing
+    enforcing = True
+    
+    # Start sending queued DMs, including any left from the last run
+    dm_outbox.start()
+    
+    # Arm a kick timer for every pending warning of a current member
+    for target in owned_targets():
+        server = bot.get_guild(target.guild_id)
+        if not server:
+            continue
+        for user_id, warning in warning_store.pending(target.guild_id).items():
+            if is_target_member(server, user_id):
+                warning_scheduler.schedule((target.guild_id, user_id), warning.deadline)
+    warning_scheduler.start()
+    retry_queue.start()
+    
+    # Start the periodic check task, or one incremental sweep per target
+    if SWEEP_MODE == "incremental":
+        for target in owned_targets():
+            if target.guild_id not in sweep_workers:
+                sweep_workers[target.guild_id] = bot.loop.create_task(incremental_sweep_worker(target))
+    elif not check_members_task.is_running():
+        # on_ready fires again after a reconnect, when the loop is already running
+        check_members_task.start()
+
+def stop_enforcement():
+    """Stop what start_enforcement started and cancel sweeps in flight (actions already sent stand)"""
+    global enforcing
+    enforcing = False
+    dm_outbox.stop()
+    warning_scheduler.stop()
+    retry_queue.stop()
+    for worker in sweep_workers.values():
+        worker.cancel()
+    sweep_workers.clear()
+    for job in list(sweep_jobs.active.values()):
+        sweep_jobs.cancel(job)
+
+@tasks.loop(seconds=LEASE_TTL / 3)
+async def lease_task():
+    """Renew or take the leader lease, and start or stop enforcing when this instance gains or loses it"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, leader_lease.renew)
+    except sqlite3.Error as e:
+        # The lease runs out on its own if renewals keep failing
+        logger.error(f"Could not renew the leader lease in {WARNINGS_DB}: {e}")
+    
+    if leader_lease.is_leader and not enforcing:
+        take_leadership()
+    elif enforcing and not leader_lease.is_leader:
+        step_down()
+
+def take_leadership():
+    """Start enforcing after winning the lease, from the state the previous leader wrote"""
+    send_log(f"Instance {INSTANCE_ID} is now the leader (fencing token {leader_lease.token}) and enforcing", "WARNING")
+    warning_store.load()
+    dm_outbox.load()
+    start_enforcement()
     
-    # Start the periodic check task
-    check_members_task.start()
+    # Catch up on joins and departures nobody acted on while the lease changed hands
+    reconcile_targets("takeover")
+
+def step_down():
+    """Stop enforcing after losing the lease, e.g. when renewals stalled long enough for another instance to take over"""
+    holder = leader_lease.current[0] if leader_lease.current else "nobody"
+    send_log(f"Instance {INSTANCE_ID} lost the leader lease (held by {holder}), standing by", "CRITICAL")
+    stop_enforcement()
+    
+    # Changes not yet written would be refused by the fencing token; the new leader works from what is on disk
+    warning_store.load()
+    dm_outbox.load()
 
 @bot.event
 async def on_member_join(member):
-    """Check members when they join server B"""
-    if member.guild.id != SERVER_B_ID:
+    """Check members when they join a target server"""
+    guild_id = member.guild.id
+    if event_journal and (guild_id in targets or guild_id in reference_indexes):
+        event_journal.record_member(JOIN, member)
+    
+    if guild_id in target_indexes:
+        index_update(target_indexes[guild_id], member)
+    
+    if guild_id in reference_indexes:
+        index_update(reference_indexes[guild_id], member)
+        for target in targets_using(guild_id):
+            if warning_store.contains(target.guild_id, member.id):
+                queue_recheck(target.guild_id, member.id, "joined the main server")
+    
+    if guild_id not in targets:
         return
     
-    logger.info(f"Member joined Server B: {member.name} (ID: {member.id})")
+    logger.info(f"Member joined {targets[guild_id].name}: {member.name} (ID: {member.id})", extra=member_fields(member, "join"))
+    if not is_leader():
+        # Standbys only keep their indexes current; a new leader's takeover sweep covers joins during a failover
+        return
+    if join_admission is not None:
+        # Checked with the other joins of the next batch; when the queue is full the next sweep checks them
+        join_admission.put(member)
+        return
     await check_single_member(member, immediate=True)
 
+@bot.event
+async def on_raw_member_remove(payload):
+    """Recheck members in the target servers as soon as they leave a reference server"""
+    # The raw event also fires for members discord.py does not cache (slim mode)
+    guild_id = payload.guild_id
+    user_id = payload.user.id
+    if event_journal and (guild_id in targets or guild_id in reference_indexes):
+        event_journal.record(REMOVE, guild_id, user_id)
+    
+    if guild_id in target_indexes:
+        index_remove(target_indexes[guild_id], user_id)
+    
+    if guild_id in reference_indexes:
+        index_remove(reference_indexes[guild_id], user_id)
+        for target in targets_using(guild_id):
+            queue_recheck(target.guild_id, user_id, "left the main server")
+    
+    if guild_id in targets:
+        # Keep the warning so a rejoin is kicked straight away, but stop the timer
+        warning_scheduler.cancel((guild_id, user_id))
+
+@bot.event
+async def on_member_update(before, after):
+    """Recheck members in the target servers as soon as they lose the required role in a reference server"""
+    if after.id == bot.user.id:
+        # The bot's own roles decide what it may post
+        refresh_channel_access(after.guild.id)
+    handle_member_update(after)
+
+@bot.event
+async def on_guild_role_update(before, after):
+    refresh_channel_access(after.guild.id)
+
+@bot.event
+async def on_guild_role_delete(role):
+    refresh_channel_access(role.guild.id)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    # Also covers categories, whose overwrites synced channels inherit
+    refresh_channel_access(after.guild.id)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    refresh_channel_access(channel.guild.id)
+
+@bot.event
+async def on_guild_available(guild):
+    refresh_channel_access(guild.id)
+
+def refresh_channel_access(guild_id):
+    """Recheck the bot's access to the channels it posts to in a server, reporting any change straight away"""
+    for channel_id, old, new in channel_access.invalidate(guild_id):
+        problem = channel_access.describe(channel_id, new)
+        if problem is None:
+            send_log(f"Access to channel <#{channel_id}> restored", "INFO")
+        elif channel_id == LOG_CHANNEL_ID:
+            # The log channel can't carry news of its own loss
+            logger.critical(f"Lost access to the log channel: {problem}")
+        else:
+            send_log(f"Lost access to a warning channel: {problem}", "CRITICAL")
+
+def handle_member_update(member):
+    """Index a member's new roles and queue rechecks where the required role was lost or gained"""
+    guild_id = member.guild.id
+    if event_journal and (guild_id in targets or guild_id in reference_indexes):
+        event_journal.record_member(UPDATE, member)
+    
+    if guild_id in target_indexes:
+        index_update(target_indexes[guild_id], member)
+    
+    if guild_id not in reference_indexes:
+        return
+    index = reference_indexes[guild_id]
+    
+    # Compare against the indexed roles, which are the roles before this update
+    old_roles = index.roles_of(member.id)
+    index_update(index, member)
+    new_roles = index.roles_of(member.id)
+    
+    for target in targets_using(guild_id):
+        # Only the roles the target's rules mention are in the masks
+        had = target.policy.guild_mask(guild_id, old_roles)
+        has = target.policy.guild_mask(guild_id, new_roles)
+        if had & ~has:
+            queue_recheck(target.guild_id, member.id, "lost a required role in the main server")
+        elif has != had and warning_store.contains(target.guild_id, member.id):
+            queue_recheck(target.guild_id, member.id, "got a required role in the main server")
+
+def parse_member_update(data):
+    """Gateway parser for GUILD_MEMBER_UPDATE in slim mode, where discord.py drops updates for uncached members"""
+    server = bot._connection._get_guild(int(data["guild_id"]))
+    # Cached members (e.g. the bot itself) still get on_member_update from the original parser
+    cached = server is not None and server.get_member(int(data["user"]["id"])) is not None
+    parse_member_update_uncached(data)
+    if server is not None and not cached:
+        handle_member_update(discord.Member(data=data, guild=server, state=bot._connection))
+
+def index_update(index, member):
+    """Record a member's current roles in an index, and again after a reseed that is in progress"""
+    index.update(member)
+    if index in reseeding:
+        reseeding[index].append(member)
+
+def index_remove(index, user_id):
+    """Record a member leaving in an index, and again after a reseed that is in progress"""
+    index.remove(user_id)
+    if index in reseeding:
+        reseeding[index].append(user_id)
+
+if SLIM_CACHE or SNAPSHOT_DIR:
+    parse_member_update_uncached = bot._connection.parsers["GUILD_MEMBER_UPDATE"]
+    bot._connection.parsers["GUILD_MEMBER_UPDATE"] = parse_member_update
+
+def owned_targets():
+    """Return the targets whose gateway events this process receives"""
+    return [target for target in targets.values() if shard_config.owns(target.guild_id)]
+
+def targets_using(reference_id):
+    """Return this process's targets that are checked against the given reference server"""
+    return [target for target in owned_targets() if reference_id in target.reference_ids]
+
+def queue_recheck(guild_id, user_id, cause):
+    """Queue a single user for a check in a target server"""
+    key = (guild_id, user_id)
+    if recheck_queue is None or key in recheck_pending or not is_leader():
+        return
+    
+    recheck_pending.add(key)
+    recheck_queue.put_nowait((guild_id, user_id, cause))
+
+async def recheck_worker():
+    """Check queued users in the target servers one at a time as events come in"""
+    while True:
+        guild_id, user_id, cause = await recheck_queue.get()
+        recheck_pending.discard((guild_id, user_id))
+        
+        try:
+            server = bot.get_guild(guild_id)
+            member = await resolve_member(server, user_id) if server else None
+            if member and not member.bot:
+                logger.info(f"Rechecking member {member.name} (ID: {member.id}) in {server.name}: {cause}", extra=member_fields(member, "recheck"))
+                await check_single_member(member)
+        except Exception as e:
+            logger.error(
+                f"Error rechecking user {user_id} in server {guild_id}: {e}",
+                extra={"user_id": user_id, "guild_id": guild_id, "action": "recheck"}
+            )
+        finally:
+            recheck_queue.task_done()
+
+async def prepare_reference_indexes(target):
+    """Make sure every reference index a target needs is seeded, refetching remote ones when stale"""
+    for guild_id in target.reference_ids:
+        if not shard_config.owns(guild_id):
+            try:
+                reference_indexes[guild_id] = await remote_references.refresh_index(reference_indexes[guild_id])
+            except discord.HTTPException as e:
+                logger.error(f"Failed to fetch members of remote reference server {guild_id}: {e}")
+        elif not reference_indexes[guild_id].warm:
+            await warm_reference_index(guild_id)
+
+async def warm_indexes():
+    """Seed the indexes of this process's reference and target servers from their member lists"""
+    await asyncio.gather(
+        *(warm_reference_index(guild_id) for guild_id in reference_indexes if shard_config.owns(guild_id)),
+        *(warm_target_index(target.guild_id) for target in owned_targets() if target.guild_id in target_indexes)
+    )
+
+async def indexes_ready():
+    """Wait for the indexes to be seeded after connecting"""
+    if index_warmup is not None and not index_warmup.done():
+        await asyncio.shield(index_warmup)
+
+async def warm_reference_index(guild_id):
+    """Chunk a reference server and seed its index from the member list"""
+    server = bot.get_guild(guild_id)
+    if not server:
+        return
+    
+    try:
+        await seed_index(server, reference_indexes[guild_id])
+    except Exception as e:
+        logger.error(f"Failed to seed reference index for server {guild_id}: {e}")
+
+async def warm_target_index(guild_id):
+    """Chunk a target server and seed its slim-mode index from the member list"""
+    server = bot.get_guild(guild_id)
+    if not server:
+        return
+    
+    try:
+        await seed_index(server, target_indexes[guild_id])
+    except Exception as e:
+        logger.error(f"Failed to seed member index for server {guild_id}: {e}")
+
+async def seed_index(server, index):
+    """Seed an index from a server's full member list"""
+    changes = reseeding[index] = []
+    try:
+        if SLIM_CACHE:
+            # Nothing is cached, so the chunked members only live until the index is built
+            members = await server.chunk(cache=False)
+        else:
+            if not server.chunked:
+                await server.chunk()
+            members = server.members
+        index.seed(members)
+        if event_journal:
+            event_journal.record_seed(server.id, members)
+        
+        # Replay joins, leaves and role changes that arrived while the member list was downloading
+        for change in changes:
+            if isinstance(change, int):
+                index.remove(change)
+            else:
+                index.update(change)
+    finally:
+        reseeding.pop(index, None)
+
+def is_target_member(server, user_id):
+    """Return True if the user is a member of a target server"""
+    index = target_indexes.get(server.id)
+    if index is not None:
+        return index.contains(user_id)
+    return server.get_member(user_id) is not None
+
+def target_member_ids(target, server):
+    """Return the IDs of every member of a target server"""
+    if SLIM_CACHE:
+        return target_indexes[target.guild_id].member_ids
+    return [member.id for member in server.members]
+
+def is_exempt(target, server, user_id):
+    """Return True if a target member is a bot or holds an exempt role"""
+    index = target_indexes.get(target.guild_id) if SLIM_CACHE else None
+    if index is not None:
+        return index.is_bot(user_id) or target.policy.is_exempt(index.roles_of(user_id))
+    member = server.get_member(user_id)
+    return member is not None and (member.bot or target.policy.is_exempt(role.id for role in member.roles))
+
+def target_roles(target, server, user_id):
+    """Return the role IDs a target member holds (empty if unknown)"""
+    index = target_indexes.get(target.guild_id) if SLIM_CACHE else None
+    if index is not None:
+        return index.roles_of(user_id) or frozenset()
+    member = server.get_member(user_id)
+    return role_ids_of(member) if member is not None else frozenset()
+
+def target_role_holders(target, server, role_ids):
+    """Return the IDs of a target server's members holding any of the given roles"""
+    index = target_indexes.get(target.guild_id) if SLIM_CACHE else None
+    if index is not None:
+        return index.holders_of_any(role_ids)
+    holders = set()
+    for role_id in role_ids:
+        role = server.get_role(role_id)
+        if role:
+            holders.update(member.id for member in role.members)
+    return holders
+
+def target_joined_at(target, server, user_id):
+    """Return the datetime a target member joined, or None if unknown or too long ago to matter"""
+    index = target_indexes.get(target.guild_id) if SLIM_CACHE else None
+    if index is not None:
+        return index.joined_at(user_id)
+    member = server.get_member(user_id)
+    return member.joined_at if member is not None else None
+
+def target_recent_joiners(target, server, age, now):
+    """Return the IDs of a target server's members who joined less than age seconds before now"""
+    index = target_indexes.get(target.guild_id) if SLIM_CACHE else None
+    if index is not None:
+        return index.recent_joiners(age, now)
+    return {
+        member.id for member in server.members
+        if member.joined_at is not None and now - member.joined_at.timestamp() < age
+    }
+
+def role_ids_of(member):
+    """Return a Member's role IDs, without the @everyone role"""
+    return frozenset(role.id for role in member.roles if role.id != member.guild.id)
+
+async def resolve_member(server, user_id):
+    """Return a target server's Member object, fetching it when the member cache is off, or None"""
+    member = server.get_member(user_id)
+    if member is not None or server.id not in target_indexes:
+        return member
+    
+    if not is_target_member(server, user_id):
+        return None
+    try:
+        return await server.fetch_member(user_id)
+    except discord.NotFound:
+        target_indexes[server.id].remove(user_id)
+        return None
+
 @tasks.loop(seconds=CHECK_INTERVAL)
 async def check_members_task():
-    """Periodically check all members in server B"""
+    """Periodically check all members in every target server"""
+    if not is_leader():
+        logger.info("Skipping periodic member check: this instance is a standby")
+        return
     logger.info("Starting periodic member check")
     
-    await send_log(f"Starting periodic member check for {TARGET_SERVER_NAME}", "INFO")
+    for target in owned_targets():
+        job = await sweep_jobs.run(target.guild_id, target.name, lambda job, target=target: sweep_target(target, job))
+        if job is None:
+            logger.info(f"Skipping periodic check of {target.name}: sweep #{sweep_jobs.active[target.guild_id].id} is in flight")
+    
+    logger.info(f"Action throughput: {action_executor.summary()}")
     
+    # Post this sweep's logs as one batch
+    await log_sink.flush()
+
+async def sweep_target(target, job=None):
+    """Check all members in one target server, reporting progress to a sweep job if given"""
+    send_log(f"Starting periodic member check for {target.name}", "INFO", target=target)
+    
+    sweep_started = time.perf_counter()
+    # Every log line of this sweep carries its ID (a field in JSON logs)
+    sweep_token = current_sweep.set(f"{target.guild_id}-{int(time.time())}")
     try:
-        server_b = bot.get_guild(SERVER_B_ID)
-        if not server_b:
-            logger.error(f"Could not find server B (ID: {SERVER_B_ID})")
+        server = bot.get_guild(target.guild_id)
+        if not server:
+            logger.error(f"Could not find target server (ID: {target.guild_id})")
+            return
+        
+        if job:
+            job.set_stage("fetching members")
+        if not await prepare_sweep(target, server):
             return
         
-        members_checked = 0
-        members_warned = 0
-        members_kicked = 0
+        if job:
+            job.set_stage("planning")
+        with plan_duration.time():
+            plan = build_enforcement_plan(target, server)
+        logger.info(f"Enforcement plan for {target.name}: {plan.summary()}")
         
-        # Fetch all members
-        await server_b.chunk()
+        members_checked = plan.total - len(plan.exempt)
+        members_warned, members_kicked = await apply_plan(target, server, plan, job)
+        if job:
+            job.members, job.warned, job.kicked = members_checked, members_warned, members_kicked
         
-        # Process all members
-        for member in server_b.members:
-            # Skip bots
-            if member.bot:
-                continue
-                
-            result = await check_single_member(member)
-            if result == "warned":
-                members_warned += 1
-            elif result == "kicked":
-                members_kicked += 1
-            
-            members_checked += 1
-        
-        # Process warnings that have expired
-        current_time = datetime.datetime.now()
-        for user_id, warn_time in list(warned_users.items()):
-            # If warning has expired, kick the user
-            secs_diff = (current_time - warn_time).total_seconds()
-            if secs_diff >= WARNING_SECONDS:
-                member = server_b.get_member(user_id)
-                if member:
-                    await kick_member(member, "Warning period expired")
-                    members_kicked += 1
-                warned_users.pop(user_id, None)
-        
-        logger.info(f"Periodic check complete: {members_checked} members checked, {members_warned} warned, {members_kicked} kicked")
+        logger.info(f"Periodic check of {target.name} complete: {members_checked} members checked, "
+                    f"{members_warned} warned, {members_kicked} kicked")
+        sweep_duration.observe(time.perf_counter() - sweep_started)
+    
+    except Exception as e:
+        logger.error(f"Error during periodic member check of {target.name}: {e}")
+        if job:
+            job.error = e
+    finally:
+        current_sweep.reset(sweep_token)
+
+async def prepare_sweep(target, server, refresh_members=True):
+    """Bring a target's member list and reference indexes up to date for a sweep; return False if they are not ready"""
+    # Fetch all members (slim mode keeps its index current from events instead)
+    await indexes_ready()
+    if not SLIM_CACHE:
+        if refresh_members or not server.chunked:
+            await server.chunk()
+    elif not target_indexes[target.guild_id].warm:
+        await warm_target_index(target.guild_id)
+    
+    # The plan needs the full membership of every reference server
+    await prepare_reference_indexes(target)
+    cold = [guild_id for guild_id in target.reference_ids if not reference_indexes[guild_id].warm]
+    if cold:
+        logger.error(f"Reference index for server(s) {cold} is not ready, skipping check of {target.name}")
+        return False
+    return True
+
+async def apply_plan(target, server, plan, job=None):
+    """Carry out an enforcement plan and return the number of members (warned, kicked), counting progress in job"""
+    if not is_leader():
+        logger.warning(f"Not applying the enforcement plan for {target.name}: this instance lost the leader lease")
+        return 0, 0
+    
+    # Drop warnings for users who complied, became exempt or left
+    for user_id in plan.clear:
+        clear_warning(target.guild_id, user_id)
+        logger.info(
+            f"Cleared warning for user {user_id} in {target.name}",
+            extra={"user_id": user_id, "guild_id": target.guild_id, "action": "clear"}
+        )
+    
+    # Enforcement is paused while the API is failing; the reconciliation pass after recovery applies a fresh plan
+    if not circuit_breaker.is_closed:
+        logger.warning(f"Skipping {len(plan.warn)} warnings and {len(plan.kick)} kicks in {target.name} while enforcement is paused")
+        return 0, 0
+    
+    # Warn members failing the criteria for the first time, several at once
+    warned = []
+    if job:
+        job.set_stage("warning", len(plan.warn))
     
+    async def warn_planned(item):
+        try:
+            member = await resolve_member(server, item[0])
+            # The plan skipped rules in their join grace; this catches join times it did not know (e.g. after a restore)
+            if member and not in_join_grace(item[1].rule, member) and await warn_member(member, item[1]):
+                warned.append(member.id)
+        finally:
+            if job:
+                job.advance()
+    
+    await action_executor.run_all(plan.warn.items(), warn_planned, limit=ACTION_BATCH_SIZE)
+    
+    # Kick expired warnings whose timer did not get to them (normally handled by warning_scheduler)
+    kicked = []
+    if job:
+        job.set_stage("kicking", len(plan.kick))
+    
+    async def kick_planned(item):
+        try:
+            member = await resolve_member(server, item[0])
+            if member and await kick_member(member, item[1]):
+                kicked.append(member.id)
+        finally:
+            if job:
+                job.advance()
+    
+    await action_executor.run_all(plan.kick.items(), kick_planned, limit=ACTION_BATCH_SIZE)
+    
+    # Persist the warning changes in one transaction
+    await warning_store.flush()
+    return len(warned), len(kicked)
+
+async def incremental_sweep_worker(target):
+    """Check a target server a slice at a time from a persisted cursor, spreading each lap over CHECK_INTERVAL"""
+    await bot.wait_until_ready()
+    cursor = sweep_cursors[target.guild_id] = SweepCursor(target.guild_id, warning_store)
+    while True:
+        delay = CHECK_INTERVAL
+        try:
+            # Slices wait while a full sweep of the server is running
+            async with sweep_jobs.lock(target.guild_id):
+                delay = await sweep_next_slice(target, cursor)
+        except Exception as e:
+            logger.error(f"Error during incremental member check of {target.name}: {e}")
+        await asyncio.sleep(delay)
+
+async def sweep_next_slice(target, cursor):
+    """Check the next slice of a target server's members and return the seconds to wait before the next one"""
+    server = bot.get_guild(target.guild_id)
+    if not server:
+        logger.error(f"Could not find target server (ID: {target.guild_id})")
+        return CHECK_INTERVAL
+    
+    # Refresh the member list once per lap rather than once per slice
+    starting = not cursor.in_lap
+    if not await prepare_sweep(target, server, refresh_members=starting):
+        return min(CHECK_INTERVAL, 60)
+    if starting:
+        cursor.start_lap(target_member_ids(target, server))
+        send_log(f"Starting incremental member check for {target.name}", "INFO", target=target)
+    
+    user_ids = cursor.next_slice(SWEEP_SLICE_SIZE)
+    # Every log line of this slice carries the lap's ID; reset so it does not outlive the slice
+    sweep_token = current_sweep.set(cursor.lap_id)
+    try:
+        with plan_duration.time():
+            plan = build_enforcement_plan(target, server, user_ids)
+        
+        # Stay under SWEEP_ACTIONS_PER_MINUTE across all targets
+        await sweep_budget.acquire(len(plan.warn) + len(plan.kick))
+        await apply_plan(target, server, plan)
+        cursor.advance(user_ids)
+        logger.debug(f"Incremental check of {target.name}: {plan.summary()}, {cursor.progress():.0%} of the lap done")
+        
+        delay = cursor.slice_delay(CHECK_INTERVAL, SWEEP_SLICE_SIZE)
+        if not cursor.in_lap:
+            lap_seconds = time.monotonic() - cursor.lap_started
+            logger.info(f"Incremental check of {target.name} finished a lap of {len(cursor.lap_ids)} members "
+                        f"in {lap_seconds:.0f}s")
+            sweep_duration.observe(lap_seconds)
+            cursor.finish_lap()
+            await log_sink.flush()
+        return delay
+    finally:
+        current_sweep.reset(sweep_token)
+
+@tasks.loop(seconds=WARNING_FLUSH_INTERVAL)
+async def flush_warnings_task():
+    """Write batched warning changes, the DM outbox (and journaled events) to disk"""
+    try:
+        await warning_store.flush()
     except Exception as e:
-        logger.error(f"Error during periodic member check: {e}")
+        logger.error(f"Failed to write warnings to {WARNINGS_DB}: {e}")
+    try:
+        await dm_outbox.flush()
+    except Exception as e:
+        logger.error(f"Failed to write the DM outbox to {WARNINGS_DB}: {e}")
+    
+    if event_journal:
+        try:
+            await event_journal.flush()
+        except OSError as e:
+            logger.error(f"Failed to write event journal {JOURNAL_FILE}: {e}")
+
+@flush_warnings_task.after_loop
+async def after_flush_warnings():
+    """Write any remaining warning changes and send the queued sheet rows when the bot shuts down"""
+    await warning_store.flush()
+    await dm_outbox.flush()
+    await sheet_logger.stop()
+
+def snapshot_indexes():
+    """Yield (kind, index) for every index of this process's servers that is kept in SNAPSHOT_DIR"""
+    for guild_id, index in reference_indexes.items():
+        if shard_config.owns(guild_id):
+            yield "reference", index
+    for target in owned_targets():
+        if target.guild_id in target_indexes:
+            yield "target", target_indexes[target.guild_id]
+
+def snapshot_path(kind, guild_id):
+    return os.path.join(SNAPSHOT_DIR, f"{kind}-{guild_id}.snap")
+
+def restore_snapshots():
+    """Load the indexes from SNAPSHOT_DIR so checks are answered before the member lists are downloaded"""
+    if not SNAPSHOT_DIR:
+        return
+    
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    for kind, index in snapshot_indexes():
+        snapshot = read_snapshot(snapshot_path(kind, index.guild_id), index.guild_id)
+        if snapshot is None:
+            continue
+        if snapshot.age() > SNAPSHOT_MAX_AGE:
+            logger.info(f"Skipping {kind} snapshot of server {index.guild_id}, taken {snapshot.age() / 3600:.1f}h ago")
+            continue
+        index.restore(snapshot)
+        logger.info(f"Restored {len(snapshot)} members of {kind} server {index.guild_id} "
+                    f"from a snapshot taken {snapshot.age() / 60:.0f} minutes ago")
+
+def snapshot_jobs():
+    """Return (path, builder) for every index that is live and not being reseeded"""
+    return [
+        (snapshot_path(kind, index.guild_id), index.snapshot_builder())
+        for kind, index in snapshot_indexes()
+        if index.warm and index.restored_at is None and index not in reseeding
+    ]
+
+def save_snapshot(path, build):
+    write_snapshot(path, build())
+
+@tasks.loop(seconds=SNAPSHOT_INTERVAL)
+async def snapshot_task():
+    """Write the member indexes to SNAPSHOT_DIR, building and writing the files off the event loop"""
+    loop = asyncio.get_running_loop()
+    for path, build in snapshot_jobs():
+        try:
+            await loop.run_in_executor(None, save_snapshot, path, build)
+        except Exception as e:
+            logger.error(f"Failed to write member snapshot {path}: {e}")
+
+@snapshot_task.after_loop
+async def after_snapshot():
+    """Write fresh snapshots when the bot shuts down"""
+    for path, build in snapshot_jobs():
+        try:
+            save_snapshot(path, build)
+        except Exception as e:
+            logger.error(f"Failed to write member snapshot {path}: {e}")
 
 @check_members_task.before_loop
 async def before_check_members():
@@ -147,83 +1096,333 @@ async def before_check_members():
     # Initial delay to ensure bot is properly connected
     await asyncio.sleep(10)
 
+def build_enforcement_plan(target, server, user_ids=None):
+    """
+    Snapshot a target server and its reference indexes and compute the target's enforcement plan
+    With user_ids (a slice of an incremental sweep) only those members are considered, looked up one at a time
+    """
+    # Bots and holders of exempt roles are never acted on
+    index = target_indexes.get(target.guild_id) if SLIM_CACHE else None
+    if user_ids is not None:
+        member_ids = [user_id for user_id in user_ids if is_target_member(server, user_id)]
+        exempt_ids = {user_id for user_id in member_ids if is_exempt(target, server, user_id)}
+    elif index is not None:
+        member_ids = index.member_ids
+        exempt_ids = index.holders_of_any(list(target.exempt_roles) + [BOT_FLAG])
+    else:
+        member_ids = (member.id for member in server.members)
+        exempt_ids = {member.id for member in server.members if member.bot}
+        exempt_ids |= target_role_holders(target, server, target.exempt_roles)
+    
+    pending = warning_store.pending(target.guild_id)
+    if user_ids is not None:
+        deadlines = {user_id: pending[user_id].deadline for user_id in member_ids if user_id in pending}
+    else:
+        deadlines = {user_id: warning.deadline for user_id, warning in pending.items()}
+    
+    now = time.time()
+    if user_ids is not None:
+        # A slice: one compiled mask per member instead of copying whole indexes
+        def find_violations(candidates):
+            return target.policy.violations_of(
+                candidates, reference_indexes, lambda user_id: target_roles(target, server, user_id), now,
+                lambda user_id: target_joined_at(target, server, user_id)
+            )
+    else:
+        def find_violations(candidates):
+            return target.policy.find_violations(
+                candidates, reference_indexes, lambda role_ids: target_role_holders(target, server, role_ids), now,
+                lambda age: target_recent_joiners(target, server, age, now)
+            )
+    
+    return plan_enforcement(member_ids, exempt_ids, find_violations, deadlines, now)
+
+def reference_name(guild_id):
+    """Return a reference server's name for messages"""
+    server = bot.get_guild(guild_id) or remote_references.cached_guild(guild_id)
+    return server.name if server else REFERENCE_SERVER_NAME
+
+def describe_reason(target, violation):
+    """Turn a policy violation into the text shown to members"""
+    rule = violation.rule
+    if violation.reason == REASON_ACCOUNT_AGE:
+        return f"using a Discord account younger than {rule.min_account_age / 86400:.3g} days"
+    joiner = " and " if rule.match == "all" else " or "
+    names = joiner.join(reference_name(guild_id) for guild_id in rule.guild_ids)
+    if violation.reason == REASON_MISSING_ROLE:
+        return f"doesn't have the required role in our main server: {names}"
+    return f"not a member of our main server: {names}"
+
 async def check_single_member(member, immediate=False):
     """
     Check if a single member meets the criteria
-    Returns: "exempt", "ok", "warned", "kicked"
+    Returns: "exempt", "ok", "warned", "kicked", "failed" (the warning or kick did not go through), "paused", "standby" or "error"
     """
+    check_started = time.perf_counter()
+    target = targets[member.guild.id]
     try:
         # Skip bot accounts
         if member.bot:
-            logger.info(f"Skipping bot account: {member.name} (ID: {member.id})")
-            return "exempt"
-        
-        await send_log(f"Checking member {member.name} (ID: {member.id})", "INFO")
-		
-		# Check if member has exempt roles (protected roles)
-        if any(role.id in EXEMPT_ROLES for role in member.roles):
-            logger.info(f"Member {member.name} (ID: {member.id}) has exempt role, skipping check")
+            logger.info(f"Skipping bot account: {member.name} (ID: {member.id})", extra=member_fields(member, "check"))
             return "exempt"
         
-        # Get server A
-        server_a = bot.get_guild(SERVER_A_ID)
-        if not server_a:
-            logger.error(f"Could not find server A (ID: {SERVER_A_ID})")
-            return "error"
+        # Only the leader checks members in HA mode
+        if not is_leader():
+            return "standby"
         
-        # Try to find the member in server A
-        try:
-            member_in_a = await server_a.fetch_member(member.id)
-        except discord.NotFound:
-            member_in_a = None
-        except discord.HTTPException as e:
-            logger.error(f"HTTP error when fetching member {member.id} in server A: {e}")
-            return "error"
+        send_log(f"Checking member {member.name} (ID: {member.id})", "INFO", target=target)
         
-        # Determine which check to perform and if the member passes
-        passes_check = True
+        # Check if member has exempt roles (protected roles)
+        role_ids = role_ids_of(member)
+        if target.policy.is_exempt(role_ids):
+            logger.info(f"Member {member.name} (ID: {member.id}) has exempt role, skipping check", extra=member_fields(member, "check"))
+            clear_warning(target.guild_id, member.id)
+            return "exempt"
         
-        # Criteria 1: User must be in server A
-        if ACTIVE_CRITERIA == 1:
-            if not member_in_a:
-                passes_check = False
-                reason = f"not a member of our main server: {REFERENCE_SERVER_NAME}"
+        # Resolve the member's standing in the reference servers, trying again later if Discord could not answer
+        standing = await reference_standing(target, member.id, fresh=immediate)
+        if standing is None:
+            retry_queue.retry((target.guild_id, member.id, immediate))
+            return "error"
+        retry_queue.done((target.guild_id, member.id, immediate))
         
-        # Criteria 2: User must have role X in server A
-        elif ACTIVE_CRITERIA == 2:
-            if not member_in_a:
-                passes_check = False
-                reason = f"not a member of our main server: {REFERENCE_SERVER_NAME}"
-            else:
-                has_role = any(role.id == ROLE_X_ID for role in member_in_a.roles)
-                if not has_role:
-                    passes_check = False
-                    reason = f"doesn't have the required role in our main server: {REFERENCE_SERVER_NAME}"
+        # Evaluate the compiled policy against the member's reference and target server bits
+        violation = target.policy.evaluate(standing | target.policy.target_mask(role_ids, member.id, member.joined_at))
         
-        # If the member passes, we're done
-        if passes_check:
+        # If the member passes, clear any outstanding warning and we're done
+        if violation is None:
+            if clear_warning(target.guild_id, member.id):
+                logger.info(f"Cleared warning for {member.name} (ID: {member.id})", extra=member_fields(member, "clear"))
             return "ok"
         
+        # No warnings or kicks while the API is failing; the reconciliation pass afterwards catches up
+        if not circuit_breaker.is_closed:
+            logger.info(f"Not acting on {member.name} (ID: {member.id}) while enforcement is paused", extra=member_fields(member, "check"))
+            return "paused"
+        
         # If the user already has a warning and immediate is True, kick them
-        if member.id in warned_users and immediate:
-            await kick_member(member, reason)
-            return "kicked"
+        if warning_store.contains(target.guild_id, member.id) and immediate:
+            return "kicked" if await kick_member(member, violation) else "failed"
         
         # If the user doesn't have a warning yet, warn them
-        if member.id not in warned_users:
-            await warn_member(member, reason)
-            return "warned"
+        if not warning_store.contains(target.guild_id, member.id):
+            return "warned" if await warn_member(member, violation) else "failed"
         
         # Otherwise, we've already warned them and are waiting for the timer
         return "warned"
         
     except Exception as e:
-        logger.error(f"Error checking member {member.name} (ID: {member.id}): {e}")
-        await send_log(f"Error checking member {member.name} (ID: {member.id}): {e}", "ERROR", error=traceback.format_exc())
+        logger.error(f"Error checking member {member.name} (ID: {member.id}): {e}", extra=member_fields(member, "check"))
+        send_log(f"Error checking member {member.name} (ID: {member.id}): {e}", "ERROR", error=traceback.format_exc(), target=target)
+        retry_queue.retry((target.guild_id, member.id, immediate))
         return "error"
+    finally:
+        member_check_duration.observe(time.perf_counter() - check_started)
 
-async def warn_member(member, reason):
-    """Send warning to member and log in warning channel"""
+async def admit_join_batch(guild_id, members):
+    """
+    Check a batch of members who just joined a target server in one pass over the reference indexes
+    Acts like check_single_member(immediate=True) for each member, with one warning channel post for the batch
+    """
+    target = targets[guild_id]
+    server = bot.get_guild(guild_id)
+    if not server:
+        logger.error(f"Could not find target server (ID: {guild_id})")
+        return
+    if not is_leader():
+        # The lease was lost while the batch was collected; the new leader's takeover sweep checks these members
+        return
+    
+    # Members who already left again are picked up by the sweep if they rejoin
+    members = [member for member in members if not member.bot and is_target_member(server, member.id)]
+    if not members:
+        return
+    
+    # Only a live local index can answer for the whole batch; otherwise check each member the usual way
+    policy = target.policy
+    if any(not shard_config.owns(guild_id) or not reference_indexes[guild_id].warm
+           or reference_indexes[guild_id].restored_at is not None for guild_id in policy.reference_ids):
+        await action_executor.run_all(members, lambda member: check_single_member(member, immediate=True), limit=ACTION_BATCH_SIZE)
+        return
+    
+    batch_started = time.perf_counter()
+    now = time.time()
+    to_warn = []
+    to_kick = []
+    for member in members:
+        role_ids = role_ids_of(member)
+        if policy.is_exempt(role_ids):
+            clear_warning(guild_id, member.id)
+            continue
+        
+        violation = policy.evaluate(
+            policy.reference_mask(member.id, reference_indexes) | policy.target_mask(role_ids, member.id, member.joined_at, now)
+        )
+        if violation is None:
+            clear_warning(guild_id, member.id)
+        elif warning_store.contains(guild_id, member.id):
+            # Warned before they left: kicked straight away, as for a single join
+            to_kick.append((member, violation))
+        else:
+            to_warn.append((member, violation))
+    
+    # DMs and kicks go out per member; the warning channel gets one post for the whole batch
+    warned = []
+    
+    async def warn_joined(item):
+        if await warn_member(*item, announce=False):
+            warned.append(item[0])
+    
+    await action_executor.run_all(to_warn, warn_joined, limit=ACTION_BATCH_SIZE)
+    kicked = []
+    
+    async def kick_joined(item):
+        if await kick_member(*item, announce=False):
+            kicked.append(item[0])
+    
+    await action_executor.run_all(to_kick, kick_joined, limit=ACTION_BATCH_SIZE)
+    await warning_store.flush()
+    
+    summary = (f"Checked {len(members)} joins to {target.name} in {time.perf_counter() - batch_started:.2f}s: "
+               f"{len(warned)} warned, {len(kicked)} kicked")
+    logger.info(summary)
+    if warned or kicked:
+        send_log(summary, "WARNING", target=target)
+        await post_join_batch(target, warned, kicked)
+
+async def post_join_batch(target, warned, kicked):
+    """Post one warning channel message for the members warned and kicked in a batch of joins"""
+    channel = channel_access.channel(target.warning_channel_id) if target.warning_channel_id else None
+    if not channel:
+        return
+    
+    embed = discord.Embed(
+        title=f"⚠️ Join Burst: {len(warned) + len(kicked)} members failed the server criteria",
+        color=discord.Color.yellow()
+    )
+    for name, batch in (("Warned", warned), ("Kicked", kicked)):
+        if batch:
+            mentions = " ".join(member.mention for member in batch[:JOIN_MENTION_LIMIT])
+            if len(batch) > JOIN_MENTION_LIMIT:
+                mentions += f" and {len(batch) - JOIN_MENTION_LIMIT} more"
+            embed.add_field(name=f"{name} ({len(batch)})", value=mentions[:1024], inline=False)
+    
+    try:
+        await post_to_channel(channel, embed=embed)
+    except discord.HTTPException as e:
+        logger.warning(f"Failed to post join batch for {target.name} in warning channel: {e}")
+
+async def reference_standing(target, user_id, fresh=False):
+    """
+    Return the member's standing in a target's reference servers as a policy mask, or None on error
+    Answered from the reference indexes when they are warm, otherwise fetched from Discord
+    Remote reference servers are always asked through the API (fresh=True skips the lookup cache)
+    """
+    policy = target.policy
+    mask = 0
+    for guild_id in policy.reference_ids:
+        index = reference_indexes[guild_id]
+        if not shard_config.owns(guild_id):
+            try:
+                role_ids = await remote_references.lookup(guild_id, user_id, use_cache=not fresh)
+            except discord.HTTPException as e:
+                logger.error(f"HTTP error when fetching member {user_id} in server {guild_id}: {e}")
+                return None
+            if role_ids is None and not circuit_breaker.is_closed:
+                # "Not a member" answers are not trusted while the API is failing
+                return None
+            guild_mask = policy.guild_mask(guild_id, role_ids)
+        elif index.warm and index.restored_at is None:
+            guild_mask = policy.guild_mask(guild_id, index.roles_of(user_id))
+        elif index.warm and policy.satisfied_by(mask | policy.guild_mask(guild_id, index.roles_of(user_id))):
+            # A restored snapshot is trusted when it says the member complies; failures are confirmed live below
+            guild_mask = policy.guild_mask(guild_id, index.roles_of(user_id))
+        else:
+            guild_mask = await fetch_reference_standing(policy, guild_id, user_id)
+            if guild_mask is None:
+                return None
+        
+        mask |= guild_mask
+        
+        # Stop once the reference servers seen so far satisfy every rule
+        if policy.satisfied_by(mask):
+            break
+    
+    return mask
+
+async def fetch_reference_standing(policy, guild_id, user_id):
+    """Return a member's standing in one reference server as a policy mask fetched from Discord, or None on error"""
+    server = bot.get_guild(guild_id)
+    if not server:
+        logger.error(f"Could not find reference server (ID: {guild_id})")
+        return None
+    
+    try:
+        fetched = await server.fetch_member(user_id)
+    except discord.NotFound:
+        # "Not a member" answers are not trusted while the API is failing
+        return 0 if circuit_breaker.is_closed else None
+    except discord.HTTPException as e:
+        logger.error(f"HTTP error when fetching member {user_id} in server {guild_id}: {e}")
+        return None
+    
+    return policy.guild_mask(guild_id, role_ids_of(fetched))
+
+def clear_warning(guild_id, user_id):
+    """Drop a user's warning in a target server and cancel its kick timer; returns the removed warning or None"""
+    warning_scheduler.cancel((guild_id, user_id))
+    return warning_store.remove(guild_id, user_id)
+
+async def retry_check(guild_id, user_id, immediate):
+    """Check a member again after Discord could not be reached for them"""
+    key = (guild_id, user_id, immediate)
+    server = bot.get_guild(guild_id)
+    try:
+        member = await resolve_member(server, user_id) if server else None
+    except discord.HTTPException:
+        retry_queue.retry(key)
+        return
+    if member is None or member.bot:
+        retry_queue.done(key)
+        return
+    
+    logger.info(f"Retrying check of {member.name} (ID: {member.id}), attempt {retry_queue.attempts(key) + 1}", extra=member_fields(member, "check"))
+    await check_single_member(member, immediate=immediate)
+
+def reconcile_after_outage():
+    """Sweep every target once the circuit breaker closes, acting on whatever was skipped while it was open"""
+    if not is_leader():
+        return
+    send_log("Discord API recovered, resuming enforcement with a full check of every target server", "WARNING")
+    reconcile_targets("reconcile")
+
+def reconcile_targets(kind):
+    """Start a full sweep job of every target server that has none in flight"""
+    for target in owned_targets():
+        sweep_jobs.start(target.guild_id, target.name, lambda job, target=target: sweep_target(target, job), kind=kind)
+
+async def expire_warning(guild_id, user_id):
+    """Kick a warned member as soon as their grace period ends, unless they now comply"""
+    server = bot.get_guild(guild_id)
+    member = await resolve_member(server, user_id) if server else None
+    if not member:
+        # The warning stays so a rejoin is kicked straight away
+        return
+    
+    # If the reference servers cannot be checked, check_single_member queues a retry
+    await check_single_member(member, immediate=True)
+
+async def warn_member(member, violation, announce=True):
+    """
+    Send warning to member and log in warning channel (announce=False leaves the channel post to the caller)
+    Returns True if the warning was recorded
+    """
+    target = targets[member.guild.id]
+    if not circuit_breaker.is_closed or not is_leader():
+        return False
+    
+    reason = describe_reason(target, violation)
+    warning_seconds = violation.rule.warning_seconds
     try:
         # Create embed for warning
         embed = discord.Embed(
@@ -233,24 +1432,19 @@ async def warn_member(member, reason):
         )
         
         embed.add_field(
-            name=f"You have {WARNING_SECONDS/3600} hours to comply",
-            value=f"Join our main server using this link: {INVITE_LINK}\n"
-                  f"{'And get the required role' if ACTIVE_CRITERIA == 2 else ''}",
+            name=f"You have {warning_seconds/3600} hours to comply",
+            value=f"Join our main server using this link: {target.invite_link}\n"
+                  f"{'And get the required role' if violation.reason == REASON_MISSING_ROLE else ''}",
             inline=False
         )
         
         embed.set_footer(text="This is an automated message.")
         
-        # Try to send DM
-        try:
-            await member.send(embed=embed)
-            logger.info(f"Sent warning DM to {member.name} (ID: {member.id})")
-        except (discord.Forbidden, discord.HTTPException) as e:
-            logger.warning(f"Failed to send warning DM to {member.name} (ID: {member.id}): {e}")
-        
         # Try to send message to warning channel
-        if WARNING_CHANNEL_ID:
-            channel = bot.get_channel(WARNING_CHANNEL_ID)
+        async def post_warning():
+            if not target.warning_channel_id or not announce:
+                return
+            channel = channel_access.channel(target.warning_channel_id)
             if channel:
                 warning_embed = discord.Embed(
                     title=f"⚠️ Member Warning: {member.name}",
@@ -259,28 +1453,38 @@ async def warn_member(member, reason):
                 )
                 warning_embed.add_field(
                     name="Action Required",
-                    value=f"User has {WARNING_SECONDS/3600} hours to comply or will be removed.",
+                    value=f"User has {warning_seconds/3600} hours to comply or will be removed.",
                     inline=False
                 )
                 
-                
-                await send_log(f"⚠️ Member {member.name} (ID: {member.id}) has been warned: {reason}", "WARNING")
-                await channel.send(
-                    f"Hey {member.mention},",
-                    embed=warning_embed
-    			)
-
-
-            
+                send_log(f"⚠️ Member {member.name} (ID: {member.id}) has been warned: {reason}", "WARNING", target=target)
+                await post_to_channel(channel, f"Hey {member.mention},", embed=warning_embed)
+        
+        await post_warning()
+        
+        # Record the warning; it is written to disk on the next flush
+        warned_at = time.time()
+        warning_store.add(target.guild_id, member.id, warned_at, warned_at + warning_seconds, reason)
+        warning_scheduler.schedule((target.guild_id, member.id), warned_at + warning_seconds)
         
-        # Add user to warned users with timestamp
-        warned_users[member.id] = datetime.datetime.now()
+        # Only a recorded warning is sent; the DM goes out from the outbox in the background
+        dm_outbox.put(member.id, embed, PRIORITY_WARNING, "warning")
+        actions_taken.inc(action="warn", outcome="ok")
+        return True
         
     except Exception as e:
-        logger.error(f"Error warning {member.name} (ID: {member.id}): {e}")
+        actions_taken.inc(action="warn", outcome="error")
+        logger.error(f"Error warning {member.name} (ID: {member.id}): {e}", extra=member_fields(member, "warn"))
+        return False
 
-async def kick_member(member, reason):
-    """Kick a member after sending them a DM with the embed"""
+async def kick_member(member, violation, announce=True):
+    """Kick a member after sending them a DM with the embed (announce=False leaves the channel post to the caller)"""
+    target = targets[member.guild.id]
+    if not circuit_breaker.is_closed or not is_leader():
+        # Paused while the API is failing or after losing the lease; the warning stays, so the next full check kicks them
+        return False
+    
+    reason = describe_reason(target, violation)
     try:
         # Create embed for kick message
         embed = discord.Embed(
@@ -291,24 +1495,30 @@ async def kick_member(member, reason):
         
         embed.add_field(
             name="How to rejoin",
-            value=f"Join our main server first using this link: {INVITE_LINK}\n"
-                  f"{'And get the required role' if ACTIVE_CRITERIA == 2 else ''}\n"
+            value=f"Join our main server first using this link: {target.invite_link}\n"
+                  f"{'And get the required role' if violation.reason == REASON_MISSING_ROLE else ''}\n"
                   f"Then you can rejoin the server you were removed from.",
             inline=False
         )
         
         embed.set_footer(text="This is an automated message.")
         
-        # Try to send DM first
-        try:
-            await member.send(embed=embed)
-            logger.info(f"Sent kick DM to {member.name} (ID: {member.id})")
-        except (discord.Forbidden, discord.HTTPException) as e:
-            logger.warning(f"Failed to send kick DM to {member.name} (ID: {member.id}): {e}")
+        # Send the DM first (it cannot be delivered once the member is gone), then kick
+        async def dm_then_kick():
+            # Kick notices go ahead of every queued warning; the kick waits at most KICK_DM_TIMEOUT for it,
+            # after which the DM is dropped, since it cannot reach the member once they are gone
+            await dm_outbox.deliver(member.id, embed, PRIORITY_KICK, "kick", timeout=KICK_DM_TIMEOUT)
+            
+            # Kick member
+            send_log(f"🔨 Member {member.name} (ID: {member.id}) has been kicked: {reason}", "WARNING", target=target)
+            await action_executor.run("kick", lambda: member.kick(reason=f"Failed to meet server criteria: {reason}"))
+            logger.info(f"Kicked {member.name} (ID: {member.id})", extra=member_fields(member, "kick"))
         
         # Try to send message to warning channel
-        if WARNING_CHANNEL_ID:
-            channel = bot.get_channel(WARNING_CHANNEL_ID)
+        async def post_kick():
+            if not target.warning_channel_id or not announce:
+                return
+            channel = channel_access.channel(target.warning_channel_id)
             if channel:
                 kick_embed = discord.Embed(
                     title=f"🔨 Member Kicked: {member.name}",
@@ -316,32 +1526,46 @@ async def kick_member(member, reason):
                     color=discord.Color.red()
                 )
                 mod_mentions = " ".join([f"<@&{role_id}>" for role_id in MOD_ROLE_IDS])
-                await channel.send(
-                    f"Hey {member.mention},",
-                    embed=kick_embed
-                )
+                await post_to_channel(channel, f"Hey {member.mention},", embed=kick_embed)
         
-        # Kick member
-        await send_log(f"🔨 Member {member.name} (ID: {member.id}) has been kicked: {reason}", "WARNING")
-        await member.kick(reason=f"Failed to meet server criteria: {reason}")
-        logger.info(f"Kicked {member.name} (ID: {member.id})")
+        # The channel post runs alongside the DM and kick
+        kick_result, post_result = await asyncio.gather(dm_then_kick(), post_kick(), return_exceptions=True)
+        if isinstance(post_result, Exception):
+            logger.warning(f"Failed to post kick of {member.name} (ID: {member.id}) in warning channel: {post_result}", extra=member_fields(member, "kick"))
+        if isinstance(kick_result, Exception):
+            raise kick_result
         
         # Remove from warned users list if present
-        warned_users.pop(member.id, None)
+        clear_warning(target.guild_id, member.id)
         
+        actions_taken.inc(action="kick", outcome="ok")
         return True
         
     except discord.Forbidden:
-        logger.error(f"Bot doesn't have permission to kick {member.name} (ID: {member.id})")
+        actions_taken.inc(action="kick", outcome="forbidden")
+        logger.error(f"Bot doesn't have permission to kick {member.name} (ID: {member.id})", extra=member_fields(member, "kick"))
         return False
     except Exception as e:
-        logger.error(f"Error kicking {member.name} (ID: {member.id}): {e}")
+        actions_taken.inc(action="kick", outcome="error")
+        logger.error(f"Error kicking {member.name} (ID: {member.id}): {e}", extra=member_fields(member, "kick"))
         return False
 
 
+async def post_to_channel(channel, *args, **kwargs):
+    """Post in a warning channel through the action lanes; a refused post drops the channel's cached permissions"""
+    try:
+        await action_executor.run("channel", lambda: channel.send(*args, **kwargs))
+    except discord.Forbidden:
+        channel_access.forget(channel.id)
+        raise
+
+def member_fields(member, action):
+    """Structured fields for a log line about one member (written to JSON logs)"""
+    return {"user_id": member.id, "guild_id": member.guild.id, "action": action}
+
 # Add this function after your other functions
-async def send_log(message, level="INFO", error=None):
-    """Send logs to a specified channel on the reference server"""
+def send_log(message, level="INFO", error=None, target=None):
+    """Queue a log for the log channel (posted in batches by log_sink); target names the servers in the sheet row"""
     if not LOG_CHANNEL_ID:
         return
         
@@ -349,97 +1573,128 @@ async def send_log(message, level="INFO", error=None):
     log_levels = {"DEBUG": 0, "INFO": 1, "WARNING": 2, "ERROR": 3, "CRITICAL": 4}
     if log_levels.get(level, 0) < log_levels.get(LOG_LEVEL, 1):
         return
+    started = time.perf_counter()
     
+    # Standard logging to console/file
+    if level == "INFO":
+        logger.info(message)
+    elif level == "WARNING":
+        logger.warning(message)
+    elif level == "ERROR":
+        logger.error(message)
+    elif level == "CRITICAL":
+        logger.critical(message)
+    else:
+        logger.debug(message)
+    
+    logs_sent.inc(level=level)
+    log_sink.put(level, message, error)
+        
+    # Mirror the log to the Google Sheet (queued; sheet_logger posts in batches)
     try:
-        # Standard logging to console/file
-        if level == "INFO":
-            logger.info(message)
-        elif level == "WARNING":
-            logger.warning(message)
-        elif level == "ERROR":
-            logger.error(message)
-        elif level == "CRITICAL":
-            logger.critical(message)
-        else:
-            logger.debug(message)
+        user_id = None
+        user_name = None
         
-        # Try to send to log channel
-        channel = bot.get_channel(LOG_CHANNEL_ID)
-        if not channel:
-            return
-            
-        # Check permission to send messages
-        permissions = channel.permissions_for(channel.guild.me)
-        if not permissions.send_messages or not permissions.embed_links:
-            logger.warning(f"Bot doesn't have permission to send logs to channel {LOG_CHANNEL_ID}")
+        # Try to extract user ID if present in message
+        id_match = re.search(r'ID: (\d+)', message)
+        if id_match:
+            user_id = id_match.group(1)
+                
+        # Try to extract user name if present
+        name_match = re.search(r'Member (\S+)', message)
+        if name_match:
+            user_name = name_match.group(1)
+        
+        # Log to Google Sheet
+        server_info = None
+        if target:
+            references = " or ".join(reference_name(guild_id) for guild_id in target.reference_ids)
+            server_info = f"{references}/{target.name}"
+        log_to_sheet(level, message, user_id, user_name, server_info, str(error) if error else None)
+    
+    except Exception as sheet_err:
+        # This won't break the bot if sheet logging fails
+        logger.warning(f"Sheet logging error (non-critical): {sheet_err}")
+    
+    send_log_seconds.inc(time.perf_counter() - started)
+
+
+async def send_log_embeds(embeds):
+    """Post a batch of log embeds to the log channel as one message"""
+    access = channel_access.resolve(LOG_CHANNEL_ID)
+    channel = access.channel
+    if not channel:
+        if not shard_config.is_partial():
             return
-            
-        # Create embed for log message
-        color_map = {
-            "DEBUG": discord.Color.light_grey(),
-            "INFO": discord.Color.blue(),
-            "WARNING": discord.Color.gold(),
-            "ERROR": discord.Color.red(),
-            "CRITICAL": discord.Color.dark_red()
-        }
+        # The log channel's server is on another shard process; post without the cached channel
+        channel = bot.get_partial_messageable(LOG_CHANNEL_ID)
+        await channel.send(embeds=embeds)
+        return
         
-        embed = discord.Embed(
-            title=f"{level} Log",
-            description=message,
-            color=color_map.get(level, discord.Color.default()),
-            timestamp=datetime.datetime.now()
+    # Check permission to send messages (cached until a role, channel or bot member update in that server)
+    if access.missing:
+        logger.warning(f"Bot doesn't have permission to send logs to channel {LOG_CHANNEL_ID}")
+        return
+    
+    try:
+        await channel.send(embeds=embeds)
+    except discord.Forbidden:
+        channel_access.forget(LOG_CHANNEL_ID)
+        raise
+
+
+def build_log_embed(entry):
+    """Create the embed for a single log entry"""
+    color_map = {
+        "DEBUG": discord.Color.light_grey(),
+        "INFO": discord.Color.blue(),
+        "WARNING": discord.Color.gold(),
+        "ERROR": discord.Color.red(),
+        "CRITICAL": discord.Color.dark_red()
+    }
+    
+    embed = discord.Embed(
+        title=f"{entry.level} Log",
+        description=entry.message,
+        color=color_map.get(entry.level, discord.Color.default()),
+        timestamp=entry.timestamp
+    )
+    
+    error = entry.error
+    if error:
+        embed.add_field(
+            name="Error Details",
+            value=f"```\n{str(error)[:1000]}\n```",
+            inline=False
         )
         
-        if error:
+        # Add traceback for errors
+        if entry.level in ["ERROR", "CRITICAL"] and isinstance(error, BaseException):
+            tb = traceback.format_exception(type(error), error, error.__traceback__)
+            tb_text = "".join(tb)
+            if len(tb_text) > 1000:
+                tb_text = tb_text[:997] + "..."
             embed.add_field(
-                name="Error Details",
-                value=f"```\n{str(error)[:1000]}\n```",
+                name="Traceback",
+                value=f"```py\n{tb_text}\n```",
                 inline=False
             )
-            
-            # Add traceback for errors
-            if level in ["ERROR", "CRITICAL"] and error:
-                tb = traceback.format_exception(type(error), error, error.__traceback__)
-                tb_text = "".join(tb)
-                if len(tb_text) > 1000:
-                    tb_text = tb_text[:997] + "..."
-                embed.add_field(
-                    name="Traceback",
-                    value=f"```py\n{tb_text}\n```",
-                    inline=False
-                )
-        
-        await channel.send(embed=embed)
-        
-        # try:
-        #     user_id = None
-        #     user_name = None
-            
-        #     # Try to extract user ID if present in message
-        #     id_match = re.search(r'ID: (\d+)', message)
-        #     if id_match:
-        #         user_id = id_match.group(1)
-                    
-        #     # Try to extract user name if present
-        #     name_match = re.search(r'Member (\S+)', message)
-        #     if name_match:
-        #         user_name = name_match.group(1)
-            
-        #     # Log to Google Sheet
-        #     server_info = f"{REFERENCE_SERVER_NAME}/{TARGET_SERVER_NAME}"
-        #     log_to_sheet(level, message, user_id, user_name, server_info, str(error) if error else None)
+    
+    return embed
 
-        # except Exception as sheet_err:
-        #     # This won't break the bot if sheet logging fails
-        #     logger.warning(f"Sheet logging error (non-critical): {sheet_err}")
-		
-        
-    except Exception as e:
-        logger.error(f"Failed to send log to channel: {e}")
+
+def build_log_digest(lines, timestamp):
+    """Create a single embed summarizing a batch of INFO logs"""
+    return discord.Embed(
+        title="INFO Log Digest",
+        description=lines,
+        color=discord.Color.blue(),
+        timestamp=timestamp
+    )
 
 
 async def check_bot_permissions():
-    """Check if the bot has all necessary permissions in both servers"""
+    """Check if the bot has all necessary permissions in every configured server"""
     required_permissions = {
         "kick_members": "Kick Members",
         "send_messages": "Send Messages",
@@ -449,67 +1704,57 @@ async def check_bot_permissions():
     }
     
     missing_permissions = {}
-    servers = {}
     
     try:
-        # Check permissions in Server A
-        server_a = bot.get_guild(SERVER_A_ID)
-        if server_a:
-            servers["Server A"] = server_a
-            missing_in_a = []
-            for perm_attr, perm_name in required_permissions.items():
-                if not getattr(server_a.me.guild_permissions, perm_attr):
-                    missing_in_a.append(perm_name)
-            if missing_in_a:
-                missing_permissions["Server A"] = missing_in_a
-        else:
-            await send_log(f"Cannot access reference server A (ID: {SERVER_A_ID})", "CRITICAL")
+        # Start from freshly computed channel permissions (this also runs after a reconnect)
+        channel_access.invalidate()
         
-        # Check permissions in Server B
-        server_b = bot.get_guild(SERVER_B_ID)
-        if server_b:
-            servers["Server B"] = server_b
-            missing_in_b = []
-            for perm_attr, perm_name in required_permissions.items():
-                if not getattr(server_b.me.guild_permissions, perm_attr):
-                    missing_in_b.append(perm_name)
-            if missing_in_b:
-                missing_permissions["Server B"] = missing_in_b
-        else:
-            await send_log(f"Cannot access target server B (ID: {SERVER_B_ID})", "CRITICAL")
-        
-        # Check channel permissions
-        for server_name, server in servers.items():
-            # Check warning channel
-            if WARNING_CHANNEL_ID and server.id == SERVER_B_ID:
-                channel = bot.get_channel(WARNING_CHANNEL_ID)
-                if channel:
-                    perms = channel.permissions_for(server.me)
-                    if not perms.send_messages or not perms.embed_links:
-                        await send_log(f"Bot doesn't have required permissions in warning channel (<#{WARNING_CHANNEL_ID}>)", "WARNING")
-                else:
-                    await send_log(f"Warning channel not found (ID: {WARNING_CHANNEL_ID})", "WARNING")
+        # Check permissions in every reference and target server on this process's shards
+        for guild_id in list(reference_indexes) + [guild_id for guild_id in targets if guild_id not in reference_indexes]:
+            if not shard_config.owns(guild_id):
+                continue
+            kind = "target" if guild_id in targets else "reference"
+            server = bot.get_guild(guild_id)
+            if not server:
+                send_log(f"Cannot access {kind} server (ID: {guild_id})", "CRITICAL")
+                continue
             
-            # Check log channel
-            if LOG_CHANNEL_ID and server.id == SERVER_A_ID:
-                channel = bot.get_channel(LOG_CHANNEL_ID)
-                if channel:
-                    perms = channel.permissions_for(server.me)
-                    if not perms.send_messages or not perms.embed_links:
-                        logger.warning(f"Bot doesn't have required permissions in log channel (<#{LOG_CHANNEL_ID}>)")
-                else:
-                    logger.warning(f"Log channel not found (ID: {LOG_CHANNEL_ID})")
+            missing = []
+            for perm_attr, perm_name in required_permissions.items():
+                if not getattr(server.me.guild_permissions, perm_attr):
+                    missing.append(perm_name)
+            if missing:
+                missing_permissions[f"{kind} server {server.name}"] = missing
+        
+        # Check warning channels
+        for target in owned_targets():
+            if not target.warning_channel_id:
+                continue
+            access = channel_access.resolve(target.warning_channel_id)
+            if access.channel is None:
+                send_log(f"Warning channel not found (ID: {target.warning_channel_id})", "WARNING")
+            elif access.missing:
+                send_log(f"Bot doesn't have required permissions in warning channel (<#{target.warning_channel_id}>): "
+                         f"{', '.join(access.missing)}", "WARNING")
+        
+        # Check log channel
+        if LOG_CHANNEL_ID:
+            access = channel_access.resolve(LOG_CHANNEL_ID)
+            if access.channel is None:
+                logger.warning(f"Log channel not found (ID: {LOG_CHANNEL_ID})")
+            elif access.missing:
+                logger.warning(f"Bot doesn't have required permissions in log channel (<#{LOG_CHANNEL_ID}>): {', '.join(access.missing)}")
         
         # Send missing permissions to log
         for server_name, missing_perms in missing_permissions.items():
             perms_text = ", ".join(missing_perms)
             message = f"Missing required permissions in {server_name}: {perms_text}"
-            await send_log(message, "CRITICAL")
+            send_log(message, "CRITICAL")
             
         return len(missing_permissions) == 0
             
     except Exception as e:
-        await send_log("Failed to check bot permissions", "ERROR", e)
+        send_log("Failed to check bot permissions", "ERROR", e)
         return False
 
 
@@ -518,65 +1763,92 @@ async def verify_channel_access(channel_id):
     if not channel_id:
         return False, "No channel ID provided"
         
-    channel = bot.get_channel(channel_id)
-    if not channel:
-        return False, f"Channel not found (ID: {channel_id})"
-        
-    # Check permissions
-    permissions = channel.permissions_for(channel.guild.me)
-    if not permissions.view_channel:
-        return False, f"Bot cannot view channel (ID: {channel_id})"
-    if not permissions.send_messages:
-        return False, f"Bot cannot send messages to channel (ID: {channel_id})"
-    if not permissions.embed_links:
-        return False, f"Bot cannot send embeds to channel (ID: {channel_id})"
+    problem = channel_access.describe(channel_id)
+    if problem:
+        return False, problem
         
     return True, "Channel accessible"
 
 
 
 
+def command_targets(ctx):
+    """Return the targets a command applies to: the server it was run in if that is a target, otherwise all of them"""
+    if ctx.guild and ctx.guild.id in targets:
+        return [targets[ctx.guild.id]]
+    return owned_targets()
+
 @bot.command(name="status")
 @commands.has_permissions(administrator=True)
 async def status_command(ctx):
     """Show the current bot status and configuration"""
-    server_a = bot.get_guild(SERVER_A_ID)
-    server_b = bot.get_guild(SERVER_B_ID)
+    selected = command_targets(ctx)
+    if len(selected) == 1:
+        await ctx.send(embed=build_status_embed(selected[0]))
+        return
     
+    # Run outside a target server: one line per target
     embed = discord.Embed(
         title="Member Check Bot - Status",
+        description=f"{len(selected)} target servers, {len(reference_indexes)} reference servers, {shard_config.describe()}",
         color=discord.Color.blue()
     )
-    
+    for target in selected[:24]:
+        embed.add_field(
+            name=f"{target.name} (ID: {target.guild_id})",
+            value=f"{len(target.rules)} rules, references: "
+                  f"{', '.join(reference_name(guild_id) for guild_id in target.reference_ids)}\n"
+                  f"{warning_store.count(target.guild_id)} warned",
+            inline=False
+        )
     embed.add_field(
-        name="Active Criteria",
-        value=f"Criteria {ACTIVE_CRITERIA}: {'Membership Check' if ACTIVE_CRITERIA == 1 else 'Role Check'}",
+        name="Action Lanes",
+        value=action_executor.summary(),
         inline=False
     )
+    await ctx.send(embed=embed)
+
+def role_label(guild_id, role_id):
+    """Return a reference server role's name and ID for the policy description"""
+    server = bot.get_guild(guild_id) or remote_references.cached_guild(guild_id)
+    role = server.get_role(role_id) if server else None
+    return f"{role.name if role else 'Not Found'} (ID: {role_id})"
+
+def build_status_embed(target):
+    """Create the status embed for one target server"""
+    server = bot.get_guild(target.guild_id)
     
-    embed.add_field(
-        name="Reference Server (A)",
-        value=f"{server_a.name if server_a else 'Not Found'} (ID: {SERVER_A_ID})",
-        inline=True
+    embed = discord.Embed(
+        title="Member Check Bot - Status",
+        color=discord.Color.blue()
     )
     
     embed.add_field(
-        name="Target Server (B)",
-        value=f"{server_b.name if server_b else 'Not Found'} (ID: {SERVER_B_ID})",
-        inline=True
+        name="Policy",
+        value="\n".join(target.policy.describe(reference_name, role_label))[:1024],
+        inline=False
     )
     
-    if ACTIVE_CRITERIA == 2 and server_a:
-        role = discord.utils.get(server_a.roles, id=ROLE_X_ID)
+    for reference in target.references:
+        reference_server = bot.get_guild(reference.guild_id) or remote_references.cached_guild(reference.guild_id)
+        index = reference_indexes[reference.guild_id]
         embed.add_field(
-            name="Required Role (X)",
-            value=f"{role.name if role else 'Not Found'} (ID: {ROLE_X_ID})",
-            inline=False
+            name="Reference Server",
+            value=f"{reference_server.name if reference_server else 'Not Found'} (ID: {reference.guild_id}), "
+                  f"{len(index)} members indexed{'' if index.warm else ' (loading)'}"
+                  f"{'' if shard_config.owns(reference.guild_id) else ' via API'}",
+            inline=True
         )
     
+    embed.add_field(
+        name="Target Server",
+        value=f"{server.name if server else 'Not Found'} (ID: {target.guild_id})",
+        inline=True
+    )
+    
     embed.add_field(
         name="Warning Period",
-        value=f"{WARNING_SECONDS/3600} hours",
+        value=f"{target.warning_seconds/3600} hours",
         inline=True
     )
     
@@ -586,16 +1858,57 @@ async def status_command(ctx):
         inline=True
     )
     
+    cursor = sweep_cursors.get(target.guild_id)
+    if cursor is not None:
+        embed.add_field(
+            name="Incremental Sweep",
+            value=f"{cursor.progress():.0%} of lap {cursor.laps + 1} ({SWEEP_SLICE_SIZE} members per slice)",
+            inline=True
+        )
+    
+    if SLIM_CACHE:
+        indexes = [target_indexes[target.guild_id]] + [reference_indexes[guild_id] for guild_id in target.reference_ids]
+        embed.add_field(
+            name="Member Cache",
+            value=f"Slim: {len(target_indexes[target.guild_id])} members indexed, "
+                  f"{sum(index.memory_bytes() for index in indexes) / 2 ** 20:.1f}MB",
+            inline=True
+        )
+    
+    embed.add_field(
+        name="Action Lanes",
+        value=f"{action_executor.summary()}\n"
+              f"DM outbox: {dm_outbox.qsize()} queued, {dm_outbox.sent} sent, {dm_outbox.failed} failed",
+        inline=False
+    )
+    
+    embed.add_field(
+        name="Discord API",
+        value=f"Circuit breaker {circuit_breaker.describe()}\n"
+              f"{len(retry_queue)} checks waiting for a retry ({retry_queue.gave_up} given up)",
+        inline=False
+    )
+    
+    if leader_lease is not None:
+        embed.add_field(
+            name="High Availability",
+            value=leader_lease.describe(),
+            inline=False
+        )
+    
     embed.add_field(
         name="Exempt Roles",
-        value=", ".join([str(role_id) for role_id in EXEMPT_ROLES]) if EXEMPT_ROLES else "None",
+        value=", ".join([str(role_id) for role_id in target.exempt_roles]) if target.exempt_roles else "None",
         inline=False
     )
     
     # Add currently warned users
+    warned_users = warning_store.pending(target.guild_id)
+    now = time.time()
     warned_users_text = "None" if not warned_users else "\n".join(
-        [f"<@{user_id}> - warned {(datetime.datetime.now() - time).seconds // 3600}h ago" 
-         for user_id, time in warned_users.items()][:10]  # Limit to first 10
+        [f"<@{user_id}> - warned {int(now - warning.warned_at) // 3600}h ago, "
+         f"deadline <t:{int(warning.deadline)}:R>"
+         for user_id, warning in list(warned_users.items())[:10]]  # Limit to first 10
     )
     
     embed.add_field(
@@ -604,37 +1917,213 @@ async def status_command(ctx):
         inline=False
     )
     
-    await ctx.send(embed=embed)
+    return embed
 
 @bot.command(name="checkall")
 @commands.has_permissions(administrator=True)
-async def checkall_command(ctx):
-    """Force check all members in server B"""
-    await ctx.send("Starting manual check of all members...")
-    await check_members_task()
-    await ctx.send("Manual check completed!")
+async def checkall_command(ctx, option: str = None, job_id: int = None):
+    """
+    Force check all members in the target server(s) in the background
+    Use --dry-run to only preview the plan, status to follow running checks and cancel [job ID] to stop them
+    """
+    if option == "--dry-run":
+        for target in command_targets(ctx):
+            await post_dry_run(ctx, target)
+        return
+    if option == "status":
+        await ctx.send(embed=build_sweep_status_embed(command_targets(ctx)))
+        return
+    if option == "cancel":
+        await cancel_sweeps(ctx, job_id)
+        return
+    if option is not None:
+        await ctx.send("Usage: `!checkall`, `!checkall --dry-run`, `!checkall status` or `!checkall cancel [job ID]`")
+        return
+    
+    lines = []
+    for target in command_targets(ctx):
+        async def manual_sweep(job, target=target):
+            await sweep_target(target, job)
+            await log_sink.flush()
+            await ctx.send(f"Manual check of {target.name} completed (#{job.id}): {job.members} members checked, "
+                           f"{job.warned} warned, {job.kicked} kicked")
+        
+        job, started = sweep_jobs.start(target.guild_id, target.name, manual_sweep)
+        if started:
+            lines.append(f"Started manual check of {target.name} (#{job.id})")
+        else:
+            lines.append(f"{target.name} is already being checked (#{job.id}, {job.stage})")
+    lines.append("Use `!checkall status` to follow progress or `!checkall cancel` to stop.")
+    await ctx.send("\n".join(lines))
+
+def build_sweep_status_embed(selected):
+    """Create the !checkall status embed: sweeps in flight and the most recent finished ones"""
+    guild_ids = {target.guild_id for target in selected}
+    embed = discord.Embed(title="Member Check Bot - Sweeps", color=discord.Color.blue())
+    
+    active = [job.describe() for guild_id, job in sweep_jobs.active.items() if guild_id in guild_ids]
+    embed.add_field(name="In Flight", value="\n".join(active)[:1024] if active else "None", inline=False)
+    
+    recent = [job.describe() for job in sweep_jobs.history if job.guild_id in guild_ids][:5]
+    embed.add_field(name="Recent", value="\n".join(recent)[:1024] if recent else "None", inline=False)
+    
+    for target in selected:
+        cursor = sweep_cursors.get(target.guild_id)
+        if cursor is not None and cursor.in_lap:
+            embed.add_field(name=f"Incremental ({target.name})", value=f"{cursor.progress():.0%} of the lap done", inline=False)
+    return embed
+
+async def cancel_sweeps(ctx, job_id=None):
+    """Cancel one sweep job by ID, or every sweep in flight for the command's targets"""
+    if job_id is not None:
+        job = sweep_jobs.find(job_id)
+        jobs = [job] if job is not None and job.guild_id in {target.guild_id for target in command_targets(ctx)} else []
+    else:
+        jobs = [sweep_jobs.active[target.guild_id] for target in command_targets(ctx) if target.guild_id in sweep_jobs.active]
+    
+    if not jobs:
+        await ctx.send("No matching check is running.")
+        return
+    for job in jobs:
+        sweep_jobs.cancel(job)
+    await ctx.send("\n".join(f"Cancelled check #{job.id} of {job.name} during {job.stage} "
+                             f"({job.done}/{job.total}); actions already taken stay in place" for job in jobs))
+
+async def post_dry_run(ctx, target):
+    """Post the enforcement plan for a target server without acting on it"""
+    server = bot.get_guild(target.guild_id)
+    if not server:
+        await ctx.send(f"Target server {target.guild_id} not found.")
+        return
+    
+    await indexes_ready()
+    await prepare_reference_indexes(target)
+    if not all(reference_indexes[guild_id].warm for guild_id in target.reference_ids):
+        await ctx.send(f"Reference index for {target.name} is not ready yet.")
+        return
+    
+    if target.guild_id in target_indexes:
+        if not target_indexes[target.guild_id].warm:
+            await warm_target_index(target.guild_id)
+    elif not server.chunked:
+        await server.chunk()
+    plan = build_enforcement_plan(target, server)
+    
+    embed = discord.Embed(
+        title=f"Member Check Bot - Dry Run ({target.name})",
+        description=plan.summary(),
+        color=discord.Color.blue()
+    )
+    
+    for name, user_ids in (("Would warn", plan.warn), ("Would kick", plan.kick), ("Would clear", plan.clear)):
+        mentions = [f"<@{user_id}>" for user_id in list(user_ids)[:10]]  # Limit to first 10
+        embed.add_field(
+            name=f"{name} ({len(user_ids)})",
+            value="\n".join(mentions) if mentions else "None",
+            inline=False
+        )
+    
+    await ctx.send(embed=embed)
+
+@bot.command(name="metrics")
+@commands.has_permissions(administrator=True)
+async def metrics_command(ctx):
+    """Show the bot's sweep and action metrics"""
+    summary = metrics.summary()
+    if len(summary) > 1900:
+        summary = summary[:1897] + "..."
+    await ctx.send(f"```\n{summary}\n```")
+
+@bot.command(name="profile")
+@commands.has_permissions(administrator=True)
+async def profile_command(ctx, seconds: float = 10):
+    """Profile the running bot for a few seconds and upload a CPU profile and a memory snapshot"""
+    if not 1 <= seconds <= PROFILE_MAX_SECONDS:
+        await ctx.send(f"Profile for 1 to {PROFILE_MAX_SECONDS:.0f} seconds, e.g. `!profile 30`.")
+        return
+    if profile_lock.locked():
+        await ctx.send("A profile is already being captured.")
+        return
+    
+    async with profile_lock:
+        await ctx.send(f"Profiling for {seconds:g}s...")
+        # Slow callbacks are watched during the capture even when SLOW_CALLBACK_MS is off
+        was_installed = slow_callback_monitor.installed
+        slow_callback_monitor.install()
+        started_at = time.time()
+        before = time_spent()
+        try:
+            profiler, memory = await capture_profile(seconds)
+        finally:
+            if not was_installed:
+                slow_callback_monitor.uninstall()
+        spent = {part: value - before.get(part, 0) for part, value in time_spent().items()}
+        slow = slow_callback_monitor.since(started_at)
+    
+    cpu = profiler.report()
+    if slow:
+        cpu += f"\nEvent loop callbacks over {slow_callback_monitor.threshold * 1000:.0f}ms:\n"
+        cpu += "\n".join(f"{callback.seconds * 1000:8.0f}ms  {callback.description}" for callback in slow) + "\n"
+    
+    busiest = profiler.top(1)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    await ctx.send(
+        f"Profiled {seconds:g}s: {profiler.samples} samples, {profiler.idle() / max(profiler.samples, 1):.0%} idle"
+        + (f", busiest function {busiest[0][0]} ({busiest[0][1] / profiler.samples:.0%})" if busiest else "") + "\n"
+        + ", ".join(f"{part} {value:.2f}s" for part, value in spent.items()) + "\n"
+        + f"{len(slow)} slow event loop callbacks" + (f" (longest {max(callback.seconds for callback in slow) * 1000:.0f}ms)" if slow else ""),
+        files=[
+            discord.File(io.BytesIO(cpu.encode()), filename=f"cpu-{stamp}.txt"),
+            discord.File(io.BytesIO(profiler.folded().encode()), filename=f"cpu-{stamp}.folded"),
+            discord.File(io.BytesIO(memory.encode()), filename=f"memory-{stamp}.txt"),
+        ]
+    )
+
+def time_spent():
+    """Seconds spent so far on REST waits, send_log and log embeds, and in each sweep stage"""
+    spent = {
+        "REST wait": rest_seconds.total(),
+        "send_log": send_log_seconds.total(),
+        "log embeds": log_sink.build_seconds,
+    }
+    for (stage,), value in sweep_stage_seconds.values().items():
+        spent[f"sweep {stage}"] = value
+    return spent
 
 @bot.command(name="check")
 @commands.has_permissions(administrator=True)
 async def check_command(ctx, user_id: int):
     """Check a specific user by ID"""
     try:
-        server_b = bot.get_guild(SERVER_B_ID)
-        member = server_b.get_member(user_id)
-        
-        if not member:
-            await ctx.send(f"User with ID {user_id} not found in server B.")
-            return
+        found = False
+        for target in command_targets(ctx):
+            server = bot.get_guild(target.guild_id)
+            member = await resolve_member(server, user_id) if server else None
+            if not member:
+                continue
             
-        result = await check_single_member(member, immediate=True)
-        await ctx.send(f"Check result for {member.name}: {result}")
+            found = True
+            result = await check_single_member(member, immediate=True)
+            delivery = dm_outbox.state(member.id)
+            last_dm = f" (last DM: {delivery.kind}, {delivery.status})" if delivery else ""
+            await ctx.send(f"Check result for {member.name} in {target.name}: {result}{last_dm}")
+        
+        if not found:
+            await ctx.send(f"User with ID {user_id} not found in any target server.")
     except Exception as e:
         await ctx.send(f"Error checking user: {e}")
 
+@bot.check
+async def leader_only(ctx):
+    """In HA mode only the leader answers commands, so each command gets one reply"""
+    return is_leader()
+
 @bot.event
 async def on_command_error(ctx, error):
     if isinstance(error, commands.errors.CommandNotFound):
         return
+    if isinstance(error, commands.errors.CheckFailure) and not is_leader():
+        return
     if isinstance(error, commands.errors.MissingPermissions):
         await ctx.send("You don't have permission to use this command.")
         return
@@ -646,10 +2135,28 @@ if __name__ == "__main__":
     if not TOKEN:
         logger.critical("No Discord token provided. Please set TOKEN in .env file.")
         exit(1)
-        
-    if not SERVER_A_ID or not SERVER_B_ID:
-        logger.critical("Server IDs not properly configured. Check SERVER_A_ID and SERVER_B_ID in .env file.")
+    
+    if not targets:
+        logger.critical("No target servers configured. Set SERVER_A_ID and SERVER_B_ID, or GUILDS_CONFIG, in .env file.")
         exit(1)
     
+    # Reload warnings that were pending before the last shutdown
+    warning_store.load()
+    dm_outbox.load()
+    if leader_lease is not None:
+        leader_lease.open()
+    
+    # Restore the member indexes saved before the last shutdown
+    restore_snapshots()
+    
     logger.info("Starting bot...")
-    bot.run(TOKEN)
+    try:
+        bot.run(TOKEN)
+    finally:
+        warning_store.close()
+        dm_outbox.close()
+        if event_journal:
+            event_journal.close()
+        # Hand over straight away rather than after LEASE_TTL
+        if leader_lease is not None:
+            leader_lease.close()
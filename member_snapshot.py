@@ -0,0 +1,139 @@
+import array
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+
+logger = logging.getLogger("MemberCheckBot")
+
+MAGIC = b"MCSNAP01"
+
+# magic, guild ID, taken at (unix time), member count, role count, role set count, role set width in bytes, CRC32 of the body
+HEADER = struct.Struct("<8sQdQIIII")
+
+
+class MemberSnapshot:
+    """
+    A guild's member IDs and role sets as flat arrays, in the layout written to disk
+    ids is sorted; masks[i] is the index into mask_values of ids[i]'s role set, a bitmask over role_ids
+    """
+
+    def __init__(self, guild_id, ids, masks, role_ids, mask_values, taken_at=None):
+        self.guild_id = guild_id
+        self.ids = ids
+        self.masks = masks
+        self.role_ids = list(role_ids)
+        self.mask_values = list(mask_values)
+        self.taken_at = time.time() if taken_at is None else taken_at
+
+    @classmethod
+    def from_roles(cls, guild_id, member_roles):
+        """Build a snapshot from a {user ID: role IDs} mapping"""
+        role_bits = {}
+        mask_values = [0]
+        mask_lookup = {0: 0}
+        ids = array.array("Q", sorted(member_roles))
+        masks = array.array("I")
+        for user_id in ids:
+            mask = 0
+            for role_id in member_roles[user_id]:
+                bit = role_bits.get(role_id)
+                if bit is None:
+                    bit = role_bits[role_id] = len(role_bits)
+                mask |= 1 << bit
+            index = mask_lookup.get(mask)
+            if index is None:
+                index = mask_lookup[mask] = len(mask_values)
+                mask_values.append(mask)
+            masks.append(index)
+        return cls(guild_id, ids, masks, sorted(role_bits, key=role_bits.get), mask_values)
+
+    def roles_of(self, mask_index):
+        """Return the role IDs of one role set"""
+        value = self.mask_values[mask_index]
+        return frozenset(role_id for bit, role_id in enumerate(self.role_ids) if value >> bit & 1)
+
+    def entries(self):
+        """Yield (user ID, frozenset of role IDs) for every member"""
+        role_sets = [self.roles_of(index) for index in range(len(self.mask_values))]
+        for user_id, mask_index in zip(self.ids, self.masks):
+            yield user_id, role_sets[mask_index]
+
+    def age(self):
+        return time.time() - self.taken_at
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _mask_width(role_count):
+    # Whole 8-byte words, so the member arrays after the table stay aligned
+    return max(1, (role_count + 63) // 64) * 8
+
+
+def write_snapshot(path, snapshot):
+    """Write a snapshot atomically (to a temporary file, then renamed over path)"""
+    width = _mask_width(len(snapshot.role_ids))
+    body = b"".join([
+        array.array("Q", snapshot.role_ids).tobytes(),
+        b"".join(value.to_bytes(width, "little") for value in snapshot.mask_values),
+        snapshot.ids.tobytes(),
+        snapshot.masks.tobytes(),
+    ])
+    header = HEADER.pack(
+        MAGIC, snapshot.guild_id, snapshot.taken_at, len(snapshot.ids),
+        len(snapshot.role_ids), len(snapshot.mask_values), width, zlib.crc32(body)
+    )
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(header)
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def read_snapshot(path, guild_id):
+    """Map a snapshot file and load its arrays, or return None if it is missing or unusable"""
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return _parse(mapped, guild_id)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, struct.error) as e:
+        logger.warning(f"Ignoring member snapshot {path}: {e}")
+        return None
+
+
+def _parse(mapped, guild_id):
+    magic, stored_guild_id, taken_at, count, role_count, mask_count, width, crc = HEADER.unpack_from(mapped)
+    if magic != MAGIC:
+        raise ValueError("not a member snapshot")
+    if stored_guild_id != guild_id:
+        raise ValueError(f"snapshot is for guild {stored_guild_id}")
+
+    with memoryview(mapped) as view:
+        if zlib.crc32(view[HEADER.size:]) != crc:
+            raise ValueError("checksum mismatch")
+
+        offset = HEADER.size
+        role_ids = array.array("Q")
+        role_ids.frombytes(view[offset:offset + 8 * role_count])
+        offset += 8 * role_count
+        mask_values = [
+            int.from_bytes(view[start:start + width], "little")
+            for start in range(offset, offset + width * mask_count, width)
+        ]
+        offset += width * mask_count
+        ids = array.array("Q")
+        ids.frombytes(view[offset:offset + 8 * count])
+        offset += 8 * count
+        masks = array.array("I")
+        masks.frombytes(view[offset:offset + masks.itemsize * count])
+
+    if len(ids) != count or len(masks) != count:
+        raise ValueError("truncated")
+    return MemberSnapshot(guild_id, ids, masks, role_ids, mask_values, taken_at)
@@ -0,0 +1,289 @@
+import asyncio
+import bisect
+import logging
+import math
+import time
+
+from aiohttp import web
+
+logger = logging.getLogger("MemberCheckBot")
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+
+class Metric:
+    """Base for a named metric with optional labels"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self):
+        """Yield (suffix, labels text, value) tuples"""
+        return []
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def total(self):
+        return sum(self._values.values())
+
+    def values(self):
+        """Return {label values tuple -> value}"""
+        return dict(self._values)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield "_total", self._format_labels(key), value
+
+
+class Gauge(Metric):
+    """Value that can go up and down, either set directly or read from a callback"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        # function() returns a number, or a {label tuple -> number} dict for labelled gauges
+        self._function = function
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def value(self, **labels):
+        return self._current().get(self._key(labels), 0)
+
+    def _current(self):
+        if self._function is None:
+            return self._values
+        try:
+            result = self._function()
+        except Exception as e:
+            logger.debug(f"Gauge {self.name} callback failed: {e}")
+            return {}
+        return result if isinstance(result, dict) else {(): result}
+
+    def samples(self):
+        for key, value in sorted(self._current().items()):
+            yield "", self._format_labels(key), value
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self._counts):
+            self._counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def time(self):
+        """Context manager that observes the elapsed time of its block"""
+        return _Timer(self)
+
+    def quantile(self, q):
+        """Approximate a quantile from the bucket boundaries"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self._counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return self.max
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self._counts):
+            cumulative += count
+            yield "_bucket", self._format_labels((), ("le", _format_value(bound))), cumulative
+        yield "_bucket", self._format_labels((), ("le", "+Inf")), self.count
+        yield "_sum", "", self.sum
+        yield "_count", "", self.count
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together in Prometheus text format"""
+
+    def __init__(self, namespace="membercheck"):
+        self.namespace = namespace
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(f"{self.namespace}_{name}", documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self._register(Gauge(f"{self.namespace}_{name}", documentation, labelnames, function))
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(f"{self.namespace}_{name}", documentation, buckets))
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+    def summary(self):
+        """Return a short human-readable line per metric (used by !metrics)"""
+        lines = []
+        for metric in self._metrics:
+            short_name = metric.name[len(self.namespace) + 1:]
+            if isinstance(metric, Histogram):
+                if metric.count:
+                    lines.append(
+                        f"{short_name}: n={metric.count} avg={metric.sum / metric.count:.3f} "
+                        f"p50<={_format_value(metric.quantile(0.5))} p99<={_format_value(metric.quantile(0.99))} "
+                        f"max={metric.max:.3f}"
+                    )
+                else:
+                    lines.append(f"{short_name}: n=0")
+                continue
+            values = [(labels, value) for _, labels, value in metric.samples()]
+            if not values:
+                lines.append(f"{short_name}: 0")
+            elif len(values) == 1 and not values[0][0]:
+                lines.append(f"{short_name}: {_format_value(values[0][1])}")
+            else:
+                lines.append(f"{short_name}: " + ", ".join(f"{labels}={_format_value(value)}" for labels, value in values))
+        return "\n".join(lines)
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+class LoopLagMonitor:
+    """Measures how late a short periodic sleep wakes up, i.e. how long the event loop was blocked"""
+
+    def __init__(self, interval=0.5, observe=None):
+        self.interval = interval
+        # observe(lag_seconds) is called with every sample
+        self.observe = observe
+        self.samples = []
+        self.keep_samples = observe is None
+        self.last = 0.0
+        self._task = None
+
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, loop.time() - started - self.interval)
+            if self.keep_samples:
+                self.samples.append(self.last)
+            if self.observe is not None:
+                self.observe(self.last)
+
+    def max(self):
+        return max(self.samples, default=0.0)
+
+    def mean(self):
+        return sum(self.samples) / len(self.samples) if self.samples else 0.0
+
+
+async def start_http_server(registry, host="127.0.0.1", port=9100):
+    """Serve registry.render() at /metrics; returns the runner so it can be cleaned up"""
+    async def handle_metrics(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return runner
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
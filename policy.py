@@ -0,0 +1,395 @@
+import collections
+import time
+
+REASON_NOT_MEMBER = "not_member"
+REASON_MISSING_ROLE = "missing_role"
+REASON_ACCOUNT_AGE = "account_age"
+
+# Discord snowflakes carry their creation time in milliseconds since this epoch, shifted left 22 bits
+DISCORD_EPOCH_MS = 1420070400000
+
+# Verdicts are memoized per distinct member mask; the table is dropped if it grows past this
+VERDICT_CACHE_SIZE = 65536
+
+# Member of guild_id, holding at least one of any_roles (when not empty) and every one of all_roles
+Requirement = collections.namedtuple("Requirement", ["guild_id", "any_roles", "all_roles"])
+
+# The rule a member fails and the reason code
+Violation = collections.namedtuple("Violation", ["rule", "reason"])
+
+
+class Rule:
+    """One compliance rule of a target server"""
+
+    def __init__(self, name, requirements, match="any", exempt_roles=(), min_account_age=0, min_join_age=0,
+                 warning_seconds=16800):
+        if match not in ("any", "all"):
+            raise ValueError(f"Rule {name!r}: match must be 'any' or 'all', not {match!r}")
+        self.name = name
+        # Members comply by meeting any one (or all) of these requirements
+        self.requirements = [
+            Requirement(requirement.guild_id, frozenset(requirement.any_roles), frozenset(requirement.all_roles))
+            for requirement in requirements
+        ]
+        self.match = match
+        # Target server roles whose holders this rule does not apply to
+        self.exempt_roles = frozenset(exempt_roles)
+        # Accounts younger than this (seconds) fail the rule
+        self.min_account_age = min_account_age
+        # The rule only applies once a member has been in the target server this long (seconds)
+        self.min_join_age = min_join_age
+        self.warning_seconds = warning_seconds
+
+    @property
+    def guild_ids(self):
+        return [requirement.guild_id for requirement in self.requirements]
+
+    def __repr__(self):
+        return f"<Rule {self.name!r} match={self.match} requirements={self.requirements}>"
+
+
+def legacy_rules(references, criteria, warning_seconds):
+    """The single rule ACTIVE_CRITERIA 1 (membership) or 2 (required role) stands for, over any of the references"""
+    if criteria == 1:
+        requirements = [Requirement(reference.guild_id, (), ()) for reference in references]
+        return [Rule("Criteria 1: Membership Check", requirements, warning_seconds=warning_seconds)]
+    if criteria == 2:
+        requirements = [Requirement(reference.guild_id, (reference.role_id,), ()) for reference in references]
+        return [Rule("Criteria 2: Role Check", requirements, warning_seconds=warning_seconds)]
+    return []
+
+
+def account_cutoff(age, now):
+    """Lowest user ID created less than age seconds before now; older accounts have smaller IDs"""
+    return (int((now - age) * 1000) - DISCORD_EPOCH_MS + 1) << 22
+
+
+_CompiledRule = collections.namedtuple(
+    "_CompiledRule", ["rule", "exempt", "account", "join", "clauses", "guilds", "match_all", "not_member", "missing_role"]
+)
+
+_MISSING = object()
+
+
+class CompiledPolicy:
+    """
+    A target server's rules compiled into bitmask tests
+    A member is described by one integer: a bit per reference server they are in and per rule role they hold there,
+    plus bits for the target side (exempt roles held, account and join age thresholds passed). Role sets are
+    interned into masks and verdicts memoized per mask, so a member costs a few dict lookups however many rules apply.
+    """
+
+    def __init__(self, rules, exempt_roles=()):
+        self.rules = list(rules)
+        self.exempt_roles = frozenset(exempt_roles)
+        # Reference guild ID -> membership bit, and -> {role ID: bit}
+        self._member_bits = {}
+        self._role_bits = {}
+        # Target server role ID -> bit
+        self._target_role_bits = {}
+        # Age threshold in seconds -> bit set when the account (or membership) is at least that old
+        self._account_bits = {}
+        self._join_bits = {}
+        self._bit_count = 0
+
+        for rule in self.rules:
+            for requirement in rule.requirements:
+                self._member_bit(requirement.guild_id)
+                for role_id in requirement.any_roles | requirement.all_roles:
+                    self._role_bit(requirement.guild_id, role_id)
+            for role_id in rule.exempt_roles:
+                self._target_bit(role_id)
+            if rule.min_account_age:
+                self._account_bits.setdefault(rule.min_account_age, self._next_bit())
+            if rule.min_join_age:
+                self._join_bits.setdefault(rule.min_join_age, self._next_bit())
+
+        self.reference_ids = list(self._member_bits)
+        self._compiled = [self._compile(rule) for rule in self.rules]
+        # Target-side bits of a member every rule applies to and who passes every age check
+        self._baseline = sum(self._account_bits.values()) + sum(self._join_bits.values())
+        self._guild_masks = {guild_id: {} for guild_id in self._member_bits}
+        self._target_masks = {}
+        self._verdicts = {}
+
+    def guild_mask(self, guild_id, role_ids):
+        """Mask of a user's standing in one reference server, from their role IDs there (None = not a member)"""
+        if role_ids is None or guild_id not in self._member_bits:
+            return 0
+        if not isinstance(role_ids, frozenset):
+            role_ids = frozenset(role_ids)
+        cache = self._guild_masks[guild_id]
+        mask = cache.get(role_ids)
+        if mask is None:
+            bits = self._role_bits[guild_id]
+            mask = self._member_bits[guild_id]
+            for role_id in role_ids:
+                mask |= bits.get(role_id, 0)
+            if len(cache) < VERDICT_CACHE_SIZE:
+                cache[role_ids] = mask
+        return mask
+
+    def reference_mask(self, user_id, reference_indexes):
+        """Mask of a user's standing in every reference server, from warm indexes"""
+        mask = 0
+        for guild_id in self.reference_ids:
+            mask |= self.guild_mask(guild_id, reference_indexes[guild_id].roles_of(user_id))
+        return mask
+
+    def target_mask(self, role_ids, user_id, joined_at=None, now=None):
+        """
+        Mask of a member's target server side: exempt roles held and age thresholds passed
+        joined_at is a datetime; when it is unknown the member counts as having been there long enough
+        """
+        mask = self._target_role_mask(role_ids)
+        if self._account_bits or self._join_bits:
+            now = time.time() if now is None else now
+            for age, bit in self._account_bits.items():
+                if user_id < account_cutoff(age, now):
+                    mask |= bit
+            for age, bit in self._join_bits.items():
+                if joined_at is None or now - joined_at.timestamp() >= age:
+                    mask |= bit
+        return mask
+
+    @property
+    def max_join_age(self):
+        """The longest min_join_age of any rule (0 if none); join times older than this do not matter"""
+        return max(self._join_bits, default=0)
+
+    def is_exempt(self, role_ids):
+        """Return True if any of the target server role IDs (an iterable, or None) is an exempt role"""
+        return role_ids is not None and not self.exempt_roles.isdisjoint(role_ids)
+
+    def evaluate(self, mask):
+        """Return the first Violation for a member mask (reference | target side), or None if it complies"""
+        verdict = self._verdicts.get(mask, _MISSING)
+        if verdict is _MISSING:
+            if len(self._verdicts) >= VERDICT_CACHE_SIZE:
+                self._verdicts.clear()
+            verdict = self._verdicts[mask] = self._evaluate(mask)
+        return verdict
+
+    def satisfied_by(self, reference_mask):
+        """Return True if this reference standing meets every rule (ignoring exemptions, with ages passed)"""
+        return self.evaluate(reference_mask | self._baseline) is None
+
+    def violations_of(self, user_ids, reference_indexes, target_roles, now=None, joined_at=None):
+        """
+        Return {user ID: Violation} for a few users, evaluated one mask at a time; target_roles(user_id) gives role IDs
+        joined_at(user_id) gives the datetime a member joined the target server, or None if unknown (long enough ago)
+        """
+        now = time.time() if now is None else now
+        # Target roles only matter to rules with exemptions of their own
+        rule_exemptions = any(compiled.exempt for compiled in self._compiled)
+        target_side = rule_exemptions or self._account_bits or self._join_bits
+        lookups = [(guild_id, reference_indexes[guild_id].roles_of, self._guild_masks[guild_id]) for guild_id in self.reference_ids]
+        violations = {}
+        for user_id in user_ids:
+            mask = 0
+            for guild_id, roles_of, masks in lookups:
+                role_ids = roles_of(user_id)
+                if role_ids is not None:
+                    guild_mask = masks.get(role_ids)
+                    mask |= guild_mask if guild_mask is not None else self.guild_mask(guild_id, role_ids)
+            if target_side:
+                mask |= self.target_mask(
+                    target_roles(user_id) if rule_exemptions else None, user_id,
+                    joined_at(user_id) if joined_at and self._join_bits else None, now
+                )
+            violation = self.evaluate(mask)
+            if violation is not None:
+                violations[user_id] = violation
+        return violations
+
+    def find_violations(self, candidates, reference_indexes, target_holders, now=None, recent_joiners=None):
+        """
+        Return {user ID: Violation} for a whole server's candidates using set algebra over the indexes
+        target_holders(role_ids) returns the target members holding any of those roles
+        recent_joiners(age) returns the target members who joined less than age seconds ago; without it every member
+        counts as having been there long enough, as in target_mask
+        """
+        now = time.time() if now is None else now
+        violations = {}
+        remaining = candidates
+        for position, compiled in enumerate(self._compiled):
+            rule = compiled.rule
+            applicable = remaining
+            if rule.exempt_roles:
+                applicable = applicable - target_holders(rule.exempt_roles)
+            # Members still in this rule's join grace are judged by the later rules only, as in evaluate()
+            if rule.min_join_age and recent_joiners is not None:
+                applicable = applicable - recent_joiners(rule.min_join_age)
+
+            failed = set()
+            if rule.min_account_age:
+                newest = account_cutoff(rule.min_account_age, now)
+                too_new = {user_id for user_id in applicable if user_id >= newest}
+                violations.update(dict.fromkeys(too_new, Violation(rule, REASON_ACCOUNT_AGE)))
+                applicable = applicable - too_new
+                failed |= too_new
+
+            if rule.requirements:
+                failing = applicable - self._passing(compiled, applicable, reference_indexes)
+                in_guilds = self._in_guilds(compiled, failing, reference_indexes)
+                violations.update(dict.fromkeys(failing - in_guilds, compiled.not_member))
+                violations.update(dict.fromkeys(in_guilds, compiled.missing_role))
+                failed |= failing
+
+            # Members failing this rule are not evaluated against later ones
+            if failed and position < len(self._compiled) - 1:
+                remaining = remaining - failed
+        return violations
+
+    def describe(self, guild_name=str, role_name=lambda guild_id, role_id: str(role_id)):
+        """Return the compiled policy as text lines for !status"""
+        lines = []
+        for compiled in self._compiled:
+            rule = compiled.rule
+            parts = []
+            for requirement in rule.requirements:
+                text = f"in {guild_name(requirement.guild_id)}"
+                if requirement.any_roles:
+                    text += f" with any of {', '.join(role_name(requirement.guild_id, r) for r in sorted(requirement.any_roles))}"
+                if requirement.all_roles:
+                    text += f" with all of {', '.join(role_name(requirement.guild_id, r) for r in sorted(requirement.all_roles))}"
+                parts.append(text)
+            joiner = " and " if rule.match == "all" else " or "
+            line = f"**{rule.name}**: {joiner.join(parts) or 'no server requirement'}"
+            if rule.min_account_age:
+                line += f"; account at least {rule.min_account_age / 86400:.3g} days old"
+            if rule.min_join_age:
+                line += f"; applies after {rule.min_join_age / 3600:.3g} hours in the server"
+            if rule.exempt_roles:
+                line += f"; not for roles {', '.join(str(role_id) for role_id in sorted(rule.exempt_roles))}"
+            line += f"; {rule.warning_seconds / 3600:.3g} hours to comply"
+            lines.append(line)
+        if not lines:
+            lines.append("No rules (nobody is warned)")
+        lines.append(f"Compiled to {self._bit_count} bits, {len(self._verdicts)} member masks seen")
+        return lines
+
+    def _compile(self, rule):
+        exempt = 0
+        for role_id in rule.exempt_roles:
+            exempt |= self._target_role_bits[role_id]
+        clauses = []
+        guilds = 0
+        for requirement in rule.requirements:
+            required = self._member_bits[requirement.guild_id]
+            guilds |= required
+            for role_id in requirement.all_roles:
+                required |= self._role_bits[requirement.guild_id][role_id]
+            any_mask = 0
+            for role_id in requirement.any_roles:
+                any_mask |= self._role_bits[requirement.guild_id][role_id]
+            clauses.append((required, any_mask))
+        return _CompiledRule(
+            rule,
+            exempt,
+            self._account_bits.get(rule.min_account_age, 0),
+            self._join_bits.get(rule.min_join_age, 0),
+            tuple(clauses),
+            guilds,
+            # A rule without server requirements has nothing to match
+            rule.match == "all" or not rule.requirements,
+            Violation(rule, REASON_NOT_MEMBER),
+            Violation(rule, REASON_MISSING_ROLE),
+        )
+
+    def _evaluate(self, mask):
+        for compiled in self._compiled:
+            if mask & compiled.exempt or mask & compiled.join != compiled.join:
+                continue
+            if mask & compiled.account != compiled.account:
+                return Violation(compiled.rule, REASON_ACCOUNT_AGE)
+
+            met = [mask & required == required and (not any_mask or bool(mask & any_mask))
+                   for required, any_mask in compiled.clauses]
+            if all(met) if compiled.match_all else any(met):
+                continue
+
+            if compiled.match_all:
+                in_guilds = mask & compiled.guilds == compiled.guilds
+            else:
+                in_guilds = bool(mask & compiled.guilds)
+            return compiled.missing_role if in_guilds else compiled.not_member
+        return None
+
+    def _passing(self, compiled, applicable, reference_indexes):
+        """Members of applicable meeting the rule's requirements"""
+        passing = None
+        for requirement in compiled.rule.requirements:
+            index = reference_indexes[requirement.guild_id]
+            if len(requirement.any_roles) == 1:
+                # The index's own holder set, intersected without a copy
+                holders = applicable & index.role_holders(next(iter(requirement.any_roles)))
+            elif requirement.any_roles:
+                holders = applicable & index.holders_of_any(requirement.any_roles)
+            else:
+                holders = applicable & index.member_ids
+            for role_id in requirement.all_roles:
+                holders &= index.role_holders(role_id)
+
+            if passing is None:
+                passing = holders
+            elif compiled.match_all:
+                passing &= holders
+            else:
+                passing |= holders
+        return passing
+
+    def _in_guilds(self, compiled, user_ids, reference_indexes):
+        """Members of user_ids who are in the rule's reference servers (any of them, or all for match all)"""
+        found = set() if not compiled.match_all else set(user_ids)
+        for guild_id in compiled.rule.guild_ids:
+            index = reference_indexes[guild_id]
+            if compiled.match_all:
+                found = {user_id for user_id in found if index.contains(user_id)}
+            else:
+                found |= {user_id for user_id in user_ids if index.contains(user_id)}
+        return found
+
+    def _target_role_mask(self, role_ids):
+        if not self._target_role_bits or not role_ids:
+            return 0
+        if not isinstance(role_ids, frozenset):
+            role_ids = frozenset(role_ids)
+        mask = self._target_masks.get(role_ids)
+        if mask is None:
+            mask = 0
+            for role_id in role_ids:
+                mask |= self._target_role_bits.get(role_id, 0)
+            if len(self._target_masks) < VERDICT_CACHE_SIZE:
+                self._target_masks[role_ids] = mask
+        return mask
+
+    def _next_bit(self):
+        bit = 1 << self._bit_count
+        self._bit_count += 1
+        return bit
+
+    def _member_bit(self, guild_id):
+        if guild_id not in self._member_bits:
+            self._member_bits[guild_id] = self._next_bit()
+            self._role_bits[guild_id] = {}
+        return self._member_bits[guild_id]
+
+    def _role_bit(self, guild_id, role_id):
+        bits = self._role_bits[guild_id]
+        if role_id not in bits:
+            bits[role_id] = self._next_bit()
+        return bits[role_id]
+
+    def _target_bit(self, role_id):
+        if role_id not in self._target_role_bits:
+            self._target_role_bits[role_id] = self._next_bit()
+        return self._target_role_bits[role_id]
+
+
+def in_join_grace(rule, member, now=None):
+    """Return True if the member joined the target server too recently for the rule to apply"""
+    if not rule.min_join_age or member.joined_at is None:
+        return False
+    now = time.time() if now is None else now
+    return now - member.joined_at.timestamp() < rule.min_join_age
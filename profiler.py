@@ -0,0 +1,218 @@
+import asyncio
+import collections
+import logging
+import os
+import selectors
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger("MemberCheckBot")
+
+# A callback that held the event loop: when it ended (unix time), how long it ran and what it was
+SlowCallback = collections.namedtuple("SlowCallback", ["at", "seconds", "description"])
+
+ASYNCIO_DIR = os.path.dirname(asyncio.__file__)
+
+
+class SlowCallbackMonitor:
+    """
+    Reports event loop callbacks (one step of a task, a timer, an I/O handler) that run longer than threshold seconds
+    Works by timing asyncio's Handle._run, so it costs two clock reads per callback while installed
+    """
+
+    def __init__(self, threshold=0.1, observe=None, keep=50, log_interval=10.0):
+        self.threshold = threshold
+        # observe(seconds, description) is called for every slow callback
+        self.observe = observe
+        self.log_interval = log_interval
+        self.count = 0
+        # The most recent slow callbacks, newest last
+        self.recent = collections.deque(maxlen=keep)
+        self._original = None
+        self._logged_at = 0.0
+        self._unlogged = 0
+
+    @property
+    def installed(self):
+        return self._original is not None
+
+    def install(self):
+        if self._original is not None:
+            return
+        original = self._original = asyncio.events.Handle._run
+        monitor = self
+
+        def _run(handle):
+            started = time.perf_counter()
+            try:
+                return original(handle)
+            finally:
+                elapsed = time.perf_counter() - started
+                if elapsed >= monitor.threshold:
+                    monitor._record(handle, elapsed)
+
+        asyncio.events.Handle._run = _run
+
+    def uninstall(self):
+        if self._original is not None:
+            asyncio.events.Handle._run = self._original
+            self._original = None
+
+    def since(self, started_at):
+        """Return the recorded slow callbacks that ended after started_at (unix time)"""
+        return [callback for callback in self.recent if callback.at >= started_at]
+
+    def _record(self, handle, elapsed):
+        description = describe_callback(handle)
+        self.count += 1
+        self.recent.append(SlowCallback(time.time(), elapsed, description))
+        if self.observe is not None:
+            self.observe(elapsed, description)
+
+        # At most one log line per log_interval, so a starved loop does not also flood the log
+        now = time.monotonic()
+        if now - self._logged_at < self.log_interval:
+            self._unlogged += 1
+            return
+        suppressed = f" ({self._unlogged} more since the last report)" if self._unlogged else ""
+        logger.warning(f"Event loop blocked for {elapsed * 1000:.0f}ms by {description}{suppressed}")
+        self._logged_at = now
+        self._unlogged = 0
+
+
+def describe_callback(handle):
+    """Name the task (and where it is now suspended) or function behind an event loop callback"""
+    callback = handle._callback
+    task = getattr(callback, "__self__", None)
+    if not isinstance(task, asyncio.Task):
+        return getattr(callback, "__qualname__", None) or repr(callback)
+
+    coro = task.get_coro()
+    description = f"task {task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+    # Follow the chain of awaited coroutines to the innermost frame outside asyncio, just past the code that blocked
+    frame = None
+    while coro is not None and getattr(coro, "cr_frame", None) is not None:
+        if not coro.cr_frame.f_code.co_filename.startswith(ASYNCIO_DIR):
+            frame = coro.cr_frame
+        coro = coro.cr_await
+    if frame is not None:
+        description += f", now at {_short_path(frame.f_code.co_filename)}:{frame.f_lineno}"
+    return description
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every interval seconds from a background thread"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        # Stack (tuple of code objects, outermost first) -> samples; named only when reported, to keep sampling cheap
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        """The samples in collapsed-stack format, one "outer;...;inner count" line per stack (for flame graph tools)"""
+        return "\n".join(
+            f"{';'.join(_function_name(code) for code in stack)} {count}" for stack, count in self.stacks.most_common()
+        ) + "\n"
+
+    def idle(self):
+        """Samples taken while the event loop was waiting for I/O or timers, i.e. had nothing to run"""
+        return sum(count for stack, count in self.stacks.items() if _is_idle(stack))
+
+    def top(self, limit=40):
+        """
+        Return [(function, own samples, samples including callees)], the functions with the most own samples first
+        Idle samples are left out
+        """
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            if _is_idle(stack):
+                continue
+            own[stack[-1]] += count
+            for function in set(stack):
+                total[function] += count
+        return [(_function_name(code), count, total[code]) for code, count in own.most_common(limit)]
+
+    def report(self, limit=40):
+        """A plain-text table of the busiest functions"""
+        idle = self.idle() / self.samples if self.samples else 0.0
+        lines = [f"{self.samples} samples every {self.interval * 1000:g}ms, {idle:.0%} idle", "", "  own%  total%  function"]
+        for function, own, total in self.top(limit) if self.samples else []:
+            lines.append(f"{own / self.samples:6.1%} {total / self.samples:7.1%}  {function}")
+        return "\n".join(lines) + "\n"
+
+
+def memory_report(snapshot, limit=40):
+    """A plain-text list of the source lines holding the most traced memory"""
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    statistics = snapshot.statistics("lineno")
+    lines = [f"{sum(stat.size for stat in statistics) / 2 ** 20:.1f}MB traced in {len(statistics)} source lines", ""]
+    for stat in statistics[:limit]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 2 ** 10:10.1f}KB {stat.count:8} blocks  {_short_path(frame.filename)}:{frame.lineno}")
+    return "\n".join(lines) + "\n"
+
+
+async def capture_profile(seconds, interval=0.005, limit=40):
+    """
+    Profile the event loop thread for seconds while the bot keeps running
+    Returns (profiler, memory report); memory is traced from the start of the capture unless tracemalloc was already on
+    """
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    profiler = SamplingProfiler(threading.get_ident(), interval)
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+    return profiler, memory_report(snapshot, limit)
+
+
+def _is_idle(stack):
+    return stack[-1].co_filename == selectors.__file__
+
+
+def _function_name(code):
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _short_path(path):
+    """Shorten a file path to the part after site-packages or the bot's directory"""
+    for marker in ("site-packages" + os.sep, os.path.dirname(os.path.abspath(__file__)) + os.sep):
+        index = path.rfind(marker)
+        if index != -1:
+            return path[index + len(marker):]
+    return path
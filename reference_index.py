@@ -0,0 +1,105 @@
+import logging
+
+from member_snapshot import MemberSnapshot
+
+logger = logging.getLogger("MemberCheckBot")
+
+
+class ReferenceIndex:
+    """In-memory membership and role index for a reference server"""
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        # Member IDs present in the reference server
+        self.member_ids = set()
+        # Member ID -> frozenset of role IDs (the @everyone role is left out)
+        self.member_roles = {}
+        # Role ID -> set of member IDs holding it
+        self.role_members = {}
+        # Becomes True once the index has been seeded from a full member list
+        self.warm = False
+        # Time of the snapshot the index was restored from, until it is reseeded from the live member list
+        self.restored_at = None
+
+    def seed(self, members):
+        """Rebuild the index from a full member list (e.g. after a gateway chunk)"""
+        self.member_ids = set()
+        self.member_roles = {}
+        self.role_members = {}
+        for member in members:
+            self._store(member.id, self._role_ids(member))
+        self.warm = True
+        self.restored_at = None
+        logger.info(f"Reference index for guild {self.guild_id} seeded with {len(self.member_ids)} members")
+
+    def restore(self, snapshot):
+        """Load the index from an on-disk snapshot (see member_snapshot)"""
+        self.member_ids = set()
+        self.member_roles = {}
+        self.role_members = {}
+        for user_id, role_ids in snapshot.entries():
+            self._store(user_id, role_ids)
+        self.warm = True
+        self.restored_at = snapshot.taken_at
+
+    def snapshot_builder(self):
+        """Copy the current state and return a function building a MemberSnapshot from it (safe to run in a thread)"""
+        member_roles = dict(self.member_roles)
+        return lambda: MemberSnapshot.from_roles(self.guild_id, member_roles)
+
+    def add(self, member):
+        """Record a member joining the reference server"""
+        self.update(member)
+
+    def update(self, member):
+        """Record a member's current roles, replacing whatever was indexed before"""
+        self._discard_roles(member.id)
+        self._store(member.id, self._role_ids(member))
+
+    def remove(self, user_id):
+        """Record a member leaving the reference server"""
+        self._discard_roles(user_id)
+        self.member_ids.discard(user_id)
+
+    def contains(self, user_id):
+        """Return True if the user is a member of the reference server"""
+        return user_id in self.member_ids
+
+    def has_role(self, user_id, role_id):
+        """Return True if the user holds the given role in the reference server"""
+        return role_id in self.member_roles.get(user_id, ())
+
+    def roles_of(self, user_id):
+        """Return the frozenset of role IDs a user holds, or None if they are not a member"""
+        return self.member_roles.get(user_id)
+
+    def role_holders(self, role_id):
+        """Return the set of member IDs holding the given role"""
+        return self.role_members.get(role_id, set())
+
+    def holders_of_any(self, role_ids):
+        """Return a new set of the member IDs holding at least one of the given roles"""
+        holders = set()
+        for role_id in role_ids:
+            holders |= self.role_members.get(role_id, set())
+        return holders
+
+    def __len__(self):
+        return len(self.member_ids)
+
+    def _role_ids(self, member):
+        return frozenset(role.id for role in member.roles if role.id != self.guild_id)
+
+    def _store(self, user_id, role_ids):
+        self.member_ids.add(user_id)
+        self.member_roles[user_id] = role_ids
+        for role_id in role_ids:
+            self.role_members.setdefault(role_id, set()).add(user_id)
+
+    def _discard_roles(self, user_id):
+        for role_id in self.member_roles.pop(user_id, ()):
+            holders = self.role_members.get(role_id)
+            if holders is not None:
+                holders.discard(user_id)
+                if not holders:
+                    del self.role_members[role_id]
@@ -0,0 +1,266 @@
+"""
+Replay a recorded event journal (JOURNAL_FILE) into the enforcement logic against fake guilds
+
+Usage: python replay_journal.py JOURNAL [--speed 10] [--sweep-every SECONDS] [--final-sweep]
+                                [--latency SECONDS] [--output replay_output.txt]
+
+Targets and reference servers come from the usual configuration (.env, GUILDS_CONFIG). Warnings go to a
+temporary database, so nothing is written to WARNINGS_DB. Set WARNING_SECONDS low to see timer kicks.
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import os
+import resource
+import tempfile
+import time
+import types
+
+# Configure logging before member_check does, so the replay does not write bot.log
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Replay:
+    """Feeds journal events into member_check's handlers and records latency and outcomes"""
+
+    def __init__(self, member_check, guilds, http):
+        self.mc = member_check
+        self.guilds = guilds
+        self.http = http
+        self.counts = collections.Counter()
+        # Event kind -> handler latencies in seconds
+        self.latency = collections.defaultdict(list)
+        self.sweeps = 0
+
+    def guild(self, guild_id):
+        return self.guilds.get(guild_id)
+
+    def seed(self, event):
+        """Apply a member-list record to a fake guild without dispatching anything"""
+        guild = self.guild(event.guild_id)
+        if guild is not None:
+            self._put_member(guild, event)
+
+    async def dispatch(self, event):
+        """Apply one event to its fake guild and run the bot's handler for it"""
+        from event_journal import JOIN, KIND_NAMES, REMOVE, UPDATE
+
+        guild = self.guild(event.guild_id)
+        if guild is None:
+            return
+        self.counts[KIND_NAMES[event.kind]] += 1
+
+        started = time.perf_counter()
+        if event.kind == JOIN:
+            await self.mc.on_member_join(self._put_member(guild, event))
+        elif event.kind == REMOVE:
+            guild.remove_member(event.user_id)
+            payload = types.SimpleNamespace(guild_id=guild.id, user=types.SimpleNamespace(id=event.user_id))
+            await self.mc.on_raw_member_remove(payload)
+        elif event.kind == UPDATE:
+            self.mc.handle_member_update(self._put_member(guild, event))
+        self.latency[KIND_NAMES[event.kind]].append(time.perf_counter() - started)
+
+    async def sweep(self):
+        await self.mc.check_members_task()
+        self.sweeps += 1
+
+    def audit(self):
+        """
+        Compare the warnings with the final guild state
+        Returns (non-compliant members without a warning, compliant members with one)
+        """
+        missed = 0
+        wrong = 0
+        for target in self.mc.targets.values():
+            policy = target.policy
+            guild = self.guild(target.guild_id)
+            for member in guild.members:
+                if member.bot or policy.is_exempt(member._role_ids):
+                    continue
+                mask = policy.target_mask(member._role_ids, member.id, member.joined_at)
+                for guild_id in policy.reference_ids:
+                    reference_member = self.guild(guild_id).get_member(member.id)
+                    if reference_member is not None:
+                        mask |= policy.guild_mask(guild_id, reference_member._role_ids)
+                complies = policy.evaluate(mask) is None
+                warned = self.mc.warning_store.contains(target.guild_id, member.id)
+                missed += not complies and not warned
+                wrong += complies and warned
+        return missed, wrong
+
+    def _put_member(self, guild, event):
+        for role_id in event.role_ids:
+            guild.add_role(role_id)
+        member = guild.get_member(event.user_id)
+        if member is None:
+            return guild.add_member(event.user_id, roles=event.role_ids, bot=event.bot)
+        return guild.set_roles(event.user_id, event.role_ids)
+
+
+async def run(args, db_dir):
+    import member_check
+    from action_executor import ActionExecutor
+    from deadline_scheduler import DeadlineScheduler
+    from dm_outbox import DMOutbox
+    from event_journal import SEED, read_journal
+    from fake_discord import FakeChannel, FakeClient, FakeGuild, FakeHTTP
+    from metrics import LoopLagMonitor
+    from warning_store import WarningStore
+
+    mc = member_check
+    if not args.verbose:
+        logging.getLogger("MemberCheckBot").setLevel(logging.CRITICAL)
+
+    # One fake guild per configured target and reference server
+    http = FakeHTTP(latency=args.latency)
+    guild_ids = set(mc.targets) | set(mc.reference_indexes)
+    guilds = {guild_id: FakeGuild(guild_id, http) for guild_id in guild_ids}
+    for target in mc.targets.values():
+        for role_id in target.exempt_roles:
+            guilds[target.guild_id].add_role(role_id)
+    channel_ids = {target.warning_channel_id for target in mc.targets.values()} | {mc.LOG_CHANNEL_ID}
+    channels = [FakeChannel(guilds[next(iter(mc.targets))], channel_id, http) for channel_id in channel_ids if channel_id]
+    FakeClient(guilds.values(), channels).install(mc.bot)
+
+    # Fresh enforcement state
+    mc.warning_store = WarningStore(os.path.join(db_dir, "replay.db"))
+    mc.warning_store.load()
+    mc.warning_scheduler = DeadlineScheduler(lambda key: mc.expire_warning(*key))
+    mc.action_executor = ActionExecutor(
+        {"dm": mc.ACTION_DM_CONCURRENCY, "channel": mc.ACTION_CHANNEL_CONCURRENCY, "kick": mc.ACTION_KICK_CONCURRENCY},
+        global_rate=args.global_rate
+    )
+    mc.dm_outbox = DMOutbox(os.path.join(db_dir, "replay.db"), mc.dm_outbox.open_dm, mc.dm_outbox.run, workers=mc.ACTION_DM_CONCURRENCY)
+    mc.dm_outbox.load()
+    mc.recheck_queue = asyncio.Queue()
+    recheck_task = asyncio.get_running_loop().create_task(mc.recheck_worker())
+    mc.log_sink.start()
+    if mc.join_admission is not None:
+        mc.join_admission.start()
+
+    replay = Replay(mc, guilds, http)
+    events = read_journal(args.journal)
+    pending = None
+
+    # The member lists recorded when the indexes were seeded are the starting state
+    for event in events:
+        if event.kind != SEED:
+            pending = event
+            break
+        replay.seed(event)
+    await mc.warm_indexes()
+    mc.warning_scheduler.start()
+    mc.dm_outbox.start()
+    http.reset()
+
+    monitor = LoopLagMonitor(interval=0.01)
+    monitor.start()
+    started = time.perf_counter()
+    first_timestamp = pending.timestamp if pending else 0.0
+    next_sweep = first_timestamp + args.sweep_every if args.sweep_every else None
+
+    def remaining():
+        if pending is not None:
+            yield pending
+        yield from events
+
+    for event in remaining():
+        elapsed = event.timestamp - first_timestamp
+        if args.speed:
+            delay = started + elapsed / args.speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        if next_sweep is not None and event.timestamp >= next_sweep:
+            await replay.sweep()
+            next_sweep += args.sweep_every
+        if event.kind == SEED:
+            # A later reseed: the recorded list is what the gateway said at that point
+            replay.seed(event)
+            continue
+        await replay.dispatch(event)
+
+    # Let batched joins and event-driven rechecks finish before measuring the outcome
+    if mc.join_admission is not None:
+        await mc.join_admission.flush()
+    await mc.recheck_queue.join()
+    if args.final_sweep:
+        await replay.sweep()
+    await mc.dm_outbox.drain()
+    await mc.log_sink.flush()
+    wall = time.perf_counter() - started
+    await monitor.stop()
+
+    recheck_task.cancel()
+    mc.warning_scheduler.stop()
+    mc.log_sink.stop()
+    mc.dm_outbox.stop()
+    mc.dm_outbox.close()
+    if mc.join_admission is not None:
+        mc.join_admission.stop()
+    missed, wrong = replay.audit()
+    mc.warning_store.close()
+
+    total_events = sum(replay.counts.values())
+    lines = [
+        f"events={total_events} ({', '.join(f'{kind}={count}' for kind, count in sorted(replay.counts.items()))}) "
+        f"wall={wall:.3f}s throughput={total_events / wall if wall else 0:.0f}/s sweeps={replay.sweeps}",
+    ]
+    for kind, samples in sorted(replay.latency.items()):
+        lines.append(
+            f"    {kind:<7} latency p50={percentile(samples, 0.5) * 1000:.2f}ms "
+            f"p99={percentile(samples, 0.99) * 1000:.2f}ms max={max(samples) * 1000:.2f}ms"
+        )
+    routes = ", ".join(f"{route}={count}" for route, count in sorted(http.calls.items())) or "none"
+    lines.append(f"    routes: {routes}")
+    lines.append(f"    actions: {mc.action_executor.summary()}")
+    if mc.join_admission is not None:
+        lines.append(f"    joins: {mc.join_admission.admitted} in {mc.join_admission.batches} batches")
+    lines.append(
+        f"    outcome: {mc.warning_store.count()} warned, {http.calls['DELETE /guilds/{guild}/members/{user}']} kicked, "
+        f"{missed} non-compliant without a warning, {wrong} compliant with a warning"
+    )
+    lines.append(
+        f"    loop_lag_max={monitor.max() * 1000:.1f}ms loop_lag_mean={monitor.mean() * 1000:.2f}ms "
+        f"max_rss={resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f}MB"
+    )
+    return lines
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as db_dir:
+        # member_check reads its configuration at import time; keep the replay away from real state
+        os.environ.update({
+            "WARNINGS_DB": os.path.join(db_dir, "unused.db"),
+            "JOURNAL_FILE": "",
+            "SNAPSHOT_DIR": "",
+            "METRICS_PORT": "0",
+            "ENABLE_SHEET_LOGGING": "false",
+        })
+        lines = await run(args, db_dir)
+
+    print("\n".join(lines))
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded event journal against fake guilds")
+    parser.add_argument("journal", help="Journal file written with JOURNAL_FILE")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier (0 = as fast as possible)")
+    parser.add_argument("--sweep-every", type=float, default=0, help="Run a full sweep every N seconds of journal time")
+    parser.add_argument("--final-sweep", action="store_true", help="Run a full sweep after the last event")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated REST latency in seconds")
+    parser.add_argument("--global-rate", type=float, default=10_000, help="Action executor global rate limit")
+    parser.add_argument("--verbose", action="store_true", help="Show the bot's own log output")
+    parser.add_argument("--output", help="Also write the results to this file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,59 @@
+import logging
+import random
+import time
+
+from deadline_scheduler import DeadlineScheduler
+
+logger = logging.getLogger("MemberCheckBot")
+
+
+class RetryQueue:
+    """
+    Retries failed work per key with jittered exponential backoff, on top of a DeadlineScheduler
+    callback(key) runs the retry; it calls retry(key) again if it failed and done(key) if it succeeded
+    """
+
+    def __init__(self, callback, base_delay=5.0, max_delay=900.0, max_attempts=8, max_concurrency=4):
+        self.callback = callback
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.retried = 0
+        self.gave_up = 0
+        # key -> failed attempts so far
+        self._attempts = {}
+        self._scheduler = DeadlineScheduler(self.callback, max_concurrency)
+
+    def retry(self, key):
+        """Schedule another attempt for key; returns False once it has failed max_attempts times"""
+        attempt = self._attempts.get(key, 0) + 1
+        if attempt > self.max_attempts:
+            self.done(key)
+            self.gave_up += 1
+            logger.warning(f"Giving up on {key} after {self.max_attempts} attempts, leaving it to the next sweep")
+            return False
+
+        self._attempts[key] = attempt
+        # Full jitter, so a burst of failures does not retry in lockstep
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        self._scheduler.schedule(key, time.time() + delay)
+        self.retried += 1
+        return True
+
+    def done(self, key):
+        """Forget key's failures and any pending attempt"""
+        self._attempts.pop(key, None)
+        self._scheduler.cancel(key)
+
+    def attempts(self, key):
+        return self._attempts.get(key, 0)
+
+    def __len__(self):
+        return len(self._attempts)
+
+    def start(self):
+        """Start running retries on the running event loop"""
+        self._scheduler.start()
+
+    def stop(self):
+        self._scheduler.stop()
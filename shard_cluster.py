@@ -0,0 +1,104 @@
+"""
+Run the bot as several processes, each connecting a slice of the gateway shards
+
+Usage: python shard_cluster.py --shards 16 --processes 4 [--stagger 5] [--restart-delay 10]
+"""
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from dotenv import load_dotenv
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("MemberCheckBot")
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "member_check.py")
+
+
+def split_shards(shard_count, processes):
+    """Divide shard IDs 0..shard_count-1 into contiguous blocks, one per process"""
+    blocks = []
+    for index in range(processes):
+        start = index * shard_count // processes
+        end = (index + 1) * shard_count // processes
+        blocks.append(list(range(start, end)))
+    return [block for block in blocks if block]
+
+
+def process_env(cluster_id, shard_ids, shard_count):
+    """Environment for one cluster process"""
+    env = dict(os.environ)
+    env.update({
+        "SHARD_MODE": "cluster",
+        "SHARD_COUNT": str(shard_count),
+        "SHARD_IDS": ",".join(str(shard_id) for shard_id in shard_ids),
+    })
+    # Give every process its own metrics port
+    metrics_port = int(os.getenv("METRICS_PORT", "0"))
+    if metrics_port:
+        env["METRICS_PORT"] = str(metrics_port + cluster_id)
+    return env
+
+
+def run_cluster(shard_count, processes, stagger, restart_delay):
+    blocks = split_shards(shard_count, processes)
+    children = {}
+    stopping = False
+
+    def start(cluster_id):
+        shard_ids = blocks[cluster_id]
+        logger.info(f"Starting cluster process {cluster_id} with shards {shard_ids}")
+        children[cluster_id] = subprocess.Popen([sys.executable, BOT_SCRIPT], env=process_env(cluster_id, shard_ids, shard_count))
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for child in children.values():
+            if child.poll() is None:
+                child.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Discord allows one IDENTIFY per 5 seconds by default, so stagger process start by the shards each one connects
+    for cluster_id in range(len(blocks)):
+        if stopping:
+            break
+        start(cluster_id)
+        time.sleep(stagger * len(blocks[cluster_id]))
+
+    # Restart any process that exits unexpectedly
+    while not stopping:
+        time.sleep(1)
+        for cluster_id, child in list(children.items()):
+            code = child.poll()
+            if code is None or stopping:
+                continue
+            logger.error(f"Cluster process {cluster_id} exited with code {code}, restarting in {restart_delay}s")
+            time.sleep(restart_delay)
+            if not stopping:
+                start(cluster_id)
+
+    for child in children.values():
+        try:
+            child.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            child.kill()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run the member check bot as a multi-process shard cluster")
+    parser.add_argument("--shards", type=int, default=int(os.getenv("SHARD_COUNT", "0")), help="Total shard count (default: SHARD_COUNT)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Number of bot processes (default: CPU count)")
+    parser.add_argument("--stagger", type=float, default=5.0, help="Seconds to wait per shard before starting the next process")
+    parser.add_argument("--restart-delay", type=float, default=10.0, help="Seconds to wait before restarting a crashed process")
+    args = parser.parse_args()
+
+    if args.shards < 1:
+        parser.error("set --shards or SHARD_COUNT")
+    run_cluster(args.shards, min(args.processes, args.shards), args.stagger, args.restart_delay)
@@ -0,0 +1,123 @@
+import collections
+import logging
+import os
+import time
+
+import discord
+
+logger = logging.getLogger("MemberCheckBot")
+
+# none = one gateway connection, auto = every shard in this process, cluster = only SHARD_IDS in this process
+SHARD_MODES = ("none", "auto", "cluster")
+
+
+def shard_for(guild_id, shard_count):
+    """Return the shard a guild's gateway events are delivered on"""
+    return (guild_id >> 22) % shard_count
+
+
+class ShardConfig:
+    """Which gateway shards this process runs and which guilds it owns"""
+
+    def __init__(self, mode="none", shard_count=None, shard_ids=None):
+        if mode not in SHARD_MODES:
+            raise ValueError(f"SHARD_MODE must be one of {', '.join(SHARD_MODES)}, not {mode!r}")
+        if mode == "cluster" and (not shard_count or not shard_ids):
+            raise ValueError("SHARD_MODE=cluster needs SHARD_COUNT and SHARD_IDS")
+        self.mode = mode
+        self.shard_count = shard_count
+        self.shard_ids = list(shard_ids) if shard_ids else None
+
+    @classmethod
+    def from_env(cls):
+        shard_count = int(os.getenv("SHARD_COUNT", "0")) or None
+        shard_ids = [int(shard_id) for shard_id in os.getenv("SHARD_IDS", "").split(",") if shard_id.strip()]
+        return cls(os.getenv("SHARD_MODE", "none").lower(), shard_count, shard_ids)
+
+    def bot_options(self):
+        """Extra keyword arguments for commands.AutoShardedBot (nothing in none mode)"""
+        if self.mode == "none":
+            return {}
+        return {"shard_count": self.shard_count, "shard_ids": self.shard_ids}
+
+    def owns(self, guild_id):
+        """Return True if this process receives the guild's gateway events"""
+        if self.mode != "cluster":
+            return True
+        return shard_for(guild_id, self.shard_count) in self.shard_ids
+
+    def is_partial(self):
+        """Return True if other processes handle some guilds (cluster mode)"""
+        return self.mode == "cluster"
+
+    def describe(self):
+        if self.mode == "none":
+            return "single connection"
+        if self.mode == "auto":
+            return f"auto-sharded ({self.shard_count or 'recommended'} shards)"
+        return f"cluster shards {self.shard_ids} of {self.shard_count}"
+
+
+class RemoteReferences:
+    """Reference servers owned by another shard process, read through the REST API instead of the gateway"""
+
+    def __init__(self, bot, index_ttl=900, member_ttl=60, max_cached=50000):
+        self.bot = bot
+        # A remote index older than this is refetched before the next sweep that needs it
+        self.index_ttl = index_ttl
+        # Single-member lookups are cached this long
+        self.member_ttl = member_ttl
+        self.max_cached = max_cached
+        self.refreshed = {}
+        self._guilds = {}
+        # (guild ID, user ID) -> (expires, frozenset of role IDs or None if not a member)
+        self._members = collections.OrderedDict()
+
+    async def guild(self, guild_id):
+        """Return a REST-fetched guild object (cached for the life of the process)"""
+        guild = self._guilds.get(guild_id)
+        if guild is None:
+            guild = await self.bot.fetch_guild(guild_id)
+            self._guilds[guild_id] = guild
+        return guild
+
+    def cached_guild(self, guild_id):
+        return self._guilds.get(guild_id)
+
+    def is_fresh(self, guild_id):
+        return time.monotonic() - self.refreshed.get(guild_id, float("-inf")) < self.index_ttl
+
+    async def refresh_index(self, index):
+        """Return index, or a freshly fetched replacement if it is older than index_ttl"""
+        if index.warm and self.is_fresh(index.guild_id):
+            return index
+
+        guild = await self.guild(index.guild_id)
+        fresh = type(index)(index.guild_id)
+        async for member in guild.fetch_members(limit=None):
+            fresh.add(member)
+        fresh.warm = True
+        self.refreshed[index.guild_id] = time.monotonic()
+        logger.info(f"Fetched {len(fresh)} members of remote reference server {index.guild_id}")
+        return fresh
+
+    async def lookup(self, guild_id, user_id, use_cache=True):
+        """Return the member's role IDs in a remote guild, or None if they are not a member"""
+        key = (guild_id, user_id)
+        cached = self._members.get(key)
+        if use_cache and cached is not None and cached[0] > time.monotonic():
+            self._members.move_to_end(key)
+            return cached[1]
+
+        guild = await self.guild(guild_id)
+        try:
+            member = await guild.fetch_member(user_id)
+            role_ids = frozenset(role.id for role in member.roles if role.id != guild_id)
+        except discord.NotFound:
+            role_ids = None
+
+        self._members[key] = (time.monotonic() + self.member_ttl, role_ids)
+        self._members.move_to_end(key)
+        while len(self._members) > self.max_cached:
+            self._members.popitem(last=False)
+        return role_ids
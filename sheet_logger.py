@@ -1,100 +1,180 @@
-# import requests
-# import os
-# import logging
-# import json
-
-# logger = logging.getLogger("MemberCheckBot")
-
-
-# class SheetLogger:
-#     def __init__(self):
-#         # Configure more detailed logging
-#         logger.info("==== SHEET LOGGER INITIALIZATION ====")
-        
-#         # Check if sheet logging is enabled
-#         self.enabled = os.getenv("ENABLE_SHEET_LOGGING", "false").lower() == "true"
-#         logger.info(f"Sheet logging enabled: {self.enabled}")
-#         if not self.enabled:
-#             logger.info("Google Sheet logging is disabled")
-#             return
-        
-
-        
-#         # Get the Apps Script URL and secret from environment variables
-#         self.script_url = os.getenv("GOOGLE_SCRIPT_URL", "")
-#         self.secret_key = os.getenv("GOOGLE_SCRIPT_SECRET", "")
-
-#         logger.info(f"Script URL: {self.script_url}")
-#         logger.info(f"Secret Key: {'***' if self.secret_key else 'None'}")
-        
-#         # Validate configuration
-#         if not self.script_url or not self.secret_key:
-#             logger.warning("Google Sheet logging disabled: Missing URL or secret key")
-#             self.enabled = False
-#             return
-            
-#         logger.info("Google Sheet logging initialized")
-    
-#     def log(self, level, message, user_id=None, user_name=None, server=None, error=None):
-#         """Send a log entry to the Google Sheet"""
-#         if not self.enabled:
-#             return False
-            
-#         try:
-#             # Prepare the payload
-#             payload = {
-#                 "secretKey": self.secret_key,
-#                 "level": level,
-#                 "message": message,
-#                 "userId": str(user_id) if user_id else "",
-#                 "userName": user_name if user_name else "",
-#                 "server": server if server else "",
-#                 "error": str(error) if error else ""
-#             }
-
-#             logger.debug(f"Sending log to Google Apps Script: {level} - {message}...")
-            
-            
-#             # Send to Google Apps Script with a short timeout
-#             # to avoid blocking the bot if the request is slow
-#             response = requests.post(
-#                 self.script_url,
-#                 json=payload,
-#                 timeout=5
-#             )
-
-#             # ADD RESPONSE DEBUGGING HERE
-#             logger.debug(f"Response status: {response.status_code}")
-            
-#             try:
-#                 # Try to parse the JSON response
-#                 response_data = response.json()
-#                 logger.debug(f"Response content: {response_data}")
-                
-#                 if response.status_code == 200:
-#                     if response_data.get("success") == True:
-#                         logger.debug("Sheet logging successful")
-#                         return True
-#                     else:
-#                         logger.warning(f"Sheet API error: {response_data.get('error', 'Unknown error')}")
-#                         return False
-#             except json.JSONDecodeError:
-#                 logger.warning(f"Failed to parse API response: {response.text[:100]}")
-                
-#             logger.warning(f"Sheet logging failed: HTTP {response.status_code}")
-#             return False
-            
-#         except requests.exceptions.Timeout:
-#             logger.warning("Sheet logging timed out")
-#             return False
-#         except Exception as e:
-#             logger.warning(f"Error logging to Google Sheet: {e}")
-#             return False
-
-# # Create singleton instance
-# sheet_logger = SheetLogger()
-
-# # Simplified helper function
-# def log_to_sheet(level, message, user_id=None, user_name=None, server=None, error=None):
-#     """Helper function to log to Google Sheet"""
-#     return sheet_logger.log(level, message, user_id, user_name, server, error)
+import aiohttp
+import asyncio
+import collections
+import os
+import logging
+import random
+
+logger = logging.getLogger("MemberCheckBot")
+
+
+class SheetLogger:
+    def __init__(self):
+        self.enabled = False
+        self.configured = False
+        self.script_url = ""
+        self.secret_key = ""
+        self.batch_size = 50
+        self.flush_interval = 10.0
+        self.max_buffer = 5000
+        self.max_retries = 5
+        self.timeout = 10.0
+        self.retry_backoff = 1.0
+        # Rows lost to the memory cap or rejected by the script
+        self.dropped = 0
+        self.sent = 0
+        self._buffer = collections.deque()
+        self._session = None
+        self._task = None
+        self._flush_lock = None
+
+    def configure(self, script_url=None, secret_key=None):
+        """Read the sheet logging settings from the environment (or the given overrides)"""
+        logger.info("==== SHEET LOGGER INITIALIZATION ====")
+        self.configured = True
+
+        # Check if sheet logging is enabled
+        self.enabled = os.getenv("ENABLE_SHEET_LOGGING", "false").lower() == "true" or script_url is not None
+        logger.info(f"Sheet logging enabled: {self.enabled}")
+        if not self.enabled:
+            logger.info("Google Sheet logging is disabled")
+            return
+
+        # Get the Apps Script URL and secret from environment variables
+        self.script_url = script_url or os.getenv("GOOGLE_SCRIPT_URL", "")
+        self.secret_key = secret_key or os.getenv("GOOGLE_SCRIPT_SECRET", "")
+        self.batch_size = int(os.getenv("SHEET_BATCH_SIZE", str(self.batch_size)))
+        self.flush_interval = float(os.getenv("SHEET_FLUSH_INTERVAL", str(self.flush_interval)))
+        self.max_buffer = int(os.getenv("SHEET_MAX_BUFFER", str(self.max_buffer)))
+
+        logger.info(f"Script URL: {self.script_url}")
+        logger.info(f"Secret Key: {'***' if self.secret_key else 'None'}")
+
+        # Validate configuration
+        if not self.script_url or not self.secret_key:
+            logger.warning("Google Sheet logging disabled: Missing URL or secret key")
+            self.enabled = False
+            return
+
+        logger.info("Google Sheet logging initialized")
+
+    async def start(self):
+        """Open the pooled HTTP session and start the background flusher"""
+        if not self.enabled or self._task is not None:
+            return
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Flush what is buffered and close the HTTP session"""
+        if self._task is not None:
+            # Wait for the flusher to exit, so a batch it was posting is back in the buffer for the final flush
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._session is not None:
+            await self.flush()
+            await self._session.close()
+            self._session = None
+
+    def log(self, level, message, user_id=None, user_name=None, server=None, error=None):
+        """Queue a log entry for the Google Sheet; never blocks on the network"""
+        if not self.enabled:
+            return False
+
+        # Enforce the memory cap by dropping the oldest rows
+        if len(self._buffer) >= self.max_buffer:
+            self._buffer.popleft()
+            self.dropped += 1
+
+        self._buffer.append({
+            "level": level,
+            "message": message,
+            "userId": str(user_id) if user_id else "",
+            "userName": user_name if user_name else "",
+            "server": server if server else "",
+            "error": str(error) if error else ""
+        })
+        return True
+
+    def pending(self):
+        """Return the number of rows waiting to be sent"""
+        return len(self._buffer)
+
+    async def flush(self):
+        """Send everything buffered, batch_size rows per POST"""
+        if self._session is None:
+            return
+
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                try:
+                    result = await self._post(batch)
+                except asyncio.CancelledError:
+                    # Cancelled mid-post (e.g. by stop()): keep the rows for the final flush
+                    self._buffer.extendleft(reversed(batch))
+                    raise
+                if result == "sent":
+                    self.sent += len(batch)
+                    continue
+                if result == "rejected":
+                    self.dropped += len(batch)
+                    continue
+
+                # Keep the rows for the next flush, still within the memory cap
+                room = self.max_buffer - len(self._buffer)
+                if room < len(batch):
+                    self.dropped += len(batch) - room
+                    batch = batch[len(batch) - room:]
+                self._buffer.extendleft(reversed(batch))
+                return
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Error logging to Google Sheet: {e}")
+
+    async def _post(self, batch):
+        """POST one batch with retries; returns 'sent', 'rejected' or 'failed'"""
+        # Prepare the payload
+        payload = {"secretKey": self.secret_key, "entries": batch}
+
+        for attempt in range(self.max_retries):
+            if attempt:
+                # Exponential backoff with jitter
+                await asyncio.sleep(min(30, self.retry_backoff * 2 ** attempt) * random.uniform(0.5, 1.0))
+
+            try:
+                logger.debug(f"Sending {len(batch)} log rows to Google Apps Script (attempt {attempt + 1})")
+                async with self._session.post(self.script_url, json=payload) as response:
+                    logger.debug(f"Response status: {response.status}")
+                    if response.status == 200:
+                        response_data = await response.json(content_type=None)
+                        logger.debug(f"Response content: {response_data}")
+                        if response_data.get("success") == True:
+                            return "sent"
+                        logger.warning(f"Sheet API error: {response_data.get('error', 'Unknown error')}")
+                        # The script rejected the payload itself; retrying will not help
+                        return "rejected"
+                    logger.warning(f"Sheet logging failed: HTTP {response.status}")
+            except asyncio.TimeoutError:
+                logger.warning("Sheet logging timed out")
+            except (aiohttp.ClientError, ValueError) as e:
+                logger.warning(f"Error logging to Google Sheet: {e}")
+        return "failed"
+
+# Create singleton instance
+sheet_logger = SheetLogger()
+
+# Simplified helper function
+def log_to_sheet(level, message, user_id=None, user_name=None, server=None, error=None):
+    """Helper function to log to Google Sheet"""
+    return sheet_logger.log(level, message, user_id, user_name, server, error)
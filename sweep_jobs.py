@@ -0,0 +1,169 @@
+import asyncio
+import collections
+import itertools
+import logging
+import time
+
+logger = logging.getLogger("MemberCheckBot")
+
+
+class SweepJob:
+    """One full sweep of a target server, run as a background task with progress for !checkall status"""
+
+    def __init__(self, job_id, guild_id, name, kind, on_stage=None):
+        self.id = job_id
+        self.guild_id = guild_id
+        self.name = name
+        # "scheduled" (the periodic loop), "manual" (!checkall), "reconcile" (after an API outage) or "takeover" (new HA leader)
+        self.kind = kind
+        # waiting (for the server's sweep lock), running, done, cancelled or failed
+        self.state = "waiting"
+        self.stage = "queued"
+        self.total = 0
+        self.done = 0
+        self.members = 0
+        self.warned = 0
+        self.kicked = 0
+        self.error = None
+        self.task = None
+        # Stage -> seconds spent in it; on_stage(stage, seconds) is called as each stage ends
+        self.stage_seconds = {}
+        self.on_stage = on_stage
+        # time.monotonic() when the job was created and when it ended
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self._stage_started = self.started_at
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def set_stage(self, stage, total=0):
+        """Move on to the next stage of the sweep, with total items to get through"""
+        self.end_stage()
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self._stage_started = time.monotonic()
+
+    def end_stage(self):
+        """Add the time since the current stage started to its total"""
+        now = time.monotonic()
+        seconds = now - self._stage_started
+        self.stage_seconds[self.stage] = self.stage_seconds.get(self.stage, 0.0) + seconds
+        self._stage_started = now
+        if self.on_stage is not None:
+            self.on_stage(self.stage, seconds)
+
+    def advance(self, count=1):
+        """Record count items of the current stage as done"""
+        self.done += count
+
+    def rate(self):
+        """Items per second in the current stage"""
+        elapsed = time.monotonic() - self._stage_started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """Seconds until the current stage is done at the current rate, or None if unknown"""
+        rate = self.rate()
+        return (self.total - self.done) / rate if rate and self.total else None
+
+    def elapsed(self):
+        """Seconds since the job was created, until it ended"""
+        return (self.finished_at if self.finished else time.monotonic()) - self.started_at
+
+    def describe(self):
+        """One line for !checkall status"""
+        line = f"#{self.id} {self.kind} sweep of {self.name}: {self.state}"
+        if not self.finished:
+            line += f", {self.stage}"
+            if self.total:
+                line += f" {self.done}/{self.total} ({self.rate():.1f}/s"
+                eta = self.eta()
+                line += f", ETA {eta:.0f}s)" if eta is not None else ")"
+        else:
+            line += f" after {self.elapsed():.0f}s: {self.members} members, {self.warned} warned, {self.kicked} kicked"
+            if self.error:
+                line += f" ({self.error})"
+            line += "; " + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in self.stage_seconds.items())
+        return line
+
+
+class SweepJobs:
+    """
+    Runs sweeps as background jobs, at most one in flight per target server
+    Anything else acting on a server's members in bulk (e.g. incremental slices) holds the same per-server lock
+    """
+
+    def __init__(self, history=10, on_stage=None):
+        # on_stage(stage, seconds) is called as each stage of a job ends, e.g. to feed a metric
+        self.on_stage = on_stage
+        self._ids = itertools.count(1)
+        self._locks = {}
+        # Guild ID -> the job queued or running for it
+        self.active = {}
+        # Finished jobs, newest first
+        self.history = collections.deque(maxlen=history)
+
+    def lock(self, guild_id):
+        """Return the lock held while a server is being swept"""
+        lock = self._locks.get(guild_id)
+        if lock is None:
+            lock = self._locks[guild_id] = asyncio.Lock()
+        return lock
+
+    def start(self, guild_id, name, sweep, kind="manual"):
+        """
+        Start await sweep(job) in the background unless the server already has a sweep in flight
+        Returns (job, started); when started is False the job is the one already in flight
+        """
+        job = self.active.get(guild_id)
+        if job is not None:
+            return job, False
+
+        job = self.active[guild_id] = SweepJob(next(self._ids), guild_id, name, kind, self.on_stage)
+        job.task = asyncio.get_running_loop().create_task(self._run(job, sweep))
+        # A done callback rather than a finally block, so a job cancelled before it ever ran is cleaned up too
+        job.task.add_done_callback(lambda task: self._finish(job))
+        return job, True
+
+    async def run(self, guild_id, name, sweep, kind="scheduled"):
+        """Start a sweep and wait for it; returns None without waiting if the server already has one in flight"""
+        job, started = self.start(guild_id, name, sweep, kind)
+        if not started:
+            return None
+        # wait() rather than await, so cancelling the job does not cancel the caller
+        await asyncio.wait([job.task])
+        return job
+
+    def find(self, job_id):
+        """Return the queued or running job with the given ID, or None"""
+        return next((job for job in self.active.values() if job.id == job_id), None)
+
+    def cancel(self, job):
+        """Cancel a queued or running job; actions already sent are not undone"""
+        if job.task is not None and not job.task.done():
+            job.task.cancel()
+
+    async def _run(self, job, sweep):
+        try:
+            async with self.lock(job.guild_id):
+                job.state = "running"
+                await sweep(job)
+            job.state = "done"
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+            logger.warning(f"Sweep job #{job.id} of {job.name} cancelled during {job.stage}")
+        except Exception as e:
+            job.state = "failed"
+            job.error = e
+            logger.error(f"Sweep job #{job.id} of {job.name} failed: {e}")
+
+    def _finish(self, job):
+        if job.state in ("waiting", "running"):
+            job.state = "cancelled"
+        job.end_stage()
+        job.finished_at = time.monotonic()
+        self.active.pop(job.guild_id, None)
+        self.history.appendleft(job)
@@ -0,0 +1,71 @@
+import time
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+COOLDOWN = 0.05
+
+
+def make_breaker(closed):
+    return CircuitBreaker(window=60.0, min_calls=4, error_rate=0.5, slow_call=1.0, cooldown=COOLDOWN, probe_calls=2,
+                          on_close=lambda: closed.append(True))
+
+
+def trip(breaker):
+    for failed in (False, True, False, True):
+        breaker.record(failed)
+
+
+def test_opens_half_opens_and_closes_after_probes():
+    closed = []
+    breaker = make_breaker(closed)
+
+    # Too few calls to judge, however many failed
+    for _ in range(3):
+        breaker.record(True)
+    assert breaker.state == CLOSED
+
+    breaker = make_breaker(closed)
+    trip(breaker)
+    assert breaker.state == OPEN and not breaker.is_closed
+    assert breaker.trips == 1
+
+    time.sleep(COOLDOWN * 1.5)
+    assert breaker.state == HALF_OPEN
+    breaker.record(False)
+    assert breaker.state == HALF_OPEN
+    breaker.record(False)
+    assert breaker.state == CLOSED
+    assert closed == [True]
+
+
+def test_failing_probe_reopens():
+    closed = []
+    breaker = make_breaker(closed)
+    trip(breaker)
+    time.sleep(COOLDOWN * 1.5)
+    assert breaker.state == HALF_OPEN
+
+    breaker.record(False)
+    # A slow call fails the probe too
+    breaker.record(False, latency=2.0)
+    assert breaker.state == OPEN
+    assert closed == []
+
+    time.sleep(COOLDOWN * 1.5)
+    assert breaker.state == HALF_OPEN
+
+
+def test_half_open_closes_after_a_quiet_cooldown():
+    closed = []
+    breaker = make_breaker(closed)
+    trip(breaker)
+    time.sleep(COOLDOWN * 1.5)
+    assert breaker.state == HALF_OPEN
+
+    # No REST traffic to probe with for another cooldown
+    time.sleep(COOLDOWN * 1.5)
+    assert breaker.state == CLOSED
+    assert closed == [True]
+    # The window starts empty again, so the old failures do not trip it straight back
+    breaker.record(True)
+    assert breaker.state == CLOSED
@@ -0,0 +1,121 @@
+import datetime
+import random
+import time
+from types import SimpleNamespace
+
+import compact_index
+from compact_index import BOT_FLAG, CompactMemberIndex
+from reference_index import ReferenceIndex
+
+GUILD_ID = 1
+ROLE_IDS = [101, 102, 103, 104, 105]
+
+
+def member(user_id, role_ids=(), bot=False, joined_ago=None):
+    # The @everyone role (same ID as the guild) is always present and never indexed
+    roles = [SimpleNamespace(id=GUILD_ID)] + [SimpleNamespace(id=role_id) for role_id in role_ids]
+    joined_at = None
+    if joined_ago is not None:
+        joined_at = datetime.datetime.fromtimestamp(time.time() - joined_ago, datetime.timezone.utc)
+    return SimpleNamespace(id=user_id, roles=roles, bot=bot, joined_at=joined_at)
+
+
+def assert_same(compact, reference, user_ids):
+    assert len(compact) == len(reference)
+    assert compact.member_ids == reference.member_ids
+    for user_id in user_ids:
+        assert compact.contains(user_id) == reference.contains(user_id)
+        assert compact.roles_of(user_id) == reference.roles_of(user_id)
+    for role_id in ROLE_IDS:
+        assert compact.role_holders(role_id) == reference.role_holders(role_id)
+    assert compact.holders_of_any(ROLE_IDS[:2]) == reference.holders_of_any(ROLE_IDS[:2])
+
+
+def test_matches_reference_index_through_joins_role_changes_and_leaves(monkeypatch):
+    # Compact often, so lookups run both against pending changes and the merged arrays
+    monkeypatch.setattr(compact_index, "COMPACT_THRESHOLD", 7)
+    rng = random.Random(13)
+    user_ids = range(1000, 1200)
+    initial = [member(user_id, rng.sample(ROLE_IDS, rng.randint(0, 3))) for user_id in user_ids if user_id % 3]
+
+    compact = CompactMemberIndex(GUILD_ID)
+    reference = ReferenceIndex(GUILD_ID)
+    compact.seed(initial)
+    reference.seed(initial)
+    assert_same(compact, reference, user_ids)
+
+    for step in range(2000):
+        user_id = rng.choice(user_ids)
+        if rng.random() < 0.3:
+            compact.remove(user_id)
+            reference.remove(user_id)
+        else:
+            changed = member(user_id, rng.sample(ROLE_IDS, rng.randint(0, 3)))
+            compact.update(changed)
+            reference.update(changed)
+        if step % 100 == 0:
+            assert_same(compact, reference, user_ids)
+    assert_same(compact, reference, user_ids)
+
+
+def test_pending_changes_before_compaction():
+    index = CompactMemberIndex(GUILD_ID)
+    index.seed([member(10, [101]), member(20, [102])])
+
+    # Removed then rejoined: back in the base arrays with the new roles
+    index.remove(10)
+    assert not index.contains(10)
+    index.add(member(10, [103]))
+    assert index.roles_of(10) == {103}
+
+    # Joined and left again before being merged in
+    index.add(member(30, [101]))
+    index.remove(30)
+    assert not index.contains(30)
+
+    assert len(index) == 2
+    assert index.holders_of_any([101, 103]) == {10}
+
+
+def test_bots_are_flagged_but_not_listed_as_a_role():
+    index = CompactMemberIndex(GUILD_ID)
+    index.seed([member(10, [101], bot=True), member(20, [101])])
+
+    assert index.is_bot(10) and not index.is_bot(20)
+    assert index.roles_of(10) == {101}
+    assert index.holders_of_any([BOT_FLAG]) == {10}
+
+
+def test_restores_from_its_own_snapshot():
+    index = CompactMemberIndex(GUILD_ID)
+    index.seed([member(10, [101, 102]), member(20, [102], bot=True)])
+    index.add(member(15, [104]))
+    index.remove(10)
+
+    restored = CompactMemberIndex(GUILD_ID)
+    restored.restore(index.snapshot_builder()())
+
+    assert restored.member_ids == {15, 20}
+    assert restored.roles_of(15) == {104}
+    assert restored.is_bot(20)
+    assert restored.restored_at is not None
+
+
+def test_keeps_join_times_only_within_the_join_window():
+    index = CompactMemberIndex(GUILD_ID, join_window=3600)
+    index.seed([member(10, joined_ago=60), member(20, joined_ago=1800), member(30, joined_ago=86400), member(40)])
+
+    assert index.recent_joiners(600) == {10}
+    assert index.recent_joiners(3600) == {10, 20}
+    assert index.joined_at(30) is None and index.joined_at(40) is None
+    assert abs(index.joined_at(10).timestamp() - (time.time() - 60)) < 5
+
+    index.add(member(50, joined_ago=0))
+    # An update without a join time keeps the one known
+    index.update(member(10, [101]))
+    index.remove(20)
+    assert index.recent_joiners(3600) == {10, 50}
+
+    # Joins age out of the window
+    assert index.recent_joiners(3600, now=time.time() + 7200) == set()
+    assert index.joined_at(10) is None
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from deadline_scheduler import DeadlineScheduler
+
+
+def run_scheduler(schedule, wait=0.3):
+    """Schedule entries with schedule(scheduler), run it for wait seconds and return the keys fired in order"""
+    fired = []
+
+    async def callback(key):
+        fired.append(key)
+
+    async def run():
+        scheduler = DeadlineScheduler(callback)
+        scheduler.start()
+        await schedule(scheduler)
+        await asyncio.sleep(wait)
+        scheduler.stop()
+        return scheduler
+
+    scheduler = asyncio.run(run())
+    return fired, scheduler
+
+
+def test_fires_in_deadline_order():
+    async def schedule(scheduler):
+        now = time.time()
+        scheduler.schedule("late", now + 0.1)
+        scheduler.schedule("early", now + 0.02)
+        scheduler.schedule("overdue", now - 1)
+
+    fired, scheduler = run_scheduler(schedule)
+    assert fired == ["overdue", "early", "late"]
+    assert len(scheduler) == 0
+
+
+def test_cancel_stops_the_callback():
+    async def schedule(scheduler):
+        scheduler.schedule("kept", time.time() + 0.05)
+        scheduler.schedule("cancelled", time.time() + 0.05)
+        assert scheduler.cancel("cancelled")
+        assert not scheduler.cancel("cancelled")
+        assert "cancelled" not in scheduler
+
+    fired, _ = run_scheduler(schedule)
+    assert fired == ["kept"]
+
+
+def test_reschedule_replaces_the_earlier_deadline():
+    async def schedule(scheduler):
+        now = time.time()
+        scheduler.schedule("moved", now + 0.05)
+        scheduler.schedule("moved", now + 10)
+        scheduler.schedule("pulled in", now + 10)
+        scheduler.schedule("pulled in", now + 0.05)
+
+    fired, scheduler = run_scheduler(schedule)
+    # Each key fires at most once, at its latest deadline
+    assert fired == ["pulled in"]
+    assert scheduler.deadline("moved") is not None and len(scheduler) == 1
+
+
+def test_cancelled_entries_do_not_grow_the_heap():
+    scheduler = DeadlineScheduler(None)
+    for i in range(1000):
+        scheduler.schedule(i, time.time() + 60)
+        scheduler.cancel(i)
+    assert len(scheduler) == 0
+    assert len(scheduler._heap) <= 65
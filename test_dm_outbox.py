@@ -0,0 +1,110 @@
+import asyncio
+
+import discord
+
+from dm_outbox import PRIORITY_KICK, PRIORITY_WARNING, DMOutbox
+
+
+class StandInChannel:
+    def __init__(self, failures):
+        # Exceptions raised by the next sends, in order
+        self.failures = list(failures)
+        self.attempts = 0
+        self.sent = []
+
+    async def send(self, embed):
+        self.attempts += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        self.sent.append(embed.title)
+
+
+def make_outbox(path, channel, **kwargs):
+    async def open_dm(user_id):
+        return channel
+
+    async def run(action):
+        return await action()
+
+    outbox = DMOutbox(str(path), open_dm, run, workers=1, **kwargs)
+    outbox.load()
+    return outbox
+
+
+def test_unexpected_error_is_retried_with_backoff(tmp_path):
+    async def run():
+        channel = StandInChannel([ConnectionResetError("reset by peer")])
+        outbox = make_outbox(tmp_path / "outbox.db", channel, max_attempts=3, base_delay=0.01)
+        outbox.start()
+        sent = await outbox.deliver(1, discord.Embed(title="Warning"), PRIORITY_WARNING, "warning", timeout=5)
+        outbox.stop()
+        outbox.close()
+        return outbox, channel, sent
+
+    outbox, channel, sent = asyncio.run(run())
+    assert sent
+    assert channel.attempts == 2
+    assert channel.sent == ["Warning"]
+    assert outbox.state(1).status == "sent"
+    assert outbox.sent == 1 and outbox.failed == 0
+
+
+def test_gives_up_after_max_attempts_and_keeps_working(tmp_path):
+    async def run():
+        channel = StandInChannel([RuntimeError("executor paused")])
+        outbox = make_outbox(tmp_path / "outbox.db", channel, max_attempts=1)
+        outbox.start()
+        given_up = await outbox.deliver(1, discord.Embed(title="First"), timeout=5)
+        # The worker survived the failure
+        sent = await outbox.deliver(2, discord.Embed(title="Second"), timeout=5)
+        outbox.stop()
+        await outbox.flush()
+        outbox.close()
+        return outbox, channel, given_up, sent
+
+    outbox, channel, given_up, sent = asyncio.run(run())
+    assert not given_up and sent
+    assert channel.sent == ["Second"]
+    assert outbox.state(1).status == "failed" and outbox.state(1).error == "executor paused"
+    assert outbox.qsize() == 0 and outbox.failed == 1
+
+    # Neither DM is left in the database
+    outbox = make_outbox(tmp_path / "outbox.db", channel)
+    assert outbox.qsize() == 0
+    outbox.close()
+
+
+def test_dm_is_cancelled_when_delivery_times_out(tmp_path):
+    async def run():
+        # The first send fails, and the retry would come after the caller stopped waiting
+        channel = StandInChannel([ConnectionResetError("reset by peer")])
+        outbox = make_outbox(tmp_path / "outbox.db", channel, base_delay=0.2)
+        outbox.start()
+        sent = await outbox.deliver(1, discord.Embed(title="Kicked"), PRIORITY_KICK, "kick", timeout=0.05)
+        state = outbox.state(1)
+        await asyncio.sleep(0.4)
+        outbox.stop()
+        await outbox.flush()
+        outbox.close()
+        return outbox, channel, sent, state
+
+    outbox, channel, sent, state = asyncio.run(run())
+    assert not sent
+    assert state.status == "cancelled"
+    # Not retried after the timeout
+    assert channel.attempts == 1 and channel.sent == []
+    assert outbox.qsize() == 0
+
+    outbox = make_outbox(tmp_path / "outbox.db", channel)
+    assert outbox.qsize() == 0
+    outbox.close()
+
+
+def test_cancel_only_drops_pending_dms(tmp_path):
+    outbox = make_outbox(tmp_path / "outbox.db", StandInChannel([]))
+    item = outbox.put(1, discord.Embed(title="Notice"))
+
+    assert outbox.cancel(item.id)
+    assert not outbox.cancel(item.id)
+    assert outbox.qsize() == 0
+    outbox.close()
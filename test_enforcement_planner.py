@@ -0,0 +1,47 @@
+from enforcement_planner import plan_enforcement
+
+
+def violations_for(failing):
+    """find_violations stand-in: the candidates in failing violate the policy"""
+    return lambda candidates: {user_id: f"violation {user_id}" for user_id in candidates if user_id in failing}
+
+
+def test_splits_members_into_warn_kick_pending_and_clear():
+    now = 1000
+    plan = plan_enforcement(
+        target_ids=range(1, 9),
+        exempt_ids={8},
+        find_violations=violations_for({1, 2, 3, 8}),
+        # 2 is past its deadline, 3 is still in its grace period, 4 complied, 9 left the server
+        deadlines={2: now - 1, 3: now + 60, 4: now + 60, 9: now - 1},
+        now=now,
+    )
+
+    assert plan.total == 8
+    assert plan.exempt == {8}
+    assert plan.warn == {1: "violation 1"}
+    assert plan.kick == {2: "violation 2"}
+    assert plan.pending == {3}
+    assert plan.clear == {4}
+
+
+def test_exempt_members_are_not_evaluated():
+    seen = []
+
+    def find_violations(candidates):
+        seen.extend(candidates)
+        return {}
+
+    plan = plan_enforcement({1, 2, 3}, {2}, find_violations, {2: 0}, now=10)
+
+    assert sorted(seen) == [1, 3]
+    assert plan.warn == {} and plan.kick == {}
+    # An exempt member's warning is dropped too
+    assert plan.clear == {2}
+
+
+def test_deadline_equal_to_now_is_kicked():
+    plan = plan_enforcement([5], [], violations_for({5}), {5: 100}, now=100)
+
+    assert plan.kick == {5: "violation 5"}
+    assert "1 members: 0 to warn, 1 to kick" in plan.summary()
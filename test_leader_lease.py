@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+from leader_lease import LeaderLease, LeaseLost
+from warning_store import WarningStore
+
+TTL = 0.2
+
+
+def open_lease(path, holder):
+    lease = LeaderLease(str(path), holder, ttl=TTL)
+    lease.open()
+    return lease
+
+
+def test_one_leader_and_token_goes_up_on_takeover(tmp_path):
+    path = tmp_path / "warnings.db"
+    a = open_lease(path, "a")
+    b = open_lease(path, "b")
+
+    assert a.renew() and a.token == 1
+    assert not b.renew() and b.token is None
+    assert b.current[:2] == ("a", 1)
+    # Renewing keeps the same token
+    assert a.renew() and a.token == 1
+
+    # a stops renewing; once the lease has expired b takes over with a new token
+    time.sleep(TTL * 1.5)
+    assert not a.is_leader
+    assert b.renew() and b.token == 2
+    assert not a.renew() and a.token is None
+
+    # Released leases are taken at the next renewal, without waiting for the TTL
+    b.release()
+    assert not b.is_leader
+    assert a.renew() and a.token == 3
+    assert not b.renew()
+
+    a.close()
+    b.close()
+
+
+def test_stale_holder_write_is_fenced_and_rolled_back(tmp_path):
+    path = tmp_path / "warnings.db"
+    a = open_lease(path, "a")
+    b = open_lease(path, "b")
+    assert a.renew()
+
+    store = WarningStore(str(path), fence=a.check)
+    store.load()
+    store.add(1, 10, 100.0, 200.0)
+    asyncio.run(store.flush())
+
+    # a stalls past its lease and b takes over; a has not renewed, so it still holds its old token
+    time.sleep(TTL * 1.5)
+    assert b.renew()
+    assert a.token == 1
+
+    store.add(1, 11, 100.0, 200.0)
+    store.remove(1, 10)
+    with pytest.raises(LeaseLost):
+        asyncio.run(store.flush())
+    # The refused changes are kept, not lost, in case the lease comes back
+    assert set(store._dirty) == {(1, 10), (1, 11)}
+
+    # Nothing of the refused transaction reached the database
+    reader = WarningStore(str(path))
+    reader.load()
+    assert reader.contains(1, 10)
+    assert not reader.contains(1, 11)
+    reader.close()
+
+    # The new leader's writes go through
+    leader_store = WarningStore(str(path), fence=b.check)
+    leader_store.load()
+    leader_store.add(1, 12, 100.0, 200.0)
+    assert asyncio.run(leader_store.flush()) == 1
+    leader_store.close()
+
+    # Drop the refused changes so close() does not try to write them again
+    store._dirty = {}
+    store.close()
+    a.close()
+    b.close()
@@ -0,0 +1,55 @@
+import logging
+
+from member_snapshot import HEADER, MemberSnapshot, read_snapshot, write_snapshot
+
+GUILD_ID = 5
+
+
+def sample_snapshot():
+    # 70 roles, so a role set takes more than one 8-byte word
+    member_roles = {30: [1, 2], 10: [], 20: [2, 1069], 40: range(1000, 1070)}
+    return MemberSnapshot.from_roles(GUILD_ID, member_roles), member_roles
+
+
+def test_round_trip(tmp_path):
+    snapshot, member_roles = sample_snapshot()
+    path = tmp_path / "members.snap"
+    write_snapshot(path, snapshot)
+
+    loaded = read_snapshot(path, GUILD_ID)
+    assert loaded.taken_at == snapshot.taken_at
+    assert list(loaded.ids) == [10, 20, 30, 40]
+    assert dict(loaded.entries()) == {user_id: frozenset(role_ids) for user_id, role_ids in member_roles.items()}
+    # Written atomically: no temporary file is left behind
+    assert [p.name for p in tmp_path.iterdir()] == ["members.snap"]
+
+
+def test_missing_file_is_not_an_error(tmp_path):
+    assert read_snapshot(tmp_path / "missing.snap", GUILD_ID) is None
+
+
+def test_corrupted_snapshot_is_rejected(tmp_path, caplog):
+    snapshot, _ = sample_snapshot()
+    path = tmp_path / "members.snap"
+    write_snapshot(path, snapshot)
+
+    data = bytearray(path.read_bytes())
+    # Flip one bit in the member IDs, past the header
+    data[-20] ^= 1
+    path.write_bytes(bytes(data))
+
+    with caplog.at_level(logging.WARNING, logger="MemberCheckBot"):
+        assert read_snapshot(path, GUILD_ID) is None
+    assert "checksum mismatch" in caplog.text
+
+
+def test_truncated_or_foreign_snapshot_is_rejected(tmp_path):
+    snapshot, _ = sample_snapshot()
+    path = tmp_path / "members.snap"
+    write_snapshot(path, snapshot)
+
+    # A snapshot of another guild
+    assert read_snapshot(path, GUILD_ID + 1) is None
+
+    path.write_bytes(path.read_bytes()[:HEADER.size - 1])
+    assert read_snapshot(path, GUILD_ID) is None
@@ -0,0 +1,146 @@
+import datetime
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from policy import (
+    REASON_ACCOUNT_AGE, REASON_MISSING_ROLE, REASON_NOT_MEMBER, CompiledPolicy, Requirement, Rule, account_cutoff,
+)
+from reference_index import ReferenceIndex
+
+NOW = 1_700_000_000.0
+DAY = 86400
+GUILD_A = 100
+GUILD_B = 200
+EXEMPT_ROLE = 900
+
+
+def reference_index(guild_id, member_roles):
+    index = ReferenceIndex(guild_id)
+    index.seed(
+        SimpleNamespace(id=user_id, roles=[SimpleNamespace(id=role_id) for role_id in role_ids])
+        for user_id, role_ids in member_roles.items()
+    )
+    return index
+
+
+def sample_rules():
+    return [
+        # In A with role 1 or 2, or in B at all; staff are exempt
+        Rule("any", [Requirement(GUILD_A, (1, 2), ()), Requirement(GUILD_B, (), ())], exempt_roles=[EXEMPT_ROLE]),
+        # In A with role 3 and in B with role 4 or 5, from an account at least 30 days old
+        Rule("all", [Requirement(GUILD_A, (), (3,)), Requirement(GUILD_B, (4, 5), ())], match="all",
+             min_account_age=30 * DAY),
+        # No server requirement, only an account age
+        Rule("age", [], min_account_age=90 * DAY),
+    ]
+
+
+def masked_violations(policy, candidates, indexes, target_roles, joined_at=None):
+    """What evaluate() says for each candidate, one mask at a time"""
+    joined_at = joined_at or {}
+    violations = {}
+    for user_id in candidates:
+        target_mask = policy.target_mask(target_roles.get(user_id), user_id, joined_at.get(user_id), NOW)
+        mask = policy.reference_mask(user_id, indexes) | target_mask
+        violation = policy.evaluate(mask)
+        if violation is not None:
+            violations[user_id] = violation
+    return violations
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_evaluate_and_find_violations_agree(seed):
+    rng = random.Random(seed)
+    # IDs spread around both account age cutoffs
+    oldest = account_cutoff(120 * DAY, NOW)
+    newest = account_cutoff(0, NOW)
+    candidates = {rng.randrange(oldest, newest) for _ in range(600)}
+
+    def roles(pool):
+        return set(rng.sample(pool, rng.randint(0, len(pool))))
+
+    guild_a = {user_id: roles([1, 2, 3, 6]) for user_id in candidates if rng.random() < 0.6}
+    guild_b = {user_id: roles([4, 5, 6]) for user_id in candidates if rng.random() < 0.5}
+    target_roles = {user_id: {EXEMPT_ROLE} for user_id in candidates if rng.random() < 0.1}
+    indexes = {GUILD_A: reference_index(GUILD_A, guild_a), GUILD_B: reference_index(GUILD_B, guild_b)}
+
+    policy = CompiledPolicy(sample_rules())
+
+    def target_holders(role_ids):
+        return {user_id for user_id, held in target_roles.items() if not held.isdisjoint(role_ids)}
+
+    expected = masked_violations(policy, candidates, indexes, target_roles)
+    assert policy.find_violations(candidates, indexes, target_holders, NOW) == expected
+    assert policy.violations_of(candidates, indexes, lambda user_id: target_roles.get(user_id), NOW) == expected
+    # Every rule and reason shows up, so the comparison covered them all
+    assert {(violation.rule.name, violation.reason) for violation in expected.values()} >= {
+        ("any", REASON_NOT_MEMBER), ("all", REASON_MISSING_ROLE), ("all", REASON_NOT_MEMBER),
+        ("all", REASON_ACCOUNT_AGE), ("age", REASON_ACCOUNT_AGE),
+    }
+
+
+def test_first_failing_rule_and_reason():
+    old = account_cutoff(365 * DAY, NOW)
+    young = account_cutoff(10 * DAY, NOW)
+    indexes = {
+        GUILD_A: reference_index(GUILD_A, {old: {1, 3}, old + 1: {6}, old + 2: {3}, young: {1, 3}}),
+        GUILD_B: reference_index(GUILD_B, {old: {4}, old + 2: set(), young: {4}}),
+    }
+    target_roles = {old + 3: {EXEMPT_ROLE}}
+    policy = CompiledPolicy(sample_rules())
+
+    violations = policy.find_violations({old, old + 1, old + 2, old + 3, young}, indexes, lambda role_ids: {old + 3}, NOW)
+
+    # old complies with everything
+    assert old not in violations
+    # In A without role 1 or 2 and not in B
+    assert violations[old + 1].rule.name == "any" and violations[old + 1].reason == REASON_MISSING_ROLE
+    # In both servers, but without role 4 or 5 in B
+    assert violations[old + 2].rule.name == "all" and violations[old + 2].reason == REASON_MISSING_ROLE
+    # Exempt from "any", then in neither server for "all"
+    assert violations[old + 3].rule.name == "all" and violations[old + 3].reason == REASON_NOT_MEMBER
+    # Meets the server requirements, but the account is too new
+    assert violations[young].rule.name == "all" and violations[young].reason == REASON_ACCOUNT_AGE
+    assert violations == masked_violations(policy, violations, indexes, target_roles)
+
+
+def test_rule_rejects_unknown_match():
+    with pytest.raises(ValueError):
+        Rule("bad", [], match="some")
+
+
+def test_join_grace_of_one_rule_still_checks_the_later_ones():
+    rules = [
+        # Must be in A, once a member has been in the target server for a day
+        Rule("joined", [Requirement(GUILD_A, (), ())], min_join_age=DAY),
+        # No server requirement, only an account age
+        Rule("age", [], min_account_age=90 * DAY),
+    ]
+    policy = CompiledPolicy(rules)
+    old = account_cutoff(365 * DAY, NOW)
+    young = account_cutoff(10 * DAY, NOW)
+    indexes = {GUILD_A: reference_index(GUILD_A, {})}
+
+    def joined(seconds_ago):
+        return datetime.datetime.fromtimestamp(NOW - seconds_ago, datetime.timezone.utc)
+
+    # young joined an hour ago: in grace for "joined", but its account is too new for "age"
+    joined_at = {young: joined(3600), old: joined(3600), old + 1: joined(10 * DAY)}
+    candidates = {young, old, old + 1, old + 2}
+
+    def recent_joiners(age):
+        return {user_id for user_id, at in joined_at.items() if NOW - at.timestamp() < age}
+
+    violations = policy.find_violations(candidates, indexes, lambda role_ids: set(), NOW, recent_joiners)
+
+    assert violations[young].rule.name == "age" and violations[young].reason == REASON_ACCOUNT_AGE
+    # In grace and nothing else fails
+    assert old not in violations
+    # Joined long ago, or at an unknown time
+    assert violations[old + 1].rule.name == "joined" and violations[old + 1].reason == REASON_NOT_MEMBER
+    assert violations[old + 2].rule.name == "joined"
+
+    assert violations == masked_violations(policy, candidates, indexes, {}, joined_at)
+    assert violations == policy.violations_of(candidates, indexes, lambda user_id: (), NOW, joined_at.get)
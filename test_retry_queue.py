@@ -0,0 +1,49 @@
+import asyncio
+
+from retry_queue import RetryQueue
+
+
+def test_gives_up_after_max_attempts():
+    queue = RetryQueue(lambda key: None, base_delay=60.0, max_attempts=3)
+
+    assert [queue.retry("member") for _ in range(3)] == [True, True, True]
+    assert queue.attempts("member") == 3 and len(queue) == 1
+
+    assert not queue.retry("member")
+    assert queue.gave_up == 1 and queue.retried == 3
+    # Forgotten, so a later failure starts over
+    assert queue.attempts("member") == 0 and len(queue) == 0
+    assert queue.retry("member")
+
+
+def test_done_cancels_the_pending_attempt():
+    queue = RetryQueue(lambda key: None, base_delay=60.0)
+    queue.retry("member")
+    queue.done("member")
+
+    assert len(queue) == 0
+    assert "member" not in queue._scheduler
+
+
+def test_retries_until_the_callback_succeeds():
+    async def run():
+        calls = []
+
+        async def callback(key):
+            calls.append(key)
+            # Fails twice, then succeeds
+            if len(calls) < 3:
+                queue.retry(key)
+            else:
+                queue.done(key)
+
+        queue = RetryQueue(callback, base_delay=0.01, max_delay=0.02)
+        queue.start()
+        queue.retry("member")
+        await asyncio.sleep(0.3)
+        queue.stop()
+        return queue, calls
+
+    queue, calls = asyncio.run(run())
+    assert calls == ["member"] * 3
+    assert len(queue) == 0 and queue.gave_up == 0
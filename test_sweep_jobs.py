@@ -0,0 +1,103 @@
+import asyncio
+
+from sweep_jobs import SweepJobs
+
+
+def test_second_sweep_of_the_same_server_is_refused():
+    async def run():
+        jobs = SweepJobs()
+        release = asyncio.Event()
+        calls = []
+
+        async def sweep(job):
+            calls.append(job.guild_id)
+            await release.wait()
+
+        first, started = jobs.start(1, "Server 1", sweep)
+        assert started
+        again, started = jobs.start(1, "Server 1", sweep)
+        assert not started and again is first
+        # Another server is swept alongside
+        other, started = jobs.start(2, "Server 2", sweep)
+        assert started and other is not first
+        assert await jobs.run(1, "Server 1", sweep) is None
+
+        await asyncio.sleep(0)
+        assert first.state == "running"
+        release.set()
+        await asyncio.wait([first.task, other.task])
+
+        assert calls == [1, 2]
+        assert first.state == "done" and first.finished
+        assert jobs.active == {}
+        assert list(jobs.history) == [other, first]
+
+    asyncio.run(run())
+
+
+def test_job_cancelled_before_it_ran_is_cleaned_up():
+    async def run():
+        jobs = SweepJobs()
+        calls = []
+
+        async def sweep(job):
+            calls.append(job.id)
+
+        job, _ = jobs.start(1, "Server 1", sweep)
+        # Cancelled before the task got its first step
+        jobs.cancel(job)
+        await asyncio.wait([job.task])
+
+        assert calls == []
+        assert job.state == "cancelled" and job.finished
+        assert jobs.active == {} and list(jobs.history) == [job]
+        assert jobs.find(job.id) is None
+
+        # The server is free for the next sweep
+        job, started = jobs.start(1, "Server 1", sweep)
+        assert started
+        await asyncio.wait([job.task])
+        assert calls == [job.id]
+
+    asyncio.run(run())
+
+
+def test_job_cancelled_while_waiting_for_the_server_lock():
+    async def run():
+        jobs = SweepJobs()
+
+        async def sweep(job):
+            pass
+
+        async with jobs.lock(1):
+            job, _ = jobs.start(1, "Server 1", sweep)
+            await asyncio.sleep(0)
+            assert job.state == "waiting"
+            jobs.cancel(job)
+            await asyncio.wait([job.task])
+
+        assert job.state == "cancelled"
+        assert not jobs.lock(1).locked()
+
+    asyncio.run(run())
+
+
+def test_failed_sweep_and_stage_times():
+    async def run():
+        stages = []
+        jobs = SweepJobs(on_stage=lambda stage, seconds: stages.append(stage))
+
+        async def sweep(job):
+            job.set_stage("fetching members")
+            job.set_stage("checking", total=10)
+            job.advance(4)
+            raise RuntimeError("boom")
+
+        job = await jobs.run(1, "Server 1", sweep)
+
+        assert job.state == "failed" and str(job.error) == "boom"
+        assert stages == ["queued", "fetching members", "checking"]
+        assert set(job.stage_seconds) == {"queued", "fetching members", "checking"}
+        assert "failed after" in job.describe()
+
+    asyncio.run(run())
@@ -0,0 +1,80 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from warning_store import WarningStore
+
+
+def open_store(path):
+    store = WarningStore(str(path))
+    store.load()
+    return store
+
+
+def test_flush_persists_adds_removes_and_meta(tmp_path):
+    async def run():
+        store = open_store(tmp_path / "warnings.db")
+        store.add(1, 10, 100.0, 200.0, "not a member")
+        store.add(1, 11, 100.0, 300.0)
+        store.add(2, 10, 100.0, 400.0)
+        store.set_meta("cursor", 42)
+        assert await store.flush() == 3
+
+        store.remove(1, 11)
+        assert await store.flush() == 1
+        # Nothing left to write
+        assert await store.flush() == 0
+        store.close()
+
+    asyncio.run(run())
+
+    store = open_store(tmp_path / "warnings.db")
+    assert store.count() == 2
+    assert store.get(1, 10).reason == "not a member"
+    assert store.get(1, 11) is None
+    assert store.pending(2) == {10: store.get(2, 10)}
+    assert store.get_meta("cursor") == "42"
+    store.close()
+
+
+def test_failed_flush_keeps_changes_for_the_next_one(tmp_path):
+    async def run():
+        store = open_store(tmp_path / "warnings.db")
+        store.add(1, 10, 100.0, 200.0)
+        store.set_meta("cursor", 1)
+
+        write = store._write
+
+        def failing_write(dirty, dirty_meta=None):
+            # A change made while the failed write is in flight must survive the retry
+            store.add(1, 10, 100.0, 250.0)
+            raise sqlite3.OperationalError("database is locked")
+
+        store._write = failing_write
+        with pytest.raises(sqlite3.OperationalError):
+            await store.flush()
+        assert set(store._dirty) == {(1, 10)}
+        assert store._dirty_meta == {"cursor": "1"}
+
+        store._write = write
+        assert await store.flush() == 1
+        store.close()
+
+    asyncio.run(run())
+
+    store = open_store(tmp_path / "warnings.db")
+    # The newer change wins over the one that failed to write
+    assert store.get(1, 10).deadline == 250.0
+    assert store.get_meta("cursor") == "1"
+    store.close()
+
+
+def test_close_writes_unflushed_changes(tmp_path):
+    store = open_store(tmp_path / "warnings.db")
+    store.add(3, 30, 1.0, 2.0)
+    store.close()
+
+    store = open_store(tmp_path / "warnings.db")
+    assert store.contains(3, 30)
+    store.close()
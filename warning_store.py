@@ -0,0 +1,175 @@
+import asyncio
+import collections
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger("MemberCheckBot")
+
+# A pending warning: when it was issued, when the grace period ends (both unix timestamps) and why
+WarningRecord = collections.namedtuple("WarningRecord", ["warned_at", "deadline", "reason"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS warnings (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    warned_at REAL NOT NULL,
+    deadline REAL NOT NULL,
+    reason TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS warnings_user ON warnings (user_id);
+CREATE INDEX IF NOT EXISTS warnings_deadline ON warnings (deadline);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class WarningStore:
+    """Pending warnings (and small bits of bot state) kept in memory and persisted to SQLite (WAL) in batched transactions"""
+
+    def __init__(self, path, fence=None):
+        self.path = path
+        # fence(conn) runs inside every write transaction and raises to refuse it (see LeaderLease.check)
+        self.fence = fence
+        self.loaded = False
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        self._flush_lock = None
+        # guild ID -> {user ID -> WarningRecord}
+        self._warnings = {}
+        # (guild ID, user ID) -> WarningRecord to write, or None to delete
+        self._dirty = {}
+        # Key -> value of the meta table, and the keys changed since the last flush
+        self._meta = {}
+        self._dirty_meta = {}
+
+    def load(self):
+        """Open the database (once) and reload every pending warning into memory, dropping unwritten changes"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        with self._conn_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            rows = self._conn.execute(
+                "SELECT guild_id, user_id, warned_at, deadline, reason FROM warnings"
+            ).fetchall()
+            self._meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+
+        self._warnings = {}
+        self._dirty = {}
+        self._dirty_meta = {}
+        for guild_id, user_id, warned_at, deadline, reason in rows:
+            self._warnings.setdefault(guild_id, {})[user_id] = WarningRecord(warned_at, deadline, reason)
+        self.loaded = True
+        logger.info(f"Loaded {len(rows)} pending warnings from {self.path}")
+
+    def add(self, guild_id, user_id, warned_at, deadline, reason=""):
+        """Record a warning; it is written to disk on the next flush"""
+        record = WarningRecord(warned_at, deadline, reason)
+        self._warnings.setdefault(guild_id, {})[user_id] = record
+        self._dirty[(guild_id, user_id)] = record
+        return record
+
+    def remove(self, guild_id, user_id):
+        """Drop a warning if present and return it (or None)"""
+        record = self._warnings.get(guild_id, {}).pop(user_id, None)
+        if record is not None:
+            self._dirty[(guild_id, user_id)] = None
+        return record
+
+    def get(self, guild_id, user_id):
+        """Return the pending warning for a user, or None"""
+        return self._warnings.get(guild_id, {}).get(user_id)
+
+    def contains(self, guild_id, user_id):
+        """Return True if the user has a pending warning in the guild"""
+        return user_id in self._warnings.get(guild_id, {})
+
+    def pending(self, guild_id):
+        """Return the live {user ID -> WarningRecord} mapping for a guild (do not mutate)"""
+        return self._warnings.get(guild_id, {})
+
+    def count(self, guild_id=None):
+        """Return the number of pending warnings, for one guild or all of them"""
+        if guild_id is not None:
+            return len(self._warnings.get(guild_id, {}))
+        return sum(len(warnings) for warnings in self._warnings.values())
+
+    def get_meta(self, key, default=None):
+        """Return a stored state value (e.g. a sweep cursor), or default"""
+        return self._meta.get(key, default)
+
+    def set_meta(self, key, value):
+        """Store a state value; it is written to disk with the next flush"""
+        value = str(value)
+        if self._meta.get(key) != value:
+            self._meta[key] = value
+            self._dirty_meta[key] = value
+
+    async def flush(self):
+        """Write all queued changes in a single transaction off the event loop"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            if not (self._dirty or self._dirty_meta) or self._conn is None:
+                return 0
+
+            dirty, self._dirty = self._dirty, {}
+            dirty_meta, self._dirty_meta = self._dirty_meta, {}
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self._write, dirty, dirty_meta)
+            except Exception:
+                # Put the changes back so the next flush retries them, keeping any newer ones
+                dirty.update(self._dirty)
+                self._dirty = dirty
+                dirty_meta.update(self._dirty_meta)
+                self._dirty_meta = dirty_meta
+                raise
+            return len(dirty)
+
+    def close(self):
+        """Flush synchronously and close the database"""
+        if self._conn is None:
+            return
+        if self._dirty or self._dirty_meta:
+            dirty, self._dirty = self._dirty, {}
+            dirty_meta, self._dirty_meta = self._dirty_meta, {}
+            self._write(dirty, dirty_meta)
+        with self._conn_lock:
+            self._conn.close()
+        self._conn = None
+
+    def _write(self, dirty, dirty_meta=None):
+        upserts = []
+        deletes = []
+        for (guild_id, user_id), record in dirty.items():
+            if record is None:
+                deletes.append((guild_id, user_id))
+            else:
+                upserts.append((guild_id, user_id, record.warned_at, record.deadline, record.reason))
+
+        with self._conn_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.fence is not None:
+                    self.fence(self._conn)
+                if upserts:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO warnings (guild_id, user_id, warned_at, deadline, reason) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        upserts
+                    )
+                if deletes:
+                    self._conn.executemany("DELETE FROM warnings WHERE guild_id = ? AND user_id = ?", deletes)
+                if dirty_meta:
+                    self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", dirty_meta.items())
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise